@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+
+"""Measure the command paths of the program on synthetic registers of
+realistic sizes (see synthetic.py): 'new_student', 'append_to_course',
+'give_grade' and 'print_register' run through the argument parser as the
+command line does, and StudentRegister.read_rows_in_register() called
+directly. Every path of every size runs in its own process on a fresh copy
+of the registers, which reports the throughput in operations per second,
+the median (p50) and 99th percentile (p99) latency of an operation and its
+peak resident set size, so the results of different versions can be
+compared.
+
+By default the register cache is dropped before every operation (--cache
+cold), so each operation reads the registers like a single command run from
+the shell; --cache warm keeps the registers cached between operations like
+--batch mode and the register server do."""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from class_register import (Register, StudentRegister,  # noqa: E402
+                            create_parser, run_command)
+from synthetic import (describe_student, generate_registers,  # noqa: E402
+                       get_classroom_name, get_course_name,
+                       get_student_name)
+
+PATHS = ['new_student', 'append_to_course', 'give_grade', 'print_register',
+         'read_rows_in_register']
+
+
+def select_students(students_number, ops, accept):
+    """Return up to ops distinct student numbers accepted by a function,
+    spread over the whole register."""
+    step = max(1, students_number // max(1, ops))
+    selected = []
+    for start in range(step):
+        for student in range(start, students_number, step):
+            if accept(student):
+                selected.append(student)
+                if len(selected) == ops:
+                    return selected
+    return selected
+
+
+def get_operations(path, students_number, ops, courses_number,
+                   classroom_size):
+    """Return the command line arguments of the operations of a path, or
+    None for each operation of read_rows_in_register."""
+    def describe(student):
+        return describe_student(student, courses_number, classroom_size)
+
+    classrooms_number = max(1, -(-students_number // classroom_size))
+    operations = []
+    if path == 'new_student':
+        for i in range(ops):
+            operations.append(['new_student', f'New{i}', f'Student{i}',
+                               '2000-01-01',
+                               get_classroom_name(i % classrooms_number),
+                               get_course_name(i % courses_number)])
+    elif path == 'append_to_course':
+        # Active students attending fewer than three courses
+        for student in select_students(
+                students_number, ops,
+                lambda s: describe(s)[0] == 'Active' and len(describe(s)[2])
+                < 3):
+            attended = [course for course, _ in describe(student)[2]]
+            course = next(course for course in range(courses_number)
+                          if course not in attended)
+            operations.append(['append_to_course',
+                               *get_student_name(student),
+                               get_course_name(course)])
+    elif path == 'give_grade':
+        for student in select_students(
+                students_number, ops, lambda s: describe(s)[0] == 'Active'):
+            course = describe(student)[2][0][0]
+            operations.append(['give_grade', *get_student_name(student),
+                               get_course_name(course), '4'])
+    elif path == 'print_register':
+        for i in range(ops):
+            operations.append(['print_register', 'students', '--classroom',
+                               get_classroom_name(i % classrooms_number),
+                               '--format', 'csv'])
+    else:
+        operations = [None] * ops
+    return operations
+
+
+def get_peak_rss():
+    """Return the peak resident set size of this process in bytes, or None
+    if it cannot be measured on this platform."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_path(args):
+    """Run the operations of a single path in this process, in the
+    directory of a copy of the registers, and print the results as JSON."""
+    parser = create_parser()
+    options = ['--local', '--backend', args.backend]
+    if args.snapshot:
+        options.append('--snapshot')
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        if args.backend == 'sqlite':
+            run_command(parser.parse_args(options + ['import_csv']))
+        latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for argv in get_operations(args.path, args.students, args.ops,
+                                   args.courses, args.classroom_size):
+            if args.cache == 'cold':
+                Register.cache.invalidate()
+            operation_start = time.perf_counter()
+            try:
+                if argv is None:
+                    StudentRegister(args.backend,
+                                    args.snapshot).read_rows_in_register()
+                else:
+                    run_command(parser.parse_args(options + argv))
+            except SystemExit:
+                # Commands rejected by their checks stop with exit(), which
+                # gives no status, while commands which are run return
+                errors += 1
+            latencies.append(time.perf_counter() - operation_start)
+            if time.perf_counter() - start > args.time_limit:
+                break
+    elapsed = sum(latencies)
+    latencies.sort()
+    print(json.dumps({
+                      'ops': len(latencies),
+                      'errors': errors,
+                      'ops_per_second': len(latencies) / elapsed
+                      if elapsed else None,
+                      'p50_ms': statistics.median(latencies) * 1000
+                      if latencies else None,
+                      'p99_ms': latencies[min(len(latencies) - 1,
+                                              int(len(latencies) * 0.99))]
+                      * 1000 if latencies else None,
+                      'peak_rss': get_peak_rss()
+                      }))
+
+
+def measure_path(args, data_directory, students_number, path):
+    """Run a path in a child process on a fresh copy of the registers and
+    return its results."""
+    directory = tempfile.mkdtemp()
+    try:
+        for file_name in ['classrooms.csv', 'courses.csv', 'students.csv']:
+            shutil.copy(os.path.join(data_directory, file_name), directory)
+        command = [sys.executable, os.path.abspath(__file__), '--path', path,
+                   '--students', str(students_number), '--ops', str(args.ops),
+                   '--courses', str(args.courses), '--classroom-size',
+                   str(args.classroom_size), '--backend', args.backend,
+                   '--cache', args.cache, '--time-limit',
+                   str(args.time_limit)]
+        if args.snapshot:
+            command.append('--snapshot')
+        result = subprocess.run(command, cwd=directory, capture_output=True,
+                                text=True)
+        if result.returncode:
+            raise RuntimeError(f'{path} failed:\n{result.stderr}')
+        return json.loads(result.stdout.splitlines()[-1])
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    """The main function based on the argument parser."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', default='1000,100000',
+                        help='Comma-separated numbers of students of the '
+                             'measured registers, for example '
+                             '1000,100000,1000000')
+    parser.add_argument('--paths', default=','.join(PATHS),
+                        help='Comma-separated paths to measure')
+    parser.add_argument('--ops', type=int, default=20,
+                        help='The number of operations of every path')
+    parser.add_argument('--time-limit', type=float, default=60,
+                        help='Stop a path after the operations run so far '
+                             'took this many seconds')
+    parser.add_argument('--courses', type=int, default=10,
+                        help='Number of courses in the registers')
+    parser.add_argument('--classroom-size', type=int, default=100,
+                        help='Number of students in every classroom')
+    parser.add_argument('--backend',
+                        choices=['csv', 'journal', 'inplace', 'sqlite'],
+                        default='csv', help='Storage of the registers')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Look up entries in binary snapshots')
+    parser.add_argument('--cache', choices=['cold', 'warm'], default='cold',
+                        help='Drop the register cache before every '
+                             'operation (cold) or keep it (warm)')
+    parser.add_argument('--data-dir',
+                        help='Keep the generated registers in this directory '
+                             'and reuse them in later runs')
+    parser.add_argument('--output',
+                        help='Write the results into a JSON file')
+    parser.add_argument('--path', choices=PATHS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.path:
+        args.students = int(args.students)
+        run_path(args)
+        return
+
+    data_root = args.data_dir or tempfile.mkdtemp()
+    results = []
+    print(f'backend {args.backend}, cache {args.cache}'
+          f'{", snapshot" if args.snapshot else ""}')
+    print(f'{"students":>9} {"path":22} {"ops":>5} {"ops/s":>9} '
+          f'{"p50 ms":>9} {"p99 ms":>9} {"peak RSS MiB":>13}')
+    try:
+        for students_number in map(int, args.students.split(',')):
+            data_directory = os.path.join(
+                data_root, f'students{students_number}-{args.courses}'
+                           f'-{args.classroom_size}')
+            if not os.path.exists(os.path.join(data_directory,
+                                               'students.csv')):
+                os.makedirs(data_directory, exist_ok=True)
+                generate_registers(data_directory, students_number,
+                                   args.courses, args.classroom_size)
+            for path in args.paths.split(','):
+                result = measure_path(args, data_directory, students_number,
+                                      path)
+                results.append({'students': students_number, 'path': path,
+                                'backend': args.backend, 'cache': args.cache,
+                                'snapshot': args.snapshot, **result})
+                rss = f'{result["peak_rss"] / 2 ** 20:13.1f}' \
+                    if result['peak_rss'] is not None else f'{"-":>13}'
+                errors = f' ({result["errors"]} rejected)' \
+                    if result['errors'] else ''
+                print(f'{students_number:9} {path:22} {result["ops"]:5} '
+                      f'{result["ops_per_second"]:9.2f} '
+                      f'{result["p50_ms"]:9.2f} {result["p99_ms"]:9.2f} '
+                      f'{rss}{errors}')
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_root)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
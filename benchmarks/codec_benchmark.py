@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+"""Measure the parse throughput of the Student Register rows in rows/second,
+comparing the legacy repr() format with the current JSON encoding."""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from class_register import StudentRegister, decode_legacy_list  # noqa: E402
+
+
+def generate_courses(rows_number):
+    """Generate a list of synthetic 'Courses' columns."""
+    courses_names = ['Computer science', 'Physics', 'Mathematics', 'Spanish',
+                     'English']
+    courses = []
+    for i in range(rows_number):
+        courses.append([{courses_names[(i + j) % 5]:
+                         [str(2 + (i + j + k) % 4) for k in range(j + 3)]}
+                        for j in range(3)])
+    return courses
+
+
+def generate_rows(courses, encoding):
+    """Generate raw Student Register rows with 'Courses' written in the
+    given encoding: 'legacy' or 'json'."""
+    register = StudentRegister()
+    rows = []
+    for i, courses_item in enumerate(courses):
+        row = {
+               'First name': f'Name{i}',
+               'Last name': f'Surname{i}',
+               'Date of birth': '2000-01-01',
+               'Classroom': '2022-2025',
+               'Courses': courses_item,
+               'Status': 'Active'
+               }
+        row = register.serialize_row(row)
+        if encoding == 'legacy':
+            row['Courses'] = str(courses_item)
+        rows.append(row)
+    return rows
+
+
+def measure(rows, repeat):
+    """Return the best parse throughput of the rows in rows/second."""
+    register = StudentRegister()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for row in rows:
+            # Rows are decoded lazily, so access the decoded column
+            register.format_row(row)['Courses']
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(rows) / best
+
+
+def main():
+    """The main function based on the argument parser."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='Number of synthetic rows to parse')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of measurements, the best one is kept')
+    args = parser.parse_args()
+
+    courses = generate_courses(args.rows)
+    legacy_rows = generate_rows(courses, 'legacy')
+    json_rows = generate_rows(courses, 'json')
+    # Both encodings must be decoded into the same rows
+    assert decode_legacy_list(legacy_rows[0]['Courses']) == courses[0]
+
+    legacy = measure(legacy_rows, args.repeat)
+    current = measure(json_rows, args.repeat)
+    print(f'legacy repr format: {legacy:12,.0f} rows/s')
+    print(f'JSON encoding:      {current:12,.0f} rows/s')
+    print(f'speedup:            {current / legacy:12.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+"""Measure the memory taken by the Student Register rows held in memory,
+comparing plain dictionaries with decoded lists (the former row format)
+with the slotted row type, holding the 'Courses' column either encoded, as
+read from the register file, or packed, as assigned by changes of the
+register."""
+
+import argparse
+import csv
+import io
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from class_register import StudentRegister, decode_list  # noqa: E402
+
+
+def generate_register(rows_number):
+    """Generate the content of a Student Register file."""
+    register = StudentRegister()
+    courses_names = ['Computer science', 'Physics', 'Mathematics', 'Spanish',
+                     'English']
+    text = io.StringIO()
+    writer = csv.DictWriter(text, delimiter=';',
+                            fieldnames=register.fieldnames)
+    writer.writeheader()
+    for i in range(rows_number):
+        row = {
+               'First name': f'Name{i}',
+               'Last name': f'Surname{i}',
+               'Date of birth': '2000-01-01',
+               'Classroom': '2022-2025',
+               'Courses': [{courses_names[(i + j) % 5]:
+                            [str(2 + (i + j + k) % 4) for k in range(j + 3)]}
+                           for j in range(3)],
+               'Status': 'Active'
+               }
+        writer.writerow(register.serialize_row(row))
+    return text.getvalue()
+
+
+def read_rows(text, format_row):
+    """Read the rows of a register file and format them with a function."""
+    return [format_row(row)
+            for row in csv.DictReader(io.StringIO(text), delimiter=';')]
+
+
+def format_dict_row(row):
+    """Convert a raw row into a plain dictionary with decoded lists."""
+    return {
+            'First name': row.get('First name'),
+            'Last name': row.get('Last name'),
+            'Date of birth': row.get('Date of birth'),
+            'Classroom': row.get('Classroom'),
+            'Courses': decode_list(row.get('Courses')),
+            'Status': row.get('Status')
+            }
+
+
+def measure(build):
+    """Return the memory in bytes taken by the rows built by a function."""
+    tracemalloc.start()
+    rows = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del rows
+    return size
+
+
+def main():
+    """The main function based on the argument parser."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000,
+                        help='Number of synthetic rows to keep in memory')
+    args = parser.parse_args()
+
+    text = generate_register(args.rows)
+    register = StudentRegister()
+
+    def build_records():
+        return read_rows(text, register.format_row)
+
+    def build_packed_records():
+        return read_rows(text, lambda row: register.row_type.from_row(
+            format_dict_row(row)))
+
+    results = [
+               ('dict rows, decoded lists',
+                measure(lambda: read_rows(text, format_dict_row))),
+               ('slotted rows, encoded', measure(build_records)),
+               ('slotted rows, packed', measure(build_packed_records))
+               ]
+    baseline = results[0][1]
+    for name, size in results:
+        print(f'{name:26} {size / 2 ** 20:9.1f} MiB '
+              f'{size / args.rows:7.0f} B/row {baseline / size:6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+"""Measure the parallel loader of the .csv files (see
+CsvStorage.load_rows_parallel) on a synthetic student register (see
+synthetic.py): the rows per second of loading the register in this process
+and in pools of a growing number of worker processes. Every run loads the
+register in its own process. The loader run in this process keeps the
+courses of the students encoded until they are accessed, while the worker
+processes decode them, so the time of accessing the courses of all
+students after the load is reported as well."""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from class_register import StudentRegister  # noqa: E402
+from synthetic import generate_registers  # noqa: E402
+
+
+def run_load(workers):
+    """Load the student register in the current directory with a number of
+    worker processes (None to load it in this process), access the courses
+    of all students and print the results as JSON."""
+    register = StudentRegister(workers=workers)
+    start = time.perf_counter()
+    rows = register.storage.load_rows()
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for row in rows:
+        row.get('Courses')
+    decode_time = time.perf_counter() - start
+    print(json.dumps({'rows': len(rows), 'load': load_time,
+                      'decode': decode_time}))
+
+
+def measure_load(directory, workers):
+    """Load the student register in a directory in a child process and
+    return its results."""
+    command = [sys.executable, os.path.abspath(__file__), '--run',
+               'serial' if workers is None else str(workers)]
+    result = subprocess.run(command, cwd=directory, capture_output=True,
+                            text=True)
+    if result.returncode:
+        raise RuntimeError(f'Loading with {workers} workers failed:\n'
+                           f'{result.stderr}')
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    """The main function based on the argument parser."""
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=1000000,
+                        help='Number of students in the register')
+    parser.add_argument('--workers',
+                        default=','.join(str(1 << power) for power in
+                                         range(cores.bit_length())),
+                        help='Comma-separated numbers of worker processes, '
+                             'by default the powers of two up to the number '
+                             f'of cores ({cores})')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of loads with every number of workers, '
+                             'the fastest one is reported')
+    parser.add_argument('--data-dir',
+                        help='Keep the generated registers in this directory '
+                             'and reuse them in later runs')
+    parser.add_argument('--output',
+                        help='Write the results into a JSON file')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_load(None if args.run == 'serial' else int(args.run))
+        return
+
+    data_root = args.data_dir or tempfile.mkdtemp()
+    directory = os.path.join(data_root, f'students{args.students}-10-100')
+    results = []
+    try:
+        if not os.path.exists(os.path.join(directory, 'students.csv')):
+            os.makedirs(directory, exist_ok=True)
+            generate_registers(directory, args.students)
+        print(f'{args.students} students, '
+              f'{os.path.getsize(os.path.join(directory, "students.csv")):,} '
+              f'bytes, {cores} cores')
+        print(f'{"workers":>8} {"load s":>8} {"rows/s":>11} {"speedup":>8} '
+              f'{"decode s":>9} {"total s":>8}')
+        serial = None
+        for workers in [None] + [int(number) for number
+                                 in args.workers.split(',')]:
+            result = min((measure_load(directory, workers)
+                          for _ in range(args.repeat)),
+                         key=lambda result: result['load'])
+            if serial is None:
+                serial = result['load']
+            results.append({'students': args.students, 'cores': cores,
+                            'workers': workers, **result})
+            print(f'{"serial" if workers is None else workers:>8} '
+                  f'{result["load"]:8.2f} '
+                  f'{result["rows"] / result["load"]:11,.0f} '
+                  f'{serial / result["load"]:8.2f} '
+                  f'{result["decode"]:9.2f} '
+                  f'{result["load"] + result["decode"]:8.2f}')
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_root)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
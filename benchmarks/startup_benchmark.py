@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+
+"""Measure the startup of the command line program: the import time of the
+module and of its heaviest dependencies reported by 'python -X importtime',
+the wall time of single commands run as a script and as a module (which is
+loaded from cached bytecode) and the wall time of many commands run as
+separate processes or together in one process with --batch."""
+
+import argparse
+import os
+import py_compile
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import (describe_student, generate_registers,  # noqa: E402
+                       get_course_name, get_student_name)
+
+
+def measure_imports(repeat, top):
+    """Return the best import time of the module in milliseconds and the
+    modules with the longest own import time in the best run."""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                 'import class_register'],
+                                cwd=PACKAGE, capture_output=True, text=True)
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            modules.append((int(own), int(cumulative), name.strip()))
+        total = next(cumulative for _, cumulative, name in modules
+                     if name == 'class_register')
+        if best is None or total < best[0]:
+            best = total, sorted(modules, reverse=True)[:top]
+    return best[0] / 1000, best[1]
+
+
+def measure_command(prefix, argv, directory, repeat):
+    """Return the median wall time of a command in milliseconds."""
+    env = dict(os.environ, PYTHONPATH=PACKAGE)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(prefix + argv, cwd=directory, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def measure_batch(prefix, commands, directory, batch):
+    """Return the wall time of running commands in milliseconds, each in its
+    own process or all of them in one process with --batch."""
+    env = dict(os.environ, PYTHONPATH=PACKAGE)
+    start = time.perf_counter()
+    if batch:
+        subprocess.run(prefix + ['--batch'], cwd=directory, env=env,
+                       input='\n'.join(commands), text=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        for command in commands:
+            subprocess.run(prefix + shlex.split(command), cwd=directory,
+                           env=env, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    """The main function based on the argument parser."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000,
+                        help='Number of synthetic students in the registers')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Number of runs of every measured command')
+    parser.add_argument('--commands', type=int, default=50,
+                        help='Number of commands run one by one and in batch '
+                             'mode')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of the slowest imports to list')
+    args = parser.parse_args()
+
+    # Write the cached bytecode of the module, even if Python is told not to
+    # write it, so that runs as a module do not compile it
+    py_compile.compile(os.path.join(PACKAGE, 'class_register.py'))
+    total, modules = measure_imports(args.repeat, args.top)
+    print(f'python -X importtime: class_register imported in '
+          f'{total:.1f} ms')
+    print(f'{"module":32} {"self ms":>8} {"cumulative ms":>14}')
+    for own, cumulative, name in modules:
+        print(f'{name:32} {own / 1000:8.2f} {cumulative / 1000:14.2f}')
+
+    script = [sys.executable, os.path.join(PACKAGE, 'class_register.py'),
+              '--local']
+    module = [sys.executable, '-m', 'class_register', '--local']
+    directory = tempfile.mkdtemp()
+    try:
+        generate_registers(directory, args.rows)
+        print()
+        print(f'{"command":40} {"script ms":>10} {"module ms":>10}')
+        for argv in [['print_register', 'courses', '--limit', '1'],
+                     ['course_grades', 'Physics'],
+                     ['give_grade', 'Nobody', 'Here', 'Physics', '4']]:
+            script_time = measure_command(script, argv, directory,
+                                          args.repeat)
+            module_time = measure_command(module, argv, directory,
+                                          args.repeat)
+            print(f'{" ".join(argv):40} {script_time:10.1f} '
+                  f'{module_time:10.1f}')
+
+        commands = [f'new_course New{i} 3' for i in range(args.commands)]
+        for student in range(args.rows):
+            if len(commands) == 2 * args.commands:
+                break
+            status, _, courses = describe_student(student, 10, 100)
+            if status == 'Active':
+                commands.append(shlex.join(['give_grade',
+                                            *get_student_name(student),
+                                            get_course_name(courses[0][0]),
+                                            '4']))
+        print()
+        for batch in [False, True]:
+            # Every run starts from the same registers
+            run_directory = os.path.join(directory, f'run{int(batch)}')
+            os.mkdir(run_directory)
+            for file_name in ['classrooms.csv', 'courses.csv',
+                              'students.csv']:
+                shutil.copy(os.path.join(directory, file_name),
+                            run_directory)
+            elapsed = measure_batch(module, commands, run_directory, batch)
+            mode = 'one --batch process' if batch else 'one process each'
+            print(f'{len(commands)} commands, {mode:20} {elapsed:10.1f} ms '
+                  f'{elapsed / len(commands):8.2f} ms/command')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+
+"""Generate synthetic registers (classrooms.csv, courses.csv and
+students.csv) of a given number of students in the current format.
+
+The registers are consistent with the rules of the program: active students
+are listed in their classroom and courses with fewer grades than needed to
+pass, graduates have passed three courses and inactive students have failed
+one of their courses. Students are described by their number (see
+describe_student), so benchmarks can pick students for their commands
+without reading the registers."""
+
+import argparse
+import csv
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from class_register import (ClassroomRegister, CourseRegister,  # noqa: E402
+                            StudentRegister)
+
+COURSES_NAMES = ['Computer science', 'Physics', 'Mathematics', 'Spanish',
+                 'English', 'French', 'Economics', 'Chemistry', 'Biology',
+                 'History']
+
+
+def get_course_name(course):
+    """Get the name of a course by its number."""
+    if course < len(COURSES_NAMES):
+        return COURSES_NAMES[course]
+    return f'Course{course}'
+
+
+def get_grades_number(course):
+    """Get the number of grades needed to pass a course by its number."""
+    return 3 + course % 3
+
+
+def get_classroom_name(classroom):
+    """Get the name of a classroom by its number."""
+    start_year = 1000 + classroom
+    return f'{start_year}-{start_year + 3}'
+
+
+def get_student_name(student):
+    """Get the first and the last name of a student by its number."""
+    return f'Name{student}', f'Surname{student}'
+
+
+def get_course_step(courses_number):
+    """Get the step between the courses of a student: the smallest number
+    from 7 up which is coprime to the number of courses, so that the courses
+    of a student are distinct."""
+    step = 7
+    while math.gcd(step, courses_number) != 1:
+        step += 1
+    return step
+
+
+def describe_student(student, courses_number, classroom_size):
+    """Describe a student by its number: return the student's status, the
+    number of the student's classroom and a list of the student's courses
+    as pairs of a course number and a list of grades."""
+    status = 'Graduate' if student % 10 == 0 else \
+        'Inactive' if student % 10 == 1 else 'Active'
+    courses_count = 3 if status != 'Active' else 1 + student % 3
+    step = get_course_step(courses_number)
+    courses = []
+    for position in range(courses_count):
+        course = (student + step * position) % courses_number
+        grades_number = get_grades_number(course)
+        if status == 'Graduate' or (status == 'Inactive' and position):
+            grades = [str(3 + (student + k) % 3)
+                      for k in range(grades_number)]
+        elif status == 'Inactive':
+            grades = ['2'] * grades_number
+        else:
+            grades = [str(2 + (student + k) % 4)
+                      for k in range((student + position) % grades_number)]
+        courses.append((course, grades))
+    return status, student // classroom_size, courses
+
+
+def generate_registers(directory, students_number, courses_number=10,
+                       classroom_size=100):
+    """Write the three registers with a given number of students into a
+    directory. Students are written one by one, only the lists of the
+    classrooms and the courses are kept in memory. Graduates need three
+    distinct courses, so there must be at least three courses."""
+    if courses_number < 3:
+        raise ValueError(f'At least 3 courses are needed, got '
+                         f'{courses_number}')
+    classrooms_number = max(1, -(-students_number // classroom_size))
+    classrooms = [{'Students': [], 'Graduates': [], 'Dropout': []}
+                  for _ in range(classrooms_number)]
+    courses = [{'Students': [], 'Graduates': [], 'Dropout': []}
+               for _ in range(courses_number)]
+
+    register = StudentRegister()
+    with open(os.path.join(directory, register.file), 'w', newline='',
+              encoding='utf-8') as file:
+        writer = csv.DictWriter(file, delimiter=';',
+                                fieldnames=register.fieldnames)
+        writer.writeheader()
+        for student in range(students_number):
+            first_name, last_name = get_student_name(student)
+            fullname = f'{first_name} {last_name}'
+            status, classroom, student_courses = \
+                describe_student(student, courses_number, classroom_size)
+            column = {'Active': 'Students', 'Graduate': 'Graduates',
+                      'Inactive': 'Dropout'}[status]
+            classrooms[classroom][column].append(fullname)
+            for course, grades in student_courses:
+                if status == 'Active':
+                    courses[course]['Students'].append(fullname)
+                elif len(set(grades)) == 1 and grades[0] == '2':
+                    courses[course]['Dropout'].append(fullname)
+                else:
+                    courses[course]['Graduates'].append(fullname)
+            writer.writerow(register.serialize_row({
+                'First name': first_name,
+                'Last name': last_name,
+                'Date of birth': f'{1990 + student % 15}-'
+                                 f'{1 + student % 12:02}-'
+                                 f'{1 + student % 28:02}',
+                'Classroom': get_classroom_name(classroom),
+                'Courses': [{get_course_name(course): grades}
+                            for course, grades in student_courses],
+                'Status': status
+                }))
+
+    register = ClassroomRegister()
+    with open(os.path.join(directory, register.file), 'w', newline='',
+              encoding='utf-8') as file:
+        writer = csv.DictWriter(file, delimiter=';',
+                                fieldnames=register.fieldnames)
+        writer.writeheader()
+        for classroom, lists in enumerate(classrooms):
+            name = get_classroom_name(classroom)
+            start_year, end_year = name.split('-')
+            writer.writerow(register.serialize_row({
+                'Class name': name,
+                'Start year': start_year,
+                'End year': end_year,
+                **lists
+                }))
+
+    register = CourseRegister()
+    with open(os.path.join(directory, register.file), 'w', newline='',
+              encoding='utf-8') as file:
+        writer = csv.DictWriter(file, delimiter=';',
+                                fieldnames=register.fieldnames)
+        writer.writeheader()
+        for course, lists in enumerate(courses):
+            writer.writerow(register.serialize_row({
+                'Course name': get_course_name(course),
+                'Grades to pass': str(get_grades_number(course)),
+                **lists
+                }))
+
+
+def main():
+    """The main function based on the argument parser."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=1000,
+                        help='Number of students in the registers')
+    parser.add_argument('--courses', type=int, default=10,
+                        help='Number of courses in the registers')
+    parser.add_argument('--classroom-size', type=int, default=100,
+                        help='Number of students in every classroom')
+    parser.add_argument('--output', default='.',
+                        help='Directory in which the registers are written')
+    args = parser.parse_args()
+    if args.courses < 3:
+        parser.error('--courses must be at least 3, graduates need three '
+                     'distinct courses')
+
+    os.makedirs(args.output, exist_ok=True)
+    generate_registers(args.output, args.students, args.courses,
+                       args.classroom_size)
+    print(f'Registers of {args.students} students written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
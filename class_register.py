@@ -1,8 +1,2104 @@
 #!/usr/bin/python3
 
-import datetime
 import csv
 import argparse
+import os
+import json
+import sys
+import io
+import contextlib
+import time
+import functools
+import itertools
+from collections.abc import MutableMapping
+# Modules used by a few commands, backends or modes only (array, mmap,
+# struct and zlib by snapshots and the row offset index, threading by locks
+# and profiles, shlex by --batch, datetime, sqlite3, signal, socket and
+# socketserver) are imported where they are used, to keep the startup of
+# the other commands short
+try:
+    import fcntl
+except ImportError:
+    # Advisory file locks are not available on Windows, registers are then
+    # only locked within the process
+    fcntl = None
+
+# The name lists of a course or a classroom of a large register do not fit
+# into the default field size limit of the csv module (128 KiB)
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+
+def encode_list(value):
+    """Encode a list column of a register (a list of names or a list of
+    courses with grades) as compact JSON."""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'),
+                      default=str)
+
+
+def is_legacy_list(value):
+    """Check if a list column is written in the legacy format, a repr() of a
+    Python list."""
+    return value.startswith("['") or value.startswith("[{'")
+
+
+def decode_list(value):
+    """Decode a list column of a register. Columns written in the legacy
+    format, a repr() of a Python list, are decoded with
+    decode_legacy_list."""
+    if is_legacy_list(value):
+        return decode_legacy_list(value)
+    return json.loads(value)
+
+
+def pack_list(value):
+    """Pack a decoded list column into a compact, immutable tuple: names are
+    interned, so they are shared by all rows, and grades of courses are
+    stored as bytes of small integers. A list which cannot be packed is
+    encoded as JSON instead."""
+    items = []
+    for item in value:
+        if isinstance(item, str):
+            items.append(sys.intern(item))
+            continue
+        if not isinstance(item, dict) or len(item) != 1:
+            return encode_list(value)
+        (name, grades), = item.items()
+        if not isinstance(grades, list) or \
+                not all(isinstance(grade, str) and grade.isdigit() and
+                        len(grade) == 1 for grade in grades):
+            return encode_list(value)
+        items.append((sys.intern(name), bytes(int(grade)
+                                              for grade in grades)))
+    return tuple(items)
+
+
+def unpack_list(value):
+    """Build a list column from its packed form (see pack_list)."""
+    if isinstance(value, str):
+        return decode_list(value)
+    return [item if isinstance(item, str)
+            else {item[0]: [str(grade) for grade in item[1]]}
+            for item in value]
+
+
+def decode_legacy_list(value):
+    """Decode a list column written in the legacy format, a repr() of a
+    Python list of names or of dictionaries of courses' names and grades."""
+    if not value.startswith('[{'):
+        # Strip strings from redundant characters
+        names = value.strip('[]')
+        return names.replace("\'", "").split(', ') if names else []
+    courses_list = []
+    # Strip strings from redundant characters
+    for item in value.split('}, {'):
+        item = item.replace("[", "").replace("]", "") \
+            .replace("\'", "").strip("{}")
+        key = item.split(": ")[0]
+        grades = item.split(": ")[1].split(", ")
+        grades = [] if grades[0] == '' else grades
+        courses_list.append({key: grades})
+    return courses_list
+
+
+class RegisterProfile:
+    """
+    A class representing the instrumentation of a command run with
+    --profile: counters of the register I/O (file opens, rows parsed, bytes
+    written, ...) and timers of register reads and writes and of command
+    handlers decorated with profiled. Nothing is recorded while the profile
+    is disabled, so the instrumented functions only check a flag.
+
+    Attributes:
+    -------------
+    enabled : bool
+        Whether counters and timers are recorded
+    counters : dict
+        The counters keyed by their names
+    timers : dict
+        The number of calls, the total and the own wall time in seconds
+        (without the time of nested timers) keyed by the timers' names
+    start_time : float
+        The time the profile was started
+    wall_time : float
+        The wall time in seconds between the start and the stop of the
+        profile
+    local : threading.local
+        The stack of running timers of each thread, None until the profile
+        is first started
+    profiler : cProfile.Profile
+        The profiler of the Python functions, None if it is not used
+
+    Methods:
+    -------------
+    start(dump_file=None)
+    stop
+    count(name, amount=1)
+    timer(name)
+    report(command)
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self.timers = {}
+        self.start_time = None
+        self.wall_time = 0.0
+        self.local = None
+        self.profiler = None
+
+    def start(self, dump_file=None):
+        """Clear the counters and the timers and start recording. If a dump
+        file is given, the Python functions are also profiled by cProfile."""
+        self.counters = {}
+        self.timers = {}
+        if self.local is None:
+            import threading
+            self.local = threading.local()
+        self.enabled = True
+        if dump_file:
+            if self.profiler is None:
+                import cProfile
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start_time = time.perf_counter()
+
+    def stop(self, dump_file=None):
+        """Stop recording and write the statistics of cProfile, collected
+        by all profiled commands so far, into a dump file, which can be read
+        with pstats ('python -m pstats <file>')."""
+        self.wall_time = time.perf_counter() - self.start_time
+        self.enabled = False
+        if dump_file and self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(dump_file)
+
+    def count(self, name, amount=1):
+        """Add an amount to a counter."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Measure the wall time of a block of code under a name."""
+        stack = self.local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += elapsed
+            timer[2] += elapsed - nested
+
+    def report(self, command):
+        """Format the counters and the timers of a command as a text."""
+        lines = [f'Profile of {command}: {self.wall_time * 1000:.2f} ms']
+        if self.counters:
+            lines.append('Counters:')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'  {name:48} {value:>12,}')
+        timers = sorted(self.timers.items(), key=lambda item: item[1][1],
+                        reverse=True)
+        if timers:
+            lines.append(f'{"Timers:":50} {"calls":>6} {"total ms":>11} '
+                         f'{"own ms":>11}')
+            for name, (calls, total, own) in timers:
+                lines.append(f'  {name:48} {calls:6} {total * 1000:11.2f} '
+                             f'{own * 1000:11.2f}')
+        return '\n'.join(lines)
+
+
+register_profile = RegisterProfile()
+
+
+def profiled(function):
+    """Decorate a register read or write or a command handler, so that its
+    calls and their wall time are recorded while profiling is enabled."""
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def profiled_function(*args, **kwargs):
+        if not register_profile.enabled:
+            return function(*args, **kwargs)
+        with register_profile.timer(name):
+            return function(*args, **kwargs)
+    return profiled_function
+
+
+def open_file(file_name, mode='r', **kwargs):
+    """Open a file of a register, counting the opening while profiling is
+    enabled."""
+    register_profile.count('file opens')
+    return open(file_name, mode, **kwargs)
+
+
+class RegisterLock:
+    """
+    A class representing a reentrant lock guarding changes of a register. The
+    lock is held between threads of the process and, for registers kept in
+    files, between processes with an advisory lock (fcntl.flock) on a lock
+    file next to the register.
+
+    Attributes:
+    -------------
+    lock_file : str
+        The path of the lock file, None if the register is only locked within
+        the process
+    thread_lock : threading.RLock
+        The lock held between threads
+    depth : int
+        The number of nested acquisitions by the thread holding the lock
+    file : file object
+        The open lock file while the lock is held
+
+    Methods:
+    -------------
+    acquire
+    release
+    """
+
+    def __init__(self, lock_file=None):
+        import threading
+        self.lock_file = lock_file
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self):
+        """Acquire the lock, waiting for other threads and processes holding
+        it. Only the outermost acquisition locks the lock file."""
+        self.thread_lock.acquire()
+        if self.depth == 0 and self.lock_file and fcntl:
+            try:
+                self.file = open_file(self.lock_file, 'a')
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+            except BaseException:
+                if self.file:
+                    self.file.close()
+                    self.file = None
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+
+    def release(self):
+        """Release the lock."""
+        self.depth -= 1
+        if self.depth == 0 and self.file:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+
+class RegisterRow(MutableMapping):
+    """
+    A class representing a formatted register row kept in a compact form.
+    A subclass with a slot for every column is created for each register
+    with create_type, so rows do not carry a dictionary of column names.
+
+    List columns read from the register file are kept encoded and decoded on
+    access, so rows which are only matched by name never pay for decoding
+    their lists. Lists assigned to a row are packed (see pack_list). A list
+    column is built anew on every access, so a changed list has to be
+    assigned back to the row.
+
+    A row read from a .csv file keeps the line it was read from until any of
+    its columns is assigned, so rewriting the file copies the lines of
+    unchanged rows instead of serializing them again.
+
+    Attributes:
+    -------------
+    fields : dict
+        The names of the slots keyed by the columns (class attribute)
+    list_fields : frozenset
+        The columns holding lists (class attribute)
+    line : str
+        The line of the .csv file the row was read from, None if the row
+        has been changed since or was not read from a .csv file
+
+    Methods:
+    -------------
+    create_type(name, fieldnames, list_fields)
+    from_values(values, line=None)
+    from_row(row, line=None)
+    copy
+    serialize
+    """
+
+    __slots__ = ()
+    fields = {}
+    list_fields = frozenset()
+
+    @classmethod
+    def create_type(cls, name, fieldnames, list_fields):
+        """Create a row type with a slot for each column of a register."""
+        fields = {field: field.lower().replace(' ', '_')
+                  for field in fieldnames}
+        return type(name, (cls,), {
+                                   '__slots__': tuple(fields.values()) +
+                                   ('line',),
+                                   'fields': fields,
+                                   'list_fields': frozenset(list_fields)
+                                   })
+
+    @classmethod
+    def from_values(cls, values, line=None):
+        """Create a row from the values of its columns, in the order of the
+        register's columns, with list columns already packed, and the line
+        of the .csv file it was read from."""
+        new_row = cls.__new__(cls)
+        for slot, value in zip(cls.__slots__, values):
+            setattr(new_row, slot, value)
+        new_row.line = line
+        return new_row
+
+    @classmethod
+    def from_row(cls, row, line=None):
+        """Create a row from a mapping of columns (a row read from the
+        register file, a formatted row or another RegisterRow) and the line
+        of the .csv file it was read from, if it can be written back as it
+        is."""
+        if isinstance(row, cls):
+            return row.copy()
+        new_row = cls.__new__(cls)
+        for field, slot in cls.fields.items():
+            value = row.get(field)
+            if isinstance(value, list):
+                value = pack_list(value)
+            setattr(new_row, slot, value)
+        new_row.line = line
+        return new_row
+
+    def __getitem__(self, key):
+        value = getattr(self, self.fields[key])
+        if key not in self.list_fields or value is None:
+            return value
+        return unpack_list(value)
+
+    def __setitem__(self, key, value):
+        if key in self.list_fields and isinstance(value, list):
+            value = pack_list(value)
+        setattr(self, self.fields[key], value)
+        self.line = None
+
+    def __delitem__(self, key):
+        raise TypeError('Columns of a register row cannot be deleted')
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        """Return a copy of the row. The columns are immutable, so they are
+        shared with the copy."""
+        new_row = self.__class__.__new__(self.__class__)
+        for slot in self.__slots__:
+            setattr(new_row, slot, getattr(self, slot))
+        return new_row
+
+    def serialize(self):
+        """Convert the row into a row of strings, as stored in the register
+        file. List columns kept encoded are written as they were read, unless
+        they are in the legacy format."""
+        row = {}
+        for field, slot in self.fields.items():
+            value = getattr(self, slot)
+            if field in self.list_fields and value is not None:
+                if isinstance(value, str) and not is_legacy_list(value):
+                    row[field] = value
+                else:
+                    row[field] = encode_list(self[field])
+            else:
+                row[field] = str(value)
+        return row
+
+
+def with_register_lock(method):
+    """Decorate a Register method changing the register, so that it runs
+    while holding the register's lock."""
+    @functools.wraps(method)
+    def locked_method(self, *args, **kwargs):
+        with self.get_lock():
+            return method(self, *args, **kwargs)
+    return locked_method
+
+
+def copy_row(row):
+    """Return a copy of a formatted register row, so that callers may modify
+    its lists without affecting the register cache."""
+    if isinstance(row, RegisterRow):
+        return row.copy()
+    new_row = {}
+    for key, value in row.items():
+        if isinstance(value, list):
+            value = [{name: list(grades) for name, grades in item.items()}
+                     if isinstance(item, dict) else item for item in value]
+        new_row[key] = value
+    return new_row
+
+
+class RegisterCache:
+    """
+    A class representing a per-process cache of parsed registers shared by all
+    Register subclasses. Each register file is parsed once and kept together
+    with a hash index of its entries. An entry is invalidated as soon as the
+    modification time or the size of the file changes. A register in batch
+    mode changes a private copy of its entry (see Register.batch_entry), so
+    that other registers only read committed entries.
+
+    Attributes:
+    -------------
+    entries : dict
+        Cached registers keyed by the absolute path of the register file. Each
+        entry holds the file's stamp, the list of formatted rows and the index
+        mapping the register's key to the row position, and once they are
+        needed, views of the entries such as their rosters (see
+        Register.get_view)
+
+    Methods:
+    -------------
+    get_entry(register)
+    find_entry(register)
+    store_rows(register, rows, views=None)
+    update_row(register, row_index, row, view_changes=None)
+    append_row(register, row, stamp)
+    update_views(register, entry, key, row, view_changes=None)
+    invalidate(register=None)
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    @staticmethod
+    def get_stamp(register):
+        """Get the stamp of a register's storage, which changes whenever the
+        register is modified."""
+        return register.storage.get_stamp()
+
+    def get_entry(self, register):
+        """Get a cached entry of a register, parsing the register file again
+        if it has been modified since it was cached. In batch mode the
+        register's private copy of the entry is returned, made from the
+        cached entry on first use."""
+        if register.batch and register.batch_entry is not None:
+            return register.batch_entry
+        path = register.storage.location
+        stamp = self.get_stamp(register)
+        entry = self.entries.get(path)
+        if entry is None or entry.get('stamp') != stamp:
+            # Reload the register while holding its lock, so that a register
+            # being written by another thread is not parsed half-written
+            with register.get_lock():
+                stamp = self.get_stamp(register)
+                entry = self.entries.get(path)
+                if entry is None or entry.get('stamp') != stamp:
+                    register_profile.count('register loads')
+                    rows = register.storage.load_rows()
+                    entry = {
+                             'stamp': stamp,
+                             'rows': rows,
+                             'index': register.build_index(rows)
+                             }
+                    self.entries[path] = entry
+        if register.batch:
+            register.batch_entry = {
+                                    'stamp': entry.get('stamp'),
+                                    'rows': list(entry.get('rows')),
+                                    'index': dict(entry.get('index')),
+                                    'views': {build: dict(view) for build, view
+                                              in entry.get('views',
+                                                           {}).items()}
+                                    }
+            return register.batch_entry
+        return entry
+
+    @staticmethod
+    def find_entry(register):
+        """Get the cached entry a register reads from without loading it:
+        the register's private entry in batch mode, otherwise the shared
+        entry if it is up to date with the register file. Return None if
+        there is no such entry."""
+        if register.batch and register.batch_entry is not None:
+            return register.batch_entry
+        entry = register.cache.entries.get(register.storage.location)
+        if entry is None or entry.get('stamp') != \
+                register.cache.get_stamp(register):
+            return None
+        return entry
+
+    def store_rows(self, register, rows, views=None):
+        """Replace a cached register with rows that have just been written to
+        the register file, together with views of the rows if they are kept
+        up to date with them."""
+        path = register.storage.location
+        self.entries[path] = {
+                              'stamp': self.get_stamp(register),
+                              'rows': rows,
+                              'index': register.build_index(rows)
+                              }
+        if views:
+            self.entries[path]['views'] = views
+
+    def update_row(self, register, row_index, row, view_changes=None):
+        """Replace a single cached row that has just been rewritten in the
+        register file. The index is only touched if the row's key has
+        changed. Values of views already updated by the caller are given as
+        view_changes (see update_views)."""
+        if register.batch:
+            entry = register.batch_entry
+        else:
+            entry = self.entries.get(register.storage.location)
+        if entry is None:
+            return
+        index = entry.get('index')
+        old_key = register.get_row_key(entry['rows'][row_index])
+        new_key = register.get_row_key(row)
+        entry['rows'][row_index] = row
+        if old_key != new_key:
+            if index.get(old_key) == row_index:
+                del index[old_key]
+            index[new_key] = row_index
+            # Another entry may be indexed by the old key, so the views are
+            # built again when they are needed
+            entry.pop('views', None)
+        else:
+            self.update_views(register, entry, new_key, row, view_changes)
+        if not register.batch:
+            entry['stamp'] = self.get_stamp(register)
+
+    def append_row(self, register, row, stamp):
+        """Append a row that has just been written at the end of the register
+        file. The cached entry is only updated if it was up to date with the
+        file before the append (stamp), otherwise it is dropped."""
+        if register.batch:
+            entry = register.batch_entry
+        else:
+            entry = self.entries.get(register.storage.location)
+        if entry is None:
+            return
+        if entry.get('stamp') != stamp:
+            self.invalidate(register)
+            return
+        entry['rows'].append(row)
+        entry['index'][register.get_row_key(row)] = len(entry['rows']) - 1
+        self.update_views(register, entry, register.get_row_key(row), row)
+        if not register.batch:
+            entry['stamp'] = self.get_stamp(register)
+
+    @staticmethod
+    def update_views(register, entry, key, row, view_changes=None):
+        """Update the views of a cached register with a changed or appended
+        row. The values of the row in some of the views may be given, keyed
+        by the name of the view (view_changes), the other values are built
+        from the row again."""
+        view_changes = view_changes or {}
+        for build, view in list(entry.get('views', {}).items()):
+            if build in view_changes:
+                view[key] = view_changes[build]
+            else:
+                view[key] = getattr(register, build)(row)
+
+    def invalidate(self, register=None):
+        """Drop a cached register or, if no register is given, the whole
+        cache."""
+        if register is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(register.storage.location, None)
+
+
+class RegisterSnapshot:
+    """
+    A class representing a compiled snapshot of a register's .csv file: a
+    binary, columnar file ('<file>.snap') opened with mmap, so that looking up
+    a single entry only touches the pages holding it instead of parsing the
+    whole .csv file.
+
+    The snapshot holds a table of all distinct strings (column values, names
+    in lists and list columns which cannot be packed, see pack_list), a
+    column of string numbers for every plain column, the start and the
+    length of the list of every entry for every list column, the items of
+    the lists, the grades of the courses as fixed-width bytes and a hash
+    table mapping the register's keys to the positions of the entries. The
+    snapshot records the stamp of the .csv file it was compiled from and is
+    not used once the .csv file has changed.
+
+    Attributes:
+    -------------
+    register : Register
+        The register compiled into the snapshot
+    file : str
+        The path of the snapshot file
+    mapping : mmap.mmap
+        The snapshot file mapped into memory, or None if it is not open
+    file_stamp : tuple
+        The stamp of the mapped snapshot file
+    source_stamp : tuple
+        The stamp of the .csv file the mapped snapshot was compiled from
+    rows_number : int
+        The number of entries in the snapshot
+    strings : dict
+        Strings already read from the string table, keyed by their numbers
+    sections : dict
+        Views of the string offsets, the string data, the columns (keyed by
+        the column names), the list items, the grades and the hash table
+
+    Methods:
+    -------------
+    get_file_stamp(file_name)
+    hash_key(key)
+    prepare(rows, stamp)
+    save(rows, stamp)
+    open(stamp)
+    get_string(number)
+    get_value(field, row_index)
+    get_row_key(row_index)
+    find_row_index(key)
+    load_row(row_index)
+    """
+
+    magic = b'CRSNAP1' + sys.byteorder[0].upper().encode()
+    # Marks a missing value, a plain name among list items and a list column
+    # kept as encoded text
+    none = 0xFFFFFFFF
+    encoded = 0xFFFFFFFE
+
+    @functools.cached_property
+    def header(self):
+        import struct
+        return struct.Struct('=8sIIIqqQQQQQQQ')
+
+    def __init__(self, register, file):
+        self.register = register
+        self.file = file
+        self.mapping = None
+        self.file_stamp = None
+        self.source_stamp = None
+        self.rows_number = 0
+        self.strings = {}
+        self.sections = {}
+
+    def __len__(self):
+        return self.rows_number
+
+    @staticmethod
+    def get_file_stamp(file_name):
+        """Get the modification time, the size and the inode of a file."""
+        stat = os.stat(file_name)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @staticmethod
+    def hash_key(key):
+        """Hash a key of the register index into an unsigned integer which
+        does not change between processes."""
+        import zlib
+        parts = key if isinstance(key, tuple) else (key,)
+        return zlib.crc32('\x1f'.join(str(part) for part in parts)
+                          .encode('utf-8'))
+
+    @profiled
+    def prepare(self, rows, stamp):
+        """Compile a list of rows, read from the .csv file with a given stamp
+        (see get_file_stamp), into a temporary file, which replaces the
+        snapshot file once the .csv file is written. Return the path of the
+        temporary file."""
+        import array
+        register = self.register
+        row_type = register.row_type
+        strings = {field: number for number, field
+                   in enumerate(register.fieldnames)}
+        columns = {field: array.array('I') for field in register.fieldnames}
+        fields = [(slot, field in row_type.list_fields, columns[field])
+                  for field, slot in row_type.fields.items()]
+        items = array.array('I')
+        grades = bytearray()
+        index = {}
+        for row_index, row in enumerate(rows):
+            if not isinstance(row, row_type):
+                row = row_type.from_row(row)
+            for slot, is_list, column in fields:
+                value = getattr(row, slot)
+                if not is_list:
+                    column.append(self.none if value is None else
+                                  strings.setdefault(str(value),
+                                                     len(strings)))
+                    continue
+                if isinstance(value, str):
+                    try:
+                        value = pack_list(decode_list(value))
+                    except (ValueError, IndexError):
+                        # Keep a list column which cannot be decoded as it
+                        # is
+                        pass
+                if value is None:
+                    column.extend((0, self.none))
+                elif isinstance(value, str):
+                    column.extend((strings.setdefault(value, len(strings)),
+                                   self.encoded))
+                else:
+                    column.extend((len(items) // 3, len(value)))
+                    for item in value:
+                        if isinstance(item, str):
+                            items.extend((strings.setdefault(
+                                item, len(strings)), 0, self.none))
+                        else:
+                            items.extend((strings.setdefault(
+                                item[0], len(strings)), len(grades),
+                                len(item[1])))
+                            grades += item[1]
+            index[register.get_row_key(row)] = row_index
+
+        # An open addressing hash table at most half full
+        hash_size = 8
+        while hash_size < 2 * len(index):
+            hash_size *= 2
+        table = array.array('I', [self.none]) * hash_size
+        for key, row_index in index.items():
+            slot = self.hash_key(key) & (hash_size - 1)
+            while table[slot] != self.none:
+                slot = (slot + 1) & (hash_size - 1)
+            table[slot] = row_index
+
+        data = [text.encode('utf-8') for text in strings]
+        offsets = array.array('I', [0])
+        for text in data:
+            offsets.append(offsets[-1] + len(text))
+        sections = [offsets.tobytes(), b''.join(data),
+                    b''.join(columns[field].tobytes()
+                             for field in register.fieldnames),
+                    items.tobytes(), bytes(grades), table.tobytes()]
+        positions = []
+        position = self.header.size
+        for section in sections:
+            # Align every section to 8 bytes
+            position += -position % 8
+            positions.append(position)
+            position += len(section)
+
+        temp_file = f'{self.file}.{os.getpid()}.tmp'
+        try:
+            with open_file(temp_file, 'wb') as file:
+                file.write(self.header.pack(self.magic, len(rows),
+                                            len(strings), hash_size, *stamp,
+                                            *positions))
+                for position, section in zip(positions, sections):
+                    file.write(bytes(position - file.tell()))
+                    file.write(section)
+                file.flush()
+                os.fsync(file.fileno())
+                register_profile.count('bytes written', file.tell())
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        return temp_file
+
+    def save(self, rows, stamp):
+        """Compile a list of rows, read from the .csv file with a given stamp,
+        into the snapshot file."""
+        os.replace(self.prepare(rows, stamp), self.file)
+
+    def open(self, stamp):
+        """Map the snapshot file into memory, unless it is mapped already,
+        and return the snapshot if it was compiled from the .csv file with a
+        given stamp. Otherwise return None."""
+        import mmap
+        import struct
+        try:
+            file_stamp = self.get_file_stamp(self.file)
+            if file_stamp != self.file_stamp:
+                with open_file(self.file, 'rb') as file:
+                    mapping = mmap.mmap(file.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+                magic, rows_number, strings_number, hash_size, *values = \
+                    self.header.unpack_from(mapping)
+                if magic != self.magic:
+                    return None
+                (offsets, data, columns, items, grades,
+                 table) = values[3:]
+                view = memoryview(mapping)
+                sections = {
+                    'offsets': view[offsets:offsets + 4 * strings_number +
+                                    4].cast('I'),
+                    'data': view[data:columns],
+                    'items': view[items:grades].cast('I'),
+                    'grades': view[grades:table],
+                    'table': view[table:table + 4 * hash_size].cast('I')
+                    }
+                for field in self.register.fieldnames:
+                    size = 4 * rows_number
+                    if field in self.register.list_fields:
+                        size *= 2
+                    sections[field] = view[columns:columns + size].cast('I')
+                    columns += size
+                self.sections = sections
+                self.mapping = mapping
+                self.file_stamp = file_stamp
+                self.source_stamp = tuple(values[:3])
+                self.rows_number = rows_number
+                self.strings = {}
+        except (OSError, ValueError, struct.error):
+            # A missing, empty or truncated snapshot is not used
+            return None
+        if self.source_stamp != stamp:
+            return None
+        return self
+
+    def get_string(self, number):
+        """Get a string from the string table by its number."""
+        text = self.strings.get(number)
+        if text is None:
+            offsets = self.sections['offsets']
+            text = sys.intern(str(self.sections['data'][
+                offsets[number]:offsets[number + 1]], 'utf-8'))
+            self.strings[number] = text
+        return text
+
+    def get_value(self, field, row_index):
+        """Get the value of a column of the entry at a given position. List
+        columns are returned packed (see pack_list)."""
+        column = self.sections[field]
+        if field not in self.register.list_fields:
+            number = column[row_index]
+            return None if number == self.none else self.get_string(number)
+        start, length = column[2 * row_index], column[2 * row_index + 1]
+        if length == self.none:
+            return None
+        if length == self.encoded:
+            return self.get_string(start)
+        items = self.sections['items']
+        grades = self.sections['grades']
+        value = []
+        for item in range(3 * start, 3 * (start + length), 3):
+            name, grades_start, grades_number = items[item:item + 3]
+            if grades_number == self.none:
+                value.append(self.get_string(name))
+            else:
+                value.append((self.get_string(name), bytes(
+                    grades[grades_start:grades_start + grades_number])))
+        return tuple(value)
+
+    def get_row_key(self, row_index):
+        """Get the key of the entry at a given position."""
+        key = tuple(self.get_value(field, row_index)
+                    for field in self.register.key_fields)
+        return key[0] if len(key) == 1 else key
+
+    def find_row_index(self, key):
+        """Find the position of an entry in the snapshot using the hash
+        table. Return None if there is no such entry."""
+        table = self.sections['table']
+        mask = len(table) - 1
+        slot = self.hash_key(key) & mask
+        while table[slot] != self.none:
+            if self.get_row_key(table[slot]) == key:
+                return table[slot]
+            slot = (slot + 1) & mask
+        return None
+
+    def load_row(self, row_index):
+        """Read the entry at a given position as a formatted row."""
+        register_profile.count('snapshot rows loaded')
+        row_type = self.register.row_type
+        row = row_type.__new__(row_type)
+        for field, slot in row_type.fields.items():
+            setattr(row, slot, self.get_value(field, row_index))
+        row.line = None
+        return row
+
+
+class RegisterOffsetIndex:
+    """
+    A class representing the row offset index of a register's .csv file
+    written with slack space by the inplace backend: a binary file
+    ('<file>.idx') holding the byte offset and the size of the slot of
+    every entry, so that a changed entry still fitting its slot is written
+    over it in place instead of rewriting the whole .csv file.
+
+    The index starts with the sizes of the slots written one after another
+    by the last full rewrite of the .csv file, followed by a record for
+    every entry written in place or appended since then. Every record also
+    holds the size of the .csv file after the write, so the index is not
+    used once the .csv file has been replaced (its inode has changed) or
+    changed without the index (its size differs). Appending the records
+    also changes the stamp of the register (see CsvStorage.get_stamp) on
+    every write, even within the resolution of the modification time.
+
+    Attributes:
+    -------------
+    file : str
+        The path of the index file
+    slots : tuple
+        The stamp of the index file and of the .csv file and the offsets and
+        the sizes of the slots last read by load
+
+    Methods:
+    -------------
+    prepare(file_name, start, sizes)
+    load(file_name)
+    pack_records(records, file_size)
+    """
+
+    magic = b'CROFFS1' + sys.byteorder[0].upper().encode()
+
+    def __init__(self, file):
+        self.file = file
+        self.slots = None
+
+    @functools.cached_property
+    def header(self):
+        import struct
+        return struct.Struct('=8sQQQQ')
+
+    @functools.cached_property
+    def record(self):
+        import struct
+        return struct.Struct('=QQQQ')
+
+    def prepare(self, file_name, start, sizes):
+        """Write the index of a .csv file whose entries start at a given
+        offset (start) and take slots of given sizes, one after another,
+        into a temporary file, which replaces the index file once the .csv
+        file is written. Return the path of the temporary file."""
+        stat = os.stat(file_name)
+        temp_file = f'{self.file}.{os.getpid()}.tmp'
+        try:
+            with open_file(temp_file, 'wb') as file:
+                file.write(self.header.pack(self.magic, stat.st_ino,
+                                            stat.st_size, start, len(sizes)))
+                file.write(sizes.tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        return temp_file
+
+    def load(self, file_name):
+        """Read the offsets and the sizes of the slots of the entries of a
+        .csv file. Return None if there is no index or it does not match the
+        .csv file. The slots are kept until the files change."""
+        import array
+        import struct
+        try:
+            index_stat = os.stat(self.file)
+            stat = os.stat(file_name)
+        except FileNotFoundError:
+            return None
+        stamp = (index_stat.st_mtime_ns, index_stat.st_size, stat.st_ino,
+                 stat.st_size)
+        if self.slots is not None and self.slots[0] == stamp:
+            return self.slots[1:]
+        with open_file(self.file, 'rb') as file:
+            data = file.read()
+        try:
+            magic, inode, file_size, start, rows_number = \
+                self.header.unpack_from(data)
+        except struct.error:
+            return None
+        end = self.header.size + 8 * rows_number
+        # A record torn by a process stopped while writing makes the index
+        # unusable, the .csv file is then rewritten
+        if magic != self.magic or inode != stat.st_ino or \
+                len(data) < end or (len(data) - end) % self.record.size:
+            return None
+        sizes = array.array('Q')
+        sizes.frombytes(data[self.header.size:end])
+        offsets = array.array('Q', itertools.accumulate(sizes,
+                                                        initial=start))
+        offsets.pop()
+        for row_index, offset, size, file_size in \
+                self.record.iter_unpack(data[end:]):
+            if row_index < len(offsets):
+                offsets[row_index] = offset
+                sizes[row_index] = size
+            elif row_index == len(offsets):
+                offsets.append(offset)
+                sizes.append(size)
+            else:
+                return None
+        if file_size != stat.st_size:
+            return None
+        self.slots = (stamp, offsets, sizes)
+        return offsets, sizes
+
+    def pack_records(self, records, file_size):
+        """Pack records of entries written in place or appended, given as
+        tuples of the position, the offset and the size of the slot, and the
+        size of the .csv file after they are written."""
+        return b''.join(self.record.pack(row_index, offset, size, file_size)
+                        for row_index, offset, size in records)
+
+
+def decode_csv_chunk(file_name, start, stop, fieldnames, list_fields):
+    """Parse the lines of a .csv file between two byte offsets (start and
+    stop) on line boundaries and decode and pack their list columns (see
+    pack_list). Run in the worker processes of CsvStorage.load_rows_parallel.
+    Return the tuples of the values of the rows' columns and the lines the
+    rows were read from (None for rows in the legacy format), or None if the
+    lines cannot be parsed one by one: a row spans several lines or has a
+    wrong number of columns."""
+    with open(file_name, 'rb') as file:
+        file.seek(start)
+        data = file.read(stop - start)
+    lines = io.StringIO(data.decode('utf-8'), newline='').readlines()
+    # The first and the last line of a row spanning several lines hold an
+    # odd number of quotes
+    if any(line.count('"') % 2 for line in lines):
+        return None
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\r\n'
+    positions = [fieldnames.index(field) for field in list_fields]
+    rows = []
+    for position, values in enumerate(csv.reader(lines, delimiter=';')):
+        if len(values) != len(fieldnames):
+            return None
+        for field in positions:
+            value = values[field]
+            if is_legacy_list(value):
+                lines[position] = None
+            try:
+                values[field] = pack_list(decode_list(value))
+            except (ValueError, IndexError):
+                # A list which cannot be decoded (invalid JSON or a malformed
+                # legacy list) is kept encoded and fails when it is accessed,
+                # as in rows read by a single process
+                pass
+        rows.append(tuple(values))
+    return rows, lines
+
+
+class CsvStorage:
+    """
+    A class representing the storage of a register in a .csv file.
+
+    In journal mode, changed and new entries are not written into the .csv
+    file, but appended as single records to a change log kept next to it
+    ('<file>.log'). Every record holds the position of the entry in the
+    register (empty for new entries) followed by the entry's columns. Reading
+    the register replays the change log over the last snapshot of the .csv
+    file, and compacting folds the change log into a fresh .csv file.
+
+    With snapshots enabled, the .csv file is compiled into a snapshot (see
+    RegisterSnapshot) whenever it is rewritten, and single entries are looked
+    up in the snapshot with the change log replayed over it.
+
+    In place mode, every entry is written with slack space: spaces after the
+    JSON list of its last list column, which are ignored when the list is
+    decoded, so the file stays a regular .csv file. The slots of the entries
+    are kept in a row offset index (see RegisterOffsetIndex) and a changed
+    entry still fitting its slot is written over it, new entries are
+    appended at the end of the file. If an entry outgrows its slot, the
+    whole file is rewritten, giving the changed entry fresh slack space.
+
+    With workers, a large .csv file is loaded in parallel: it is split into
+    ranges of whole lines, which are parsed and whose list columns are
+    decoded in a pool of worker processes (see decode_csv_chunk).
+
+    Attributes:
+    -------------
+    register : Register
+        The register kept in the storage
+    journal : bool
+        Whether changes are appended to the change log
+    inplace : bool
+        Whether changed entries are written over their slots
+    workers : int
+        The number of worker processes loading the .csv file, 0 for one
+        process per core, None to load it in this process
+    location : str
+        The absolute path of the .csv file
+    log_file : str
+        The path of the change log
+    lock_file : str
+        The path of the file locked while the register is changed
+    index_file : str
+        The path of the row offset index
+    snapshot : RegisterSnapshot
+        The snapshot of the .csv file, or None if snapshots are not used
+    offset_index : RegisterOffsetIndex
+        The row offset index in place mode, otherwise None
+    log_records : tuple
+        The stamp of the change log and its records last read by read_log
+    slack : int
+        The minimum slack space of an entry in bytes in place mode, an
+        eighth of the entry's length is added to it (class attribute)
+    chunk_size : int
+        The minimum size in bytes of a range of lines loaded by a worker
+        process (class attribute)
+
+    Methods:
+    -------------
+    get_stamp
+    read_raw_rows(lines=None)
+    read_log(length)
+    iter_raw_rows
+    load_rows
+    load_rows_parallel
+    iter_rows
+    open_snapshot
+    save_snapshot
+    find_row_index(key, snapshot)
+    load_row(row_index, snapshot)
+    write_rows(rows)
+    write_row(row_index, row, rows)
+    write_changes(rows, row_indexes)
+    prepare_changes(rows, row_indexes)
+    prepare_in_place(rows, row_indexes)
+    format_line(row, size=None)
+    serialize_line(row)
+    apply_changes(changes)
+    revert_changes(changes)
+    drop_backups(changes)
+    append_row(row)
+    append_to_log(row_index, row)
+    serialize_record(row_index, row)
+    compact
+    """
+
+    indexed = False
+    slack = 32
+    chunk_size = 1 << 20
+
+    def __init__(self, register, journal=False, snapshot=False,
+                 inplace=False, workers=None):
+        self.register = register
+        self.journal = journal
+        self.inplace = inplace
+        self.workers = workers
+        self.location = os.path.abspath(register.file)
+        self.log_file = register.file + '.log'
+        self.lock_file = register.file + '.lock'
+        self.index_file = register.file + '.idx'
+        self.snapshot = RegisterSnapshot(register, register.file + '.snap') \
+            if snapshot else None
+        self.offset_index = RegisterOffsetIndex(self.index_file) \
+            if inplace else None
+        self.log_records = None
+
+    def get_stamp(self):
+        """Get the modification time, the size and the inode of the .csv file
+        and the modification time and the size of the change log and of the
+        row offset index. The inode changes whenever the .csv file is
+        replaced."""
+        stat = os.stat(self.register.file)
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if os.path.exists(self.log_file):
+            log_stat = os.stat(self.log_file)
+            stamp += (log_stat.st_mtime_ns, log_stat.st_size)
+        if os.path.exists(self.index_file):
+            index_stat = os.stat(self.index_file)
+            stamp += (index_stat.st_mtime_ns, index_stat.st_size)
+        return stamp
+
+    @profiled
+    def read_raw_rows(self, lines=None):
+        """Read all lines in the .csv file, replay the change log over them
+        and return a list of unformatted rows. If a list is given (lines),
+        the line of the .csv file each row was read from is appended to it,
+        or None if the row cannot be written back as it is: rows replayed
+        from the change log, rows in the legacy format and rows of a file
+        whose rows span several lines or whose columns are not the
+        register's."""
+        with open_file(self.register.file, 'r', newline='',
+                       encoding='utf-8') as file:
+            text_lines = file.readlines()
+        reader = csv.DictReader(text_lines, delimiter=';')
+        rows_raw = [row for row in reader]
+        register_profile.count('csv rows parsed', len(rows_raw))
+        if lines is not None:
+            if reader.fieldnames == self.register.fieldnames and \
+                    len(rows_raw) == len(text_lines) - 1:
+                if not text_lines[-1].endswith('\n'):
+                    text_lines[-1] += '\r\n'
+                list_fields = self.register.list_fields
+                lines.extend(None if any(is_legacy_list(row[field] or '')
+                                         for field in list_fields)
+                             else line for row, line
+                             in zip(rows_raw, itertools.islice(text_lines, 1,
+                                                               None)))
+            else:
+                lines.extend([None] * len(rows_raw))
+        if os.path.exists(self.log_file):
+            fieldnames = self.register.fieldnames
+            with open_file(self.log_file, 'r', newline='', encoding='utf-8') \
+                    as file:
+                reader = csv.reader(file, delimiter=';')
+                for record in reader:
+                    register_profile.count('log records parsed')
+                    # Skip a record torn by a process stopped while writing
+                    if len(record) != len(fieldnames) + 1:
+                        continue
+                    row = dict(zip(fieldnames, record[1:]))
+                    position = int(record[0]) if record[0] else len(rows_raw)
+                    if position < len(rows_raw):
+                        rows_raw[position] = row
+                        if lines is not None:
+                            lines[position] = None
+                    else:
+                        rows_raw.append(row)
+                        if lines is not None:
+                            lines.append(None)
+        return rows_raw
+
+    @profiled
+    def read_log(self, length):
+        """Read the change log of a .csv file holding a given number of
+        entries (length). Return the unformatted rows replacing entries of
+        the .csv file, keyed by their positions, and the list of unformatted
+        rows appended after them. The records are kept until the change log
+        changes."""
+        if not os.path.exists(self.log_file):
+            return {}, []
+        log_stat = os.stat(self.log_file)
+        stamp = (log_stat.st_mtime_ns, log_stat.st_size, length)
+        if self.log_records is not None and self.log_records[0] == stamp:
+            return self.log_records[1:]
+        overrides = {}
+        appended = []
+        fieldnames = self.register.fieldnames
+        with open_file(self.log_file, 'r', newline='', encoding='utf-8') \
+                as file:
+            for record in csv.reader(file, delimiter=';'):
+                register_profile.count('log records parsed')
+                if len(record) != len(fieldnames) + 1:
+                    continue
+                row = dict(zip(fieldnames, record[1:]))
+                position = int(record[0]) if record[0] \
+                    else length + len(appended)
+                if position < length:
+                    overrides[position] = row
+                elif position < length + len(appended):
+                    appended[position - length] = row
+                else:
+                    appended.append(row)
+        self.log_records = (stamp, overrides, appended)
+        return overrides, appended
+
+    def iter_raw_rows(self):
+        """Read the .csv file line by line and yield unformatted rows with the
+        change log replayed over them. Only the change log is kept in memory,
+        so the register is read in constant memory between compactions."""
+        overrides = {}
+        appended = []
+        if os.path.exists(self.log_file):
+            with open_file(self.register.file, 'r', encoding='utf-8') as file:
+                length = sum(1 for _ in csv.DictReader(file, delimiter=';'))
+            register_profile.count('csv rows parsed', length)
+            overrides, appended = self.read_log(length)
+        parsed = 0
+        try:
+            with open_file(self.register.file, 'r', encoding='utf-8') as file:
+                for position, row in enumerate(csv.DictReader(file,
+                                                              delimiter=';')):
+                    parsed = position + 1
+                    yield overrides.get(position, row)
+        finally:
+            # The rows may be read only partially
+            register_profile.count('csv rows parsed', parsed)
+        yield from appended
+
+    @profiled
+    def load_rows(self):
+        """Read the register and return a list of formatted rows, which keep
+        the lines they were read from. With workers, the .csv file is loaded
+        in parallel if it is large enough."""
+        if self.workers is not None:
+            rows = self.load_rows_parallel()
+            if rows is not None:
+                return rows
+        lines = []
+        rows = self.read_raw_rows(lines)
+        format_row = self.register.format_row
+        return [format_row(row, line) for row, line in zip(rows, lines)]
+
+    @profiled
+    def load_rows_parallel(self):
+        """Load the .csv file in a pool of worker processes, each parsing a
+        range of its lines and decoding their list columns, and replay the
+        change log over the rows. The rows are built in the order of the
+        ranges while the next ranges are still loaded. Return the list of
+        formatted rows, or None if the file is too small to be split or
+        cannot be parsed line by line (see decode_csv_chunk)."""
+        workers = self.workers or os.cpu_count() or 1
+        file_size = os.path.getsize(self.register.file)
+        with open_file(self.register.file, 'rb') as file:
+            header = file.readline().decode('utf-8')
+            if next(csv.reader([header], delimiter=';'), None) != \
+                    self.register.fieldnames:
+                return None
+            # A few ranges for each worker even out ranges of slower lines
+            chunk_size = max(self.chunk_size,
+                             (file_size - file.tell()) // (workers * 4))
+            bounds = [file.tell()]
+            while bounds[-1] < file_size:
+                file.seek(bounds[-1] + chunk_size)
+                file.readline()
+                bounds.append(min(file.tell(), file_size))
+        if len(bounds) < 3:
+            return None
+        from concurrent.futures import ProcessPoolExecutor
+
+        row_type = self.register.row_type
+        rows = []
+        with ProcessPoolExecutor(min(workers, len(bounds) - 1)) as executor:
+            for result in executor.map(decode_csv_chunk,
+                                       itertools.repeat(self.location),
+                                       bounds[:-1], bounds[1:],
+                                       itertools.repeat(
+                                           self.register.fieldnames),
+                                       itertools.repeat(
+                                           self.register.list_fields)):
+                if result is None:
+                    executor.shutdown(cancel_futures=True)
+                    return None
+                rows.extend(map(row_type.from_values, *result))
+        register_profile.count('csv rows parsed', len(rows))
+        overrides, appended = self.read_log(len(rows))
+        format_row = self.register.format_row
+        for position, row in overrides.items():
+            rows[position] = format_row(row)
+        rows.extend(format_row(row) for row in appended)
+        return rows
+
+    def iter_rows(self):
+        """Read the register lazily and yield formatted rows."""
+        for row in self.iter_raw_rows():
+            yield self.register.format_row(row)
+
+    def open_snapshot(self):
+        """Open the snapshot of the .csv file. Return None if snapshots are
+        not used or the snapshot is out of date."""
+        if self.snapshot is None:
+            return None
+        try:
+            stamp = RegisterSnapshot.get_file_stamp(self.register.file)
+        except FileNotFoundError:
+            return None
+        return self.snapshot.open(stamp)
+
+    @profiled
+    def save_snapshot(self):
+        """Compile the .csv file, without the change log, into the snapshot.
+        Return the number of compiled entries."""
+        stamp = RegisterSnapshot.get_file_stamp(self.register.file)
+        with open_file(self.register.file, 'r', encoding='utf-8') as file:
+            rows = list(csv.DictReader(file, delimiter=';'))
+        register_profile.count('csv rows parsed', len(rows))
+        self.snapshot.save(rows, stamp)
+        return len(rows)
+
+    @profiled
+    def find_row_index(self, key, snapshot):
+        """Find the position of an entry in an open snapshot with the change
+        log replayed over it. If a key is repeated, the most recent entry is
+        found. Return None if there is no such entry."""
+        overrides, appended = self.read_log(len(snapshot))
+        get_row_key = self.register.get_row_key
+        for position in range(len(appended) - 1, -1, -1):
+            if get_row_key(appended[position]) == key:
+                return len(snapshot) + position
+        positions = [position for position, row in overrides.items()
+                     if get_row_key(row) == key]
+        row_index = snapshot.find_row_index(key)
+        if row_index is not None and (row_index not in overrides or
+                                      row_index in positions):
+            positions.append(row_index)
+        return max(positions, default=None)
+
+    @profiled
+    def load_row(self, row_index, snapshot):
+        """Read the entry at a given position from an open snapshot with the
+        change log replayed over it."""
+        overrides, appended = self.read_log(len(snapshot))
+        if row_index in overrides:
+            return self.register.format_row(overrides[row_index])
+        if row_index >= len(snapshot):
+            return self.register.format_row(appended[row_index -
+                                                     len(snapshot)])
+        return snapshot.load_row(row_index)
+
+    def write_rows(self, rows):
+        """Overwrite the .csv file with a list of entries and remove the
+        change log, whose records are included in the entries. The entries are
+        written to a temporary file which then replaces the .csv file, so the
+        .csv file is never left half-written."""
+        self.write_changes(rows, None)
+
+    def write_row(self, row_index, row, rows):
+        """Write an updated entry at a given position. In journal mode only
+        the entry is appended to the change log, in place mode it is written
+        over its slot if it fits, otherwise the whole list of entries (rows)
+        is written."""
+        if self.journal:
+            self.append_to_log(row_index, row)
+        elif self.inplace:
+            self.write_changes(rows, [row_index])
+        else:
+            self.write_rows(rows)
+
+    def write_changes(self, rows, row_indexes):
+        """Write the entries at given positions (row_indexes), changed or
+        appended in batch mode. In journal mode only these entries are
+        appended to the change log, in place mode they are written over
+        their slots if they fit, otherwise the whole list of entries (rows)
+        is written once. Changes which cannot be written completely are
+        undone."""
+        changes = self.prepare_changes(rows, row_indexes)
+        try:
+            self.apply_changes(changes)
+        except BaseException:
+            self.revert_changes(changes)
+            raise
+        self.drop_backups(changes)
+
+    @profiled
+    def prepare_changes(self, rows, row_indexes):
+        """Prepare writing the entries at given positions (row_indexes, None
+        for a full rewrite) without changing the register. Return the
+        prepared changes: the records to append to the change log in journal
+        mode, the entries to write over their slots in place mode (see
+        prepare_in_place), otherwise a temporary file with the whole list of
+        entries (rows)."""
+        import array
+        if self.journal and row_indexes is not None:
+            log_size = os.path.getsize(self.log_file) \
+                if os.path.exists(self.log_file) else None
+            records = ''.join(self.serialize_record(row_index, rows[row_index])
+                              for row_index in sorted(row_indexes))
+            return {'records': records, 'log_size': log_size}
+        if self.inplace and row_indexes is not None:
+            changes = self.prepare_in_place(rows, row_indexes)
+            if changes is not None:
+                return changes
+        temp_file = f'{self.register.file}.{os.getpid()}.tmp'
+        changes = {'temp_file': temp_file}
+        # Entries of a file written without slack space (no index matches
+        # it) are all given slack space
+        pad_all = self.inplace and \
+            self.offset_index.load(self.register.file) is None
+        try:
+            with open_file(temp_file, 'w', newline='', encoding='utf-8') \
+                    as file:
+                writer = csv.DictWriter(file, delimiter=';',
+                                        fieldnames=self.register.fieldnames)
+                writer.writeheader()
+                start = file.tell()
+                sizes = array.array('Q')
+                # Unchanged rows are copied as they were read
+                serialize_row = self.register.serialize_row
+                serialized = 0
+                for row in rows:
+                    line = getattr(row, 'line', None)
+                    if self.inplace:
+                        if line is None or pad_all:
+                            line = self.format_line(row)
+                            serialized += 1
+                        file.write(line)
+                        sizes.append(len(line) if line.isascii()
+                                     else len(line.encode('utf-8')))
+                    elif line is None:
+                        writer.writerow(serialize_row(row))
+                        serialized += 1
+                    else:
+                        file.write(line)
+                register_profile.count('csv rows serialized', serialized)
+                file.flush()
+                os.fsync(file.fileno())
+                register_profile.count('csv rows written', len(rows))
+                register_profile.count('bytes written',
+                                       os.fstat(file.fileno()).st_size)
+            if self.inplace:
+                changes['index_file'] = self.offset_index.prepare(
+                    temp_file, start, sizes)
+            if self.snapshot is not None:
+                # The temporary file keeps its stamp when it replaces the
+                # .csv file, so the snapshot is compiled for that stamp
+                changes['snapshot_file'] = self.snapshot.prepare(
+                    rows, RegisterSnapshot.get_file_stamp(temp_file))
+        except BaseException:
+            self.revert_changes(changes)
+            raise
+        return changes
+
+    @profiled
+    def prepare_in_place(self, rows, row_indexes):
+        """Prepare writing the entries at given positions (row_indexes) over
+        their slots in the .csv file and appending new entries at its end.
+        Return the prepared changes: the encoded entries with their offsets
+        and the bytes they overwrite, the records of the row offset index
+        and, with snapshots, the snapshot compiled for the stamp the .csv
+        file is given once it is written. Return None if an entry outgrows
+        its slot, the change log is not empty or the index does not match the
+        .csv file, so the whole file has to be rewritten."""
+        if os.path.exists(self.log_file):
+            return None
+        slots = self.offset_index.load(self.register.file)
+        if slots is None:
+            return None
+        offsets, sizes = slots
+        file_size = os.path.getsize(self.register.file)
+        end = file_size
+        appended = len(offsets)
+        writes = []
+        records = []
+        with open_file(self.register.file, 'rb') as file:
+            for row_index in sorted(row_indexes):
+                if row_index < len(offsets):
+                    offset = offsets[row_index]
+                    line = self.format_line(rows[row_index],
+                                            sizes[row_index])
+                    if line is None:
+                        register_profile.count('rows outgrowing their slots')
+                        return None
+                    file.seek(offset)
+                    previous = file.read(sizes[row_index])
+                elif row_index == appended:
+                    offset = end
+                    line = self.format_line(rows[row_index])
+                    previous = None
+                    appended += 1
+                else:
+                    return None
+                data = line.encode('utf-8')
+                if previous is None:
+                    end += len(data)
+                writes.append((offset, data, previous))
+                records.append((row_index, offset, len(data)))
+        index_size = os.path.getsize(self.index_file)
+        changes = {
+                   'writes': writes,
+                   'file_size': file_size,
+                   'index_records': self.offset_index.pack_records(records,
+                                                                   end),
+                   'index_size': index_size
+                   }
+        if self.snapshot is not None:
+            # The written .csv file is given a modification time chosen now,
+            # later than its current one, so the snapshot is compiled for
+            # the stamp the file will have
+            stat = os.stat(self.register.file)
+            changes['mtime'] = max(time.time_ns(), stat.st_mtime_ns + 1)
+            changes['snapshot_file'] = self.snapshot.prepare(
+                rows, (changes['mtime'], end, stat.st_ino))
+        return changes
+
+    def format_line(self, row, size=None):
+        """Convert an entry into a line of the .csv file with slack space:
+        spaces after the JSON list of the register's last list column. The
+        line is padded to a given size in bytes, or by default by the
+        minimum slack space and an eighth of its length. Return None if the
+        line does not fit the given size."""
+        row = self.register.serialize_row(row)
+        field = self.register.list_fields[-1]
+        row[field] = row[field].rstrip(' ')
+        line = self.serialize_line(row)
+        length = len(line) if line.isascii() else len(line.encode('utf-8'))
+        if size is None:
+            size = length + self.slack + length // 8
+        elif length > size:
+            return None
+        row[field] += ' ' * (size - length)
+        return self.serialize_line(row)
+
+    def serialize_line(self, row):
+        """Convert a row of strings into a line of the .csv file."""
+        line = io.StringIO()
+        writer = csv.writer(line, delimiter=';')
+        writer.writerow([row.get(field) for field in self.register.fieldnames])
+        return line.getvalue()
+
+    @profiled
+    def apply_changes(self, changes):
+        """Write changes prepared by prepare_changes into the register. Before
+        the .csv file is replaced, the files to be replaced or removed are
+        kept as backups (hard links), so that revert_changes can restore them
+        until drop_backups is called."""
+        if 'records' in changes:
+            with open_file(self.log_file, 'a', newline='',
+                           encoding='utf-8') as file:
+                start = file.tell()
+                file.write(changes['records'])
+                register_profile.count('bytes written', file.tell() - start)
+            return
+        if 'writes' in changes:
+            with open_file(self.register.file, 'r+b') as file:
+                for offset, data, _ in changes['writes']:
+                    file.seek(offset)
+                    file.write(data)
+                    register_profile.count('bytes written', len(data))
+                file.flush()
+                os.fsync(file.fileno())
+            if 'mtime' in changes:
+                os.utime(self.register.file,
+                         ns=(changes['mtime'], changes['mtime']))
+            register_profile.count('rows written in place',
+                                   len(changes['writes']))
+            with open_file(self.index_file, 'ab') as file:
+                file.write(changes['index_records'])
+            if 'snapshot_file' in changes:
+                os.replace(changes['snapshot_file'], self.snapshot.file)
+            return
+        snapshot_file = None if self.snapshot is None else self.snapshot.file
+        changes['backups'] = backups = []
+        for file_name in [self.register.file, self.log_file, self.index_file,
+                          snapshot_file]:
+            if file_name is not None and os.path.exists(file_name):
+                backup = f'{file_name}.{os.getpid()}.bak'
+                if os.path.exists(backup):
+                    os.remove(backup)
+                os.link(file_name, backup)
+                backups.append((backup, file_name))
+        os.replace(changes['temp_file'], self.register.file)
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+        if 'index_file' in changes:
+            os.replace(changes['index_file'], self.index_file)
+        elif os.path.exists(self.index_file):
+            # The index of the replaced file is of no use
+            os.remove(self.index_file)
+        if 'snapshot_file' in changes:
+            os.replace(changes['snapshot_file'], self.snapshot.file)
+
+    def revert_changes(self, changes):
+        """Undo changes prepared by prepare_changes, also once they have been
+        applied: drop the temporary files and put the backups of the replaced
+        files back, write the overwritten bytes of entries written in place
+        back and cut the .csv file and the row offset index back to their
+        sizes, or cut the change log back to its size before the records were
+        appended."""
+        snapshot_file = changes.get('snapshot_file')
+        if 'writes' in changes and snapshot_file is not None and \
+                os.path.exists(snapshot_file):
+            os.remove(snapshot_file)
+        if 'writes' in changes:
+            with open_file(self.register.file, 'r+b') as file:
+                for offset, _, previous in changes['writes']:
+                    if previous is not None:
+                        file.seek(offset)
+                        file.write(previous)
+                file.truncate(changes['file_size'])
+            if os.path.exists(self.index_file):
+                with open_file(self.index_file, 'r+b') as file:
+                    file.truncate(changes['index_size'])
+        elif 'records' not in changes:
+            for temp_file in [changes['temp_file'],
+                              changes.get('index_file'),
+                              changes.get('snapshot_file')]:
+                if temp_file is not None and os.path.exists(temp_file):
+                    os.remove(temp_file)
+            if 'backups' in changes:
+                # Files which did not exist before the changes are removed
+                restored = [file_name for _, file_name in changes['backups']]
+                for file_name in [self.index_file, None if self.snapshot is
+                                  None else self.snapshot.file]:
+                    if file_name is not None and file_name not in restored \
+                            and os.path.exists(file_name):
+                        os.remove(file_name)
+                for backup, file_name in changes.pop('backups'):
+                    os.replace(backup, file_name)
+        elif changes['log_size'] is None:
+            if os.path.exists(self.log_file):
+                os.remove(self.log_file)
+        elif os.path.exists(self.log_file):
+            with open_file(self.log_file, 'r+b') as file:
+                file.truncate(changes['log_size'])
+
+    def drop_backups(self, changes):
+        """Remove the backups kept by apply_changes once the changes of all
+        registers written together have been applied."""
+        for backup, _ in changes.pop('backups', []):
+            if os.path.exists(backup):
+                os.remove(backup)
+
+    @profiled
+    def append_row(self, row):
+        """Append a new entry to the register."""
+        if self.journal:
+            self.append_to_log(None, row)
+        elif self.inplace:
+            rows = self.load_rows() + [row]
+            self.write_changes(rows, [len(rows) - 1])
+        elif os.path.exists(self.log_file) or self.snapshot is not None:
+            # Positions in the change log refer to the current register, so
+            # fold the change log before the .csv file grows. The snapshot
+            # is compiled again together with the .csv file.
+            self.write_rows(self.load_rows() + [row])
+        else:
+            with open_file(self.register.file, 'a', newline='',
+                           encoding='utf-8') as file:
+                writer = csv.DictWriter(file, delimiter=';',
+                                        fieldnames=self.register.fieldnames)
+                start = file.tell()
+                writer.writerow(self.register.serialize_row(row))
+                register_profile.count('csv rows written')
+                register_profile.count('bytes written', file.tell() - start)
+
+    @profiled
+    def append_to_log(self, row_index, row):
+        """Append a single record to the change log. The record is written
+        with a single write, so it is either appended whole or torn at the
+        end of the change log, where it is skipped on reading."""
+        with open_file(self.log_file, 'a', newline='', encoding='utf-8') \
+                as file:
+            start = file.tell()
+            file.write(self.serialize_record(row_index, row))
+            register_profile.count('bytes written', file.tell() - start)
+
+    def serialize_record(self, row_index, row):
+        """Convert an entry at a given position (None for a new entry) into a
+        record of the change log."""
+        record = io.StringIO()
+        writer = csv.writer(record, delimiter=';')
+        position = '' if row_index is None else row_index
+        row = self.register.serialize_row(row)
+        writer.writerow([position] + [row.get(field) for field in
+                                      self.register.fieldnames])
+        return record.getvalue()
+
+    @profiled
+    def compact(self):
+        """Fold the change log into a fresh .csv file. Return the number of
+        folded records."""
+        if not os.path.exists(self.log_file):
+            return 0
+        with open_file(self.log_file, 'r', encoding='utf-8') as file:
+            records = sum(1 for _ in file)
+        self.write_rows(self.load_rows())
+        return records
+
+
+class SqliteStorage:
+    """
+    A class representing the storage of a register in a SQLite database. All
+    three registers share one database file with the tables: classrooms,
+    courses, students, enrollments (courses assigned to each student), grades
+    (grades received by each student for each course) and members (the lists
+    of active students, graduates and dropouts of each classroom and course).
+
+    Each entry keeps its position in the register, so entries are looked up
+    with indexed queries and updated row by row without loading the whole
+    register.
+
+    Attributes:
+    -------------
+    register : Register
+        The register kept in the storage
+    database : str
+        The path of the SQLite database file
+    table : str
+        The name of the table holding the register's entries
+    location : str
+        The database path and the table identifying the storage
+    connection : sqlite3.Connection
+        The connection to the database, shared by all registers kept in the
+        same database within a thread
+    connections : dict
+        Open connections keyed by the absolute path of the database file and
+        the thread using the connection
+
+    Methods:
+    -------------
+    get_stamp
+    find_row_index(key)
+    load_row(row_index)
+    load_rows(start=None, stop=None)
+    iter_rows(page_size=500)
+    write_rows(rows)
+    write_row(row_index, row, rows)
+    append_row(row)
+    insert_row(row_index, row)
+    delete_row(row_index)
+    load_course_aggregates(course)
+    begin
+    commit
+    """
+
+    indexed = True
+    connections = {}
+    list_columns = ['Students', 'Graduates', 'Dropout']
+    schema = """
+        CREATE TABLE IF NOT EXISTS classrooms (
+            position INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            start_year INTEGER NOT NULL,
+            end_year INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS classrooms_name ON classrooms (name);
+        CREATE TABLE IF NOT EXISTS courses (
+            position INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            grades_number INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS courses_name ON courses (name);
+        CREATE TABLE IF NOT EXISTS students (
+            position INTEGER PRIMARY KEY,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            birth_date TEXT NOT NULL,
+            classroom TEXT NOT NULL,
+            status TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS students_name
+            ON students (first_name, last_name);
+        CREATE TABLE IF NOT EXISTS enrollments (
+            student INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            course TEXT NOT NULL,
+            PRIMARY KEY (student, seq)
+        );
+        CREATE INDEX IF NOT EXISTS enrollments_course ON enrollments (course);
+        CREATE TABLE IF NOT EXISTS grades (
+            student INTEGER NOT NULL,
+            enrollment INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            grade INTEGER NOT NULL,
+            PRIMARY KEY (student, enrollment, seq)
+        );
+        CREATE TABLE IF NOT EXISTS members (
+            register TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            list TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            student TEXT NOT NULL,
+            PRIMARY KEY (register, position, list, seq)
+        );
+    """
+
+    def __init__(self, register, database='class_register.db'):
+        self.register = register
+        self.database = database
+        self.table = os.path.splitext(os.path.basename(register.file))[0]
+        self.location = f'{os.path.abspath(database)}:{self.table}'
+        # SQLite locks the database between processes itself, see begin
+        self.lock_file = None
+        import threading
+        connection_key = (os.path.abspath(database), threading.get_ident())
+        self.connection = self.connections.get(connection_key)
+        if self.connection is None:
+            import sqlite3
+            register_profile.count('database connections')
+            self.connection = sqlite3.connect(database)
+            self.connection.executescript(self.schema)
+            self.connections[connection_key] = self.connection
+
+    def get_stamp(self):
+        """Get the modification time and the size of the database file."""
+        stat = os.stat(self.database)
+        return stat.st_mtime_ns, stat.st_size
+
+    @profiled
+    def find_row_index(self, key):
+        """Find the position of an entry using the table's index. If a key is
+        repeated, the position of the most recent entry is returned."""
+        if self.table == 'students':
+            query = 'SELECT MAX(position) FROM students ' \
+                    'WHERE first_name = ? AND last_name = ?'
+            params = key
+        else:
+            query = f'SELECT MAX(position) FROM {self.table} WHERE name = ?'
+            params = (key,)
+        return self.connection.execute(query, params).fetchone()[0]
+
+    @profiled
+    def load_rows(self, start=None, stop=None):
+        """Load all entries of the register, or the entries at positions from
+        start to stop (excluded), as a list of formatted rows."""
+        where = '' if start is None else 'WHERE position >= ? AND position < ?'
+        params = () if start is None else (start, stop)
+        execute = self.connection.execute
+        rows = {}
+        if self.table == 'students':
+            for position, first_name, last_name, birth_date, classroom, \
+                    status in execute(f'SELECT * FROM students {where} '
+                                      f'ORDER BY position', params):
+                rows[position] = {
+                                  'First name': first_name,
+                                  'Last name': last_name,
+                                  'Date of birth': birth_date,
+                                  'Classroom': classroom,
+                                  'Courses': [],
+                                  'Status': status
+                                  }
+            where = where.replace('position', 'student')
+            grades = {}
+            for student, enrollment, grade in \
+                    execute(f'SELECT student, enrollment, grade FROM grades '
+                            f'{where} ORDER BY student, enrollment, seq',
+                            params):
+                grades.setdefault((student, enrollment), []) \
+                    .append(str(grade))
+            for student, seq, course in \
+                    execute(f'SELECT student, seq, course FROM enrollments '
+                            f'{where} ORDER BY student, seq', params):
+                rows[student]['Courses'] \
+                    .append({course: grades.get((student, seq), [])})
+            register_profile.count('database rows loaded', len(rows))
+            return [self.register.row_type.from_row(row)
+                    for row in rows.values()]
+        if self.table == 'classrooms':
+            for position, name, start_year, end_year in \
+                    execute(f'SELECT * FROM classrooms {where} '
+                            f'ORDER BY position', params):
+                rows[position] = {
+                                  'Class name': name,
+                                  'Start year': str(start_year),
+                                  'End year': str(end_year)
+                                  }
+        elif self.table == 'courses':
+            for position, name, grades_number in \
+                    execute(f'SELECT * FROM courses {where} '
+                            f'ORDER BY position', params):
+                rows[position] = {
+                                  'Course name': name,
+                                  'Grades to pass': str(grades_number)
+                                  }
+        for row in rows.values():
+            for column in self.list_columns:
+                row[column] = []
+        where = '' if start is None else 'AND position >= ? AND position < ?'
+        for position, column, student in \
+                execute(f'SELECT position, list, student FROM members '
+                        f'WHERE register = ? {where} ORDER BY position, seq',
+                        (self.table,) + params):
+            rows[position][column].append(student)
+        register_profile.count('database rows loaded', len(rows))
+        return [self.register.row_type.from_row(row) for row in rows.values()]
+
+    def load_row(self, row_index):
+        """Load a single entry at a given position as a formatted row."""
+        rows = self.load_rows(row_index, row_index + 1)
+        return rows[0] if rows else None
+
+    def iter_rows(self, page_size=500):
+        """Load the entries of the register page by page and yield formatted
+        rows, so that only a single page is kept in memory."""
+        stop = self.connection.execute(
+            f'SELECT COALESCE(MAX(position) + 1, 0) FROM {self.table}'
+            ).fetchone()[0]
+        for start in range(0, stop, page_size):
+            yield from self.load_rows(start, start + page_size)
+
+    @profiled
+    def write_rows(self, rows):
+        """Replace all entries of the register with a list of entries."""
+        self.delete_row(None)
+        for row_index, row in enumerate(rows):
+            self.insert_row(row_index, row)
+        self.commit()
+
+    @profiled
+    def write_row(self, row_index, row, rows=None):
+        """Replace a single entry at a given position. The whole list of
+        entries (rows) is not needed."""
+        self.delete_row(row_index)
+        self.insert_row(row_index, row)
+        self.commit()
+
+    @profiled
+    def append_row(self, row):
+        """Append a new entry to the register."""
+        row_index = self.connection.execute(
+            f'SELECT COALESCE(MAX(position) + 1, 0) FROM {self.table}'
+            ).fetchone()[0]
+        self.insert_row(row_index, row)
+        self.commit()
+
+    @profiled
+    def load_course_aggregates(self, course):
+        """Load the sum and the number of grades of every student enrolled in
+        a course, aggregated by the database. Return a list of tuples of
+        first name, last name, status, sum and number of grades."""
+        return self.connection.execute(
+            'SELECT s.first_name, s.last_name, s.status, '
+            'COALESCE(SUM(g.grade), 0), COUNT(g.grade) '
+            'FROM enrollments e JOIN students s ON s.position = e.student '
+            'LEFT JOIN grades g ON g.student = e.student '
+            'AND g.enrollment = e.seq '
+            'WHERE e.course = ? GROUP BY e.student, e.seq '
+            'ORDER BY e.student', (course,)).fetchall()
+
+    def begin(self):
+        """Start a database transaction holding the database's write lock,
+        so that entries read in batch mode cannot be changed by other
+        processes until the batch is flushed. Registers sharing the
+        connection join the transaction already started."""
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        """Commit the changes to the database, unless the register is in
+        batch mode and the changes are committed when the batch is
+        flushed."""
+        if not self.register.batch:
+            register_profile.count('database commits')
+            self.connection.commit()
+
+    def insert_row(self, row_index, row):
+        """Insert an entry at a given position into the tables."""
+        register_profile.count('database rows written')
+        execute = self.connection.execute
+        if self.table == 'students':
+            execute('INSERT INTO students VALUES (?, ?, ?, ?, ?, ?)',
+                    (row_index, row.get('First name'), row.get('Last name'),
+                     row.get('Date of birth'), str(row.get('Classroom')),
+                     row.get('Status')))
+            for seq, course_item in enumerate(row.get('Courses')):
+                for course_name, grades in course_item.items():
+                    execute('INSERT INTO enrollments VALUES (?, ?, ?)',
+                            (row_index, seq, course_name))
+                    execute_many = self.connection.executemany
+                    execute_many('INSERT INTO grades VALUES (?, ?, ?, ?)',
+                                 [(row_index, seq, grade_seq, int(grade))
+                                  for grade_seq, grade in enumerate(grades)])
+            return
+        if self.table == 'classrooms':
+            execute('INSERT INTO classrooms VALUES (?, ?, ?, ?)',
+                    (row_index, row.get('Class name'),
+                     int(row.get('Start year')), int(row.get('End year'))))
+        elif self.table == 'courses':
+            execute('INSERT INTO courses VALUES (?, ?, ?)',
+                    (row_index, row.get('Course name'),
+                     int(row.get('Grades to pass'))))
+        for column in self.list_columns:
+            self.connection.executemany(
+                'INSERT INTO members VALUES (?, ?, ?, ?, ?)',
+                [(self.table, row_index, column, seq, str(student))
+                 for seq, student in enumerate(row.get(column))])
+
+    def delete_row(self, row_index):
+        """Delete an entry at a given position from the tables, or all entries
+        of the register if no position is given."""
+        execute = self.connection.execute
+        where = '' if row_index is None else 'WHERE position = ?'
+        params = () if row_index is None else (row_index,)
+        execute(f'DELETE FROM {self.table} {where}', params)
+        if self.table == 'students':
+            where = where.replace('position', 'student')
+            execute(f'DELETE FROM enrollments {where}', params)
+            execute(f'DELETE FROM grades {where}', params)
+        else:
+            where = 'AND position = ?' if row_index is not None else ''
+            execute(f'DELETE FROM members WHERE register = ? {where}',
+                    (self.table,) + params)
 
 
 class Register:
@@ -15,11 +2111,72 @@ class Register:
         The name of the register
     file : str
         The name of the .csv file containing the register
+    backend : str
+        The kind of storage used by the register: 'csv', 'journal',
+        'inplace' or 'sqlite'
+    snapshot : bool
+        Whether entries of a .csv file are looked up in its compiled
+        snapshot (see RegisterSnapshot)
+    workers : int
+        The number of worker processes loading a large .csv file, 0 for one
+        process per core, None to load it in this process
+    storage : CsvStorage or SqliteStorage
+        The storage of the register
+    batch : bool
+        Whether changes are kept in memory until the batch is flushed
+    changed_rows : set
+        The positions of the entries changed or appended in batch mode
+    batch_entry : dict
+        The private copy of the register's cached entry changed in batch
+        mode (see RegisterCache), None until it is first needed
+    fieldnames : list
+        The names of the columns in the register
+    key_fields : list
+        The columns identifying an entry in the register
+    list_fields : list
+        The columns holding lists, encoded as JSON in the register file
+    row_type : type
+        The RegisterRow subclass holding the register's rows
+    filter_fields : dict
+        The columns which print_register can filter on, keyed by the name of
+        the filter
+    roster_fields : list
+        The list columns of names kept as sets in the rosters of the entries
+    cache : RegisterCache
+        The register cache shared by all registers in the process
+    locks : dict
+        Locks (RegisterLock) guarding changes of the registers, keyed by the
+        location of the register's storage
 
     Methods:
     -------------
+    create_storage
+    get_lock(storage=None)
+    get_snapshot
+    get_row_key(row)
+    build_index(rows)
+    build_roster(row)
+    get_view(build)
+    get_rosters
+    get_roster(key)
+    format_row(row, line=None)
+    serialize_row(row)
     read_rows_in_register
-    print_register
+    iter_rows
+    select_rows(columns=None, filters=None, limit=None, offset=0)
+    find_row_index(key)
+    find_row(key)
+    get_row(row_index)
+    write_rows_to_register(rows)
+    update_row_in_register(row_index, row, view_changes=None)
+    append_row_to_register(row)
+    begin_batch
+    prepare_batch
+    finish_batch(changes)
+    flush_batch
+    discard_batch
+    print_register(columns=None, filters=None, limit=None, offset=0,
+                   output_format='raw')
 
     Subclasses:
     -------------
@@ -28,101 +2185,457 @@ class Register:
     CourseRegister
     """
 
-    def __init__(self):
-        self.name = self.__class__.__name__
-        self.file = None
+    fieldnames = []
+    key_fields = []
+    list_fields = []
+    row_type = RegisterRow
+    filter_fields = {}
+    roster_fields = []
+    cache = RegisterCache()
+    locks = {}
+
+    def __init__(self, backend='csv', snapshot=False, workers=None):
+        self.name = self.__class__.__name__
+        self.file = None
+        self.backend = backend
+        self.snapshot = snapshot
+        self.workers = workers
+        self.storage = None
+        self.batch = False
+        self.changed_rows = set()
+        self.batch_entry = None
+
+    def __repr__(self):
+        return self.name
+
+    def create_storage(self):
+        """Create the storage of the register for the chosen backend."""
+        if self.backend == 'csv':
+            return CsvStorage(self, snapshot=self.snapshot,
+                              workers=self.workers)
+        elif self.backend == 'journal':
+            return CsvStorage(self, journal=True, snapshot=self.snapshot,
+                              workers=self.workers)
+        elif self.backend == 'inplace':
+            return CsvStorage(self, snapshot=self.snapshot, inplace=True,
+                              workers=self.workers)
+        elif self.backend == 'sqlite':
+            return SqliteStorage(self)
+        raise ValueError(f'Unknown register backend: {self.backend}')
+
+    def get_lock(self, storage=None):
+        """Get the lock guarding changes of the register kept in a storage,
+        by default the register's storage. The lock is shared by all Register
+        instances using the same storage in the process, so threads and
+        processes changing the same register wait for each other."""
+        storage = self.storage if storage is None else storage
+        lock = self.locks.get(storage.location)
+        if lock is None:
+            # setdefault is atomic, so threads creating the lock at the same
+            # time all get the lock stored first
+            lock = self.locks.setdefault(storage.location,
+                                         RegisterLock(storage.lock_file))
+        return lock
+
+    def get_snapshot(self):
+        """Get the open snapshot of the register if single entries are to be
+        looked up in it: the snapshot is up to date and the register is not
+        held by the register cache (or the cached register is out of date).
+        Otherwise return None."""
+        if self.storage.indexed or self.storage.snapshot is None:
+            return None
+        if self.cache.find_entry(self) is not None:
+            return None
+        return self.storage.open_snapshot()
+
+    def get_row_key(self, row):
+        """Get the key identifying a row in the register index. Registers
+        identified by several columns use a tuple of their values."""
+        key = tuple(row.get(field) for field in self.key_fields)
+        return key[0] if len(key) == 1 else key
+
+    def build_index(self, rows):
+        """Build an index mapping the key of each row to its position. If a
+        key is repeated, the most recent entry is indexed."""
+        return {self.get_row_key(row): row_index
+                for row_index, row in enumerate(rows)}
+
+    def build_roster(self, row):
+        """Build the roster of an entry: a dictionary of sets of the names
+        held in each of the roster columns."""
+        return {field: frozenset(name for name in row.get(field) or []
+                                 if isinstance(name, str))
+                for field in self.roster_fields}
+
+    def get_view(self, build):
+        """Get a view of all entries: the results of a method of the register
+        (build, given by name) called with each entry, keyed by the
+        register's key. The view is built once, kept in the register cache
+        and updated together with the cached rows."""
+        entry = self.cache.get_entry(self)
+        views = entry.setdefault('views', {})
+        view = views.get(build)
+        if view is None:
+            method = getattr(self, build)
+            view = {self.get_row_key(row): method(row)
+                    for row in entry.get('rows')}
+            views[build] = view
+        return view
+
+    def get_rosters(self):
+        """Get the rosters of all entries keyed by the register's key."""
+        return self.get_view('build_roster')
+
+    def get_roster(self, key):
+        """Get the roster of an entry, or None if there is no such entry."""
+        if self.storage.indexed or self.get_snapshot() is not None:
+            row = self.find_row(key)
+            return None if row is None else self.build_roster(row)
+        return self.get_rosters().get(key)
+
+    def format_row(self, row, line=None):
+        """Convert a row read from the register file into a formatted row of
+        the register's row type, keeping the line of the .csv file it was
+        read from (see RegisterRow). The list columns are decoded lazily,
+        when they are first accessed."""
+        return self.row_type.from_row(row, line)
+
+    @staticmethod
+    def serialize_row(row):
+        """Convert a formatted row into a row of strings, as stored in the
+        register file. List columns are encoded as JSON."""
+        if isinstance(row, RegisterRow):
+            return row.serialize()
+        return {field: encode_list(value) if isinstance(value, list)
+                else str(value) for field, value in row.items()}
+
+    @profiled
+    def read_rows_in_register(self):
+        """Read all lines in the register and return a list of rows. The rows
+        are copied from the register cache, so they may be freely modified."""
+        if self.storage.indexed:
+            return self.storage.load_rows()
+        rows = self.cache.get_entry(self).get('rows')
+        return [copy_row(row) for row in rows]
+
+    def iter_rows(self):
+        """Iterate over the entries of the register without loading the whole
+        register. A register already held by the register cache is iterated
+        in memory, otherwise it is streamed from its storage."""
+        if not self.storage.indexed:
+            entry = self.cache.find_entry(self)
+            if entry is not None:
+                for row in entry.get('rows'):
+                    yield copy_row(row)
+                return
+        yield from self.storage.iter_rows()
+
+    def select_rows(self, columns=None, filters=None, limit=None, offset=0):
+        """Iterate over the entries of the register matching the filters (a
+        dictionary of filter names and values, see filter_fields), skipping
+        the first offset entries and stopping after limit entries. Only the
+        given columns of each entry are kept. A list column matches a value
+        if it holds the value, a 'Courses' column if it holds the course."""
+        filters = {self.filter_fields[name]: value
+                   for name, value in (filters or {}).items()}
+
+        def matches(row):
+            for column, value in filters.items():
+                cell = row.get(column)
+                if isinstance(cell, list):
+                    if not any(value in item if isinstance(item, dict)
+                               else value == item for item in cell):
+                        return False
+                elif cell != value:
+                    return False
+            return True
+
+        rows = self.iter_rows()
+        stop = None if limit is None else offset + limit
+        with contextlib.closing(rows):
+            for row in itertools.islice(filter(matches, rows), offset, stop):
+                if columns:
+                    row = {column: row.get(column) for column in columns}
+                yield row
+
+    @profiled
+    def find_row_index(self, key):
+        """Find the position of an entry in the register using the register
+        index. Return None if there is no such entry."""
+        if self.storage.indexed:
+            return self.storage.find_row_index(key)
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            return self.storage.find_row_index(key, snapshot)
+        return self.cache.get_entry(self).get('index').get(key)
+
+    def find_row(self, key):
+        """Find an entry in the register using the register index and return a
+        copy of it. Return None if there is no such entry."""
+        row_index = self.find_row_index(key)
+        if row_index is None:
+            return None
+        return self.get_row(row_index)
+
+    @profiled
+    def get_row(self, row_index):
+        """Get a copy of the entry at a given position in the register."""
+        if self.storage.indexed:
+            return self.storage.load_row(row_index)
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            return self.storage.load_row(row_index, snapshot)
+        return copy_row(self.cache.get_entry(self).get('rows')[row_index])
+
+    @profiled
+    @with_register_lock
+    def write_rows_to_register(self, rows):
+        """Overwrite the register with an updated list of entries and update
+        the register cache."""
+        self.storage.write_rows(rows)
+        if not self.storage.indexed:
+            self.cache.store_rows(self, [self.row_type.from_row(row)
+                                         for row in rows])
+
+    @profiled
+    @with_register_lock
+    def update_row_in_register(self, row_index, row, view_changes=None):
+        """Replace the entry at a given position in the register with an
+        updated one. Only the updated row is stored in the register cache and
+        the register index is kept as it is. Values of the cached views
+        already updated for the entry may be given (see
+        RegisterCache.update_views)."""
+        if self.storage.indexed:
+            self.storage.write_row(row_index, row)
+            return
+        if self.batch:
+            # A register looked up in its snapshot is loaded by the first
+            # change of the batch
+            self.cache.get_entry(self)
+            self.cache.update_row(self, row_index, self.row_type.from_row(row),
+                                  view_changes)
+            self.changed_rows.add(row_index)
+            return
+        rows = list(self.cache.get_entry(self).get('rows'))
+        rows[row_index] = row
+        self.storage.write_row(row_index, row, rows)
+        self.cache.update_row(self, row_index, self.row_type.from_row(row),
+                              view_changes)
+
+    @profiled
+    @with_register_lock
+    def append_row_to_register(self, row):
+        """Append a new entry at the end of the register and update the
+        register cache."""
+        if self.storage.indexed:
+            self.storage.append_row(row)
+            return
+        if self.batch:
+            entry = self.cache.get_entry(self)
+            self.cache.append_row(self, self.row_type.from_row(row),
+                                  entry.get('stamp'))
+            self.changed_rows.add(len(entry.get('rows')) - 1)
+            return
+        stamp = self.cache.get_stamp(self)
+        self.storage.append_row(row)
+        self.cache.append_row(self, self.row_type.from_row(row), stamp)
+
+    def begin_batch(self):
+        """Start batch mode: changes are kept in memory (in a private copy of
+        the cached register or in an open database transaction) until
+        flush_batch is called. A register with an up to date snapshot is only
+        loaded when the first change is made."""
+        if self.storage.indexed:
+            self.storage.begin()
+        self.batch = True
+        self.changed_rows = set()
+        self.batch_entry = None
+        if not self.storage.indexed and self.get_snapshot() is None:
+            self.cache.get_entry(self)
+
+    @profiled
+    def prepare_batch(self):
+        """Prepare writing all changes made in batch mode without changing
+        the register. Return the prepared changes, or None if there is
+        nothing to prepare."""
+        if self.storage.indexed or not self.changed_rows:
+            return None
+        rows = self.cache.get_entry(self).get('rows')
+        return self.storage.prepare_changes(rows, self.changed_rows)
+
+    @profiled
+    def finish_batch(self, changes):
+        """Write changes prepared by prepare_batch into the register and leave
+        batch mode. Only then are the changed rows stored in the register
+        cache shared with other registers."""
+        self.batch = False
+        if self.storage.indexed:
+            register_profile.count('database commits')
+            self.storage.connection.commit()
+        elif changes is not None:
+            self.storage.apply_changes(changes)
+            # The views of the batch's entry follow its changes, so they
+            # are kept
+            self.cache.store_rows(self, self.batch_entry.get('rows'),
+                                  self.batch_entry.get('views'))
+        self.changed_rows = set()
+        self.batch_entry = None
+
+    @with_register_lock
+    def flush_batch(self):
+        """Write all changes made in batch mode at once and leave batch
+        mode."""
+        changes = self.prepare_batch()
+        self.finish_batch(changes)
+        if changes is not None:
+            self.storage.drop_backups(changes)
+
+    def discard_batch(self):
+        """Drop all changes made in batch mode and leave batch mode. The
+        register cache shared with other registers has never seen them."""
+        self.batch = False
+        if self.storage.indexed:
+            self.storage.connection.rollback()
+        self.changed_rows = set()
+        self.batch_entry = None
+
+    @profiled
+    def print_register(self, columns=None, filters=None, limit=None,
+                       offset=0, output_format='raw'):
+        """Print the content of a register row by row, as it is read. The
+        entries are selected with select_rows and printed in one of the
+        formats: 'raw' (dictionaries), 'table', 'csv' or 'jsonl'. Column
+        widths of a table are fitted to the entries of its first page."""
+        columns = columns or self.fieldnames
+        rows = self.select_rows(columns, filters, limit, offset)
+        write = sys.stdout.write
+        if output_format == 'csv':
+            writer = csv.DictWriter(sys.stdout, delimiter=';',
+                                    fieldnames=columns, lineterminator='\n')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(self.serialize_row(row))
+        elif output_format == 'jsonl':
+            for row in rows:
+                write(json.dumps(row, ensure_ascii=False) + '\n')
+        elif output_format == 'table':
+            page = [self.serialize_row(row)
+                    for row in itertools.islice(rows, 50)]
+            widths = [max([len(column)] + [len(row[column]) for row in page])
+                      for column in columns]
+            line = ' | '.join('{:<%d}' % width for width in widths)
+            write(line.format(*columns).rstrip() + '\n')
+            write('-+-'.join('-' * width for width in widths) + '\n')
+            for row in itertools.chain(page, map(self.serialize_row, rows)):
+                write(line.format(*(row[column] for column in columns))
+                      .rstrip() + '\n')
+        else:
+            for row in rows:
+                print(self.serialize_row(row))
+
+
+class RegisterTransaction:
+    """
+    A class representing a unit of work changing several registers at once.
+    The registers are locked and switched to batch mode when the transaction
+    begins, so that every change made by Student, Course and Classroom
+    operations is collected in memory. On commit each changed register is
+    written once. The changes of all registers are prepared (written to
+    temporary files or serialized as change log records) before any register
+    is written, so a register which cannot be prepared leaves all registers
+    unchanged. While the prepared changes are applied, the replaced files
+    are kept as backups (see CsvStorage.apply_changes), so a register which
+    cannot be written also undoes the registers written before it. The
+    backups are removed once all registers are written. A process stopped
+    while applying the changes cannot undo them: the registers written so
+    far keep their changes and the backups are left next to them. On
+    rollback all changes are dropped.
+
+    Used as a context manager, the transaction is committed if the block
+    finishes and rolled back if it raises an exception (also SystemExit).
+
+    Attributes:
+    -------------
+    registers : list
+        The registers changed in the transaction, ordered by the location of
+        their storage, which is also the order in which they are locked
+    locks : list
+        The locks held by the transaction
+
+    Methods:
+    -------------
+    begin
+    commit
+    rollback
+    release
+    """
+
+    def __init__(self, *registers):
+        self.registers = sorted(registers,
+                                key=lambda register: register.storage.location)
+        self.locks = []
 
-    def __repr__(self):
-        return self.name
+    def __enter__(self):
+        self.begin()
+        return self
 
-    def read_rows_in_register(self):
-        """Read all lines in the register and return a list of rows."""
-        with open(self.file, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file, delimiter=';')
-            rows_raw = []
-            rows_formatted = []
-            for row in reader:
-                rows_raw.append(row)
-            if self.file == 'classrooms.csv':
-                for row in rows_raw:
-                    classroom_name = row.get('Class name')
-                    start_year = row.get('Start year')
-                    end_year = row.get('End year')
-                    # Strip strings from redundant characters
-                    students = row.get('Students').strip("[]")
-                    students = students.replace("\'", "").split(", ") \
-                        if students else []
-                    graduates = row.get('Graduates').strip("[]")
-                    graduates = graduates.replace("\'", "").split(", ") \
-                        if graduates else []
-                    dropout = row.get('Dropout').strip("[]")
-                    dropout = dropout.replace("\'", "").split(", ") \
-                        if dropout else []
-                    rows_formatted.append({
-                                           'Class name': classroom_name,
-                                           'Start year': start_year,
-                                           'End year': end_year,
-                                           'Students': students,
-                                           'Graduates': graduates,
-                                           'Dropout': dropout
-                                           })
-            elif self.file == 'students.csv':
-                for row in rows_raw:
-                    first_name = row.get('First name')
-                    last_name = row.get('Last name')
-                    birth_date = row.get('Date of birth')
-                    classroom = row.get('Classroom')
-                    courses = row.get('Courses')
-                    courses = courses.split('}, {')
-                    courses_list = []
-                    status = row.get('Status')
-                    # Strip strings from redundant characters
-                    for item in courses:
-                        item = item.replace("[", "").replace("]", "") \
-                            .replace("\'", "").strip("{}")
-                        key = item.split(": ")[0]
-                        value = item.split(": ")[1].split(", ")
-                        value = [] if value[0] == '' else value
-                        new_dict = {key: value}
-                        courses_list.append(new_dict)
-                    courses = [course_item for course_item in courses_list]
-                    rows_formatted.append({
-                                           'First name': first_name,
-                                           'Last name': last_name,
-                                           'Date of birth': birth_date,
-                                           'Classroom': classroom,
-                                           'Courses': courses,
-                                           'Status': status
-                                           })
-            elif self.file == 'courses.csv':
-                for row in rows_raw:
-                    course_name = row.get('Course name')
-                    grade_number = row.get('Grades to pass')
-                    # Strip strings from redundant characters
-                    students = row.get('Students').strip('[]')
-                    students = students.replace("\'", "").split(', ') \
-                        if students else []
-                    graduates = row.get('Graduates').strip('[]')
-                    graduates = graduates.replace("\'", "").split(', ') \
-                        if graduates else []
-                    dropout = row.get('Dropout').strip('[]')
-                    dropout = dropout.replace("\'", "").split(', ') \
-                        if dropout else []
-                    rows_formatted.append({
-                                           'Course name': course_name,
-                                           'Grades to pass': grade_number,
-                                           'Students': students,
-                                           'Graduates': graduates,
-                                           'Dropout': dropout
-                                           })
-            return rows_formatted
-
-    def print_register(self):
-        """Print all current content of a register."""
-        with open(self.file, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file, delimiter=';')
-            for row in reader:
-                print(row)
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def begin(self):
+        """Lock the registers, always in the same order so that transactions
+        do not wait for each other's locks, and start batch mode."""
+        try:
+            for register in self.registers:
+                lock = register.get_lock()
+                lock.acquire()
+                self.locks.append(lock)
+            for register in self.registers:
+                register.begin_batch()
+        except BaseException:
+            self.rollback()
+            raise
+
+    def commit(self):
+        """Write the changes of all registers and release the locks. If the
+        changes cannot be prepared or written, the prepared temporary files
+        are removed, the replaced files are restored from their backups, the
+        change logs and the entries written in place are cut back and all
+        changes are dropped."""
+        prepared = []
+        try:
+            for register in self.registers:
+                prepared.append((register, register.prepare_batch()))
+            for register, changes in prepared:
+                register.finish_batch(changes)
+        except BaseException:
+            for register, changes in prepared:
+                if changes is not None:
+                    register.storage.revert_changes(changes)
+                    # Registers written before the failure cached their
+                    # changes
+                    register.cache.invalidate(register)
+            self.rollback()
+            raise
+        for register, changes in prepared:
+            if changes is not None:
+                register.storage.drop_backups(changes)
+        self.release()
+
+    def rollback(self):
+        """Drop the changes of all registers and release the locks."""
+        for register in self.registers:
+            if register.batch:
+                register.discard_batch()
+        self.release()
+
+    def release(self):
+        """Release the locks held by the transaction."""
+        while self.locks:
+            self.locks.pop().release()
 
 
 class ClassroomRegister(Register):
@@ -145,145 +2658,119 @@ class ClassroomRegister(Register):
     change_student_status(student, action)
     """
 
-    def __init__(self):
-        super().__init__()
+    fieldnames = ['Class name', 'Start year', 'End year', 'Students',
+                  'Graduates', 'Dropout']
+    key_fields = ['Class name']
+    list_fields = ['Students', 'Graduates', 'Dropout']
+    row_type = RegisterRow.create_type('ClassroomRow', fieldnames, list_fields)
+    filter_fields = {'classroom': 'Class name', 'student': 'Students'}
+
+    def __init__(self, backend='csv', snapshot=False, workers=None):
+        super().__init__(backend, snapshot, workers)
         self.file = 'classrooms.csv'
+        self.storage = self.create_storage()
 
+    @profiled
     def get_classroom_from_register(self, classroom):
         """Get a Classroom instance based on the Classroom Register."""
-        rows = self.read_rows_in_register()
-        for row in rows:
-            if classroom in row.get('Class name'):
-                start_year = row.get('Start year')
-                end_year = row.get('End year')
-                students = row.get('Students')
-                graduates = row.get('Graduates')
-                dropout = row.get('Dropout')
-                classroom = Classroom(start_year, end_year, students,
-                                      graduates, dropout)
-                return classroom
-            else:
-                continue
+        row = self.find_row(classroom)
+        if row is None:
+            return None
+        start_year = row.get('Start year')
+        end_year = row.get('End year')
+        students = row.get('Students')
+        graduates = row.get('Graduates')
+        dropout = row.get('Dropout')
+        classroom = Classroom(start_year, end_year, students, graduates,
+                              dropout)
+        return classroom
 
     def extract_classroom_info(self, classroom, info):
         """Extract a specified kind of information from the Classroom
         Register."""
-        fieldnames = ['Class name', 'Start year', 'End year', 'Students',
-                      'Graduates', 'Dropout']
-        searched_index = info.index() if info in fieldnames else None
-        rows = self.read_rows_in_register()
-        for row in rows:
-            if classroom in row.get('Class name'):
-                searched_info = row.get(fieldnames[searched_index])
-                return searched_info
-            else:
-                continue
+        row = self.find_row(classroom)
+        if row is not None and info in self.fieldnames:
+            searched_info = row.get(info)
+            return searched_info
 
+    @profiled
     def new_classroom(self, classroom):
         """Add a new classroom into the Classroom Register."""
-        with open(self.file, 'a', encoding='utf-8', newline='') as file:
-            writer = csv.writer(file, delimiter=';')
-            classroom_name = classroom.name
-            start_year = classroom.start_year
-            end_year = classroom.end_year
-            students = classroom.student_list
-            graduates = classroom.graduates
-            dropout = classroom.dropout_list
-            writer.writerow([classroom_name, start_year, end_year, students,
-                             graduates, dropout])
+        new_row = {
+                   'Class name': classroom.name,
+                   'Start year': str(classroom.start_year),
+                   'End year': str(classroom.end_year),
+                   'Students': classroom.student_list,
+                   'Graduates': classroom.graduates,
+                   'Dropout': classroom.dropout_list
+                   }
+        self.append_row_to_register(new_row)
 
+    @profiled
+    @with_register_lock
     def add_student_to_classroom(self, student, classroom):
         """Add a new student into an existing classroom in the Classroom
         Register."""
-        rows = self.read_rows_in_register()
-        with open(self.file, 'r+', newline='', encoding='utf-8') as file:
-            fieldnames = ['Class name', 'Start year', 'End year', 'Students',
-                          'Graduates', 'Dropout']
-            writer = csv.DictWriter(file, delimiter=';', fieldnames=fieldnames)
-            # Find an appropriate classroom in the Classroom Register and
-            # update its entry index
-            row_index = None
-            for row in rows:
-                if classroom.name in row.get('Class name'):
-                    row_index = rows.index(row)
-            # Use found entry index to update the list of entries
-            if row_index is not None:
-                entry = rows[row_index]
-                classroom_name = entry.get('Class name')
-                start_year = entry.get('Start year')
-                end_year = entry.get('End year')
-                students = entry.get('Students')
-                graduates = entry.get('Graduates')
-                dropout = entry.get('Dropout')
-                students.append(student.fullname)
-                # Create an updated row
-                new_row = {
-                           'Class name': classroom_name,
-                           'Start year': start_year,
-                           'End year': end_year,
-                           'Students': students,
-                           'Graduates': graduates,
-                           'Dropout': dropout
-                           }
-                # Swap the old row with the updated one
-                rows.remove(rows[row_index])
-                rows.insert(row_index, new_row)
-                # Reset the whole Classroom Register
-                file.seek(0)
-                file.truncate(0)
-                # Overwrite the Classroom Register with updated list of entries
-                writer.writeheader()
-                writer.writerows(rows)
+        # Find an appropriate classroom in the Classroom Register using the
+        # register index
+        row_index = self.find_row_index(classroom.name)
+        # Use found entry index to update the list of entries
+        if row_index is not None:
+            entry = self.get_row(row_index)
+            classroom_name = entry.get('Class name')
+            start_year = entry.get('Start year')
+            end_year = entry.get('End year')
+            students = entry.get('Students')
+            graduates = entry.get('Graduates')
+            dropout = entry.get('Dropout')
+            students.append(student.fullname)
+            # Create an updated row
+            new_row = {
+                       'Class name': classroom_name,
+                       'Start year': start_year,
+                       'End year': end_year,
+                       'Students': students,
+                       'Graduates': graduates,
+                       'Dropout': dropout
+                       }
+            # Swap the old row with the updated one in the register
+            self.update_row_in_register(row_index, new_row)
 
+    @profiled
+    @with_register_lock
     def change_student_status(self, student, action):
         """Change student's status if student has graduated or failed a course.
          In the Classroom Register student's name is moved from 'Students' to
          either 'Graduates' or 'Dropout'."""
-        rows = self.read_rows_in_register()
-        with open(self.file, 'r+', newline='', encoding='utf-8') as file:
-            fieldnames = ['Class name', 'Start year', 'End year', 'Students',
-                          'Graduates', 'Dropout']
-            writer = csv.DictWriter(file, delimiter=';', fieldnames=fieldnames)
-            # Find an appropriate classroom in the Classroom Register and
-            # update its entry index
-            row_index = None
-            for row in rows:
-                classroom_name = row.get('Class name')
-                if classroom_name == student.classroom.name:
-                    row_index = rows.index(row)
-            # Use found entry index to update the list of entries
-            if row_index is not None:
-                entry = rows[row_index]
-                classroom_name = entry.get('Class name')
-                start_year = entry.get('Start year')
-                end_year = entry.get('End year')
-                # Remove the student from the list of attending students
-                students = entry.get('Students')
-                students.remove(student.fullname)
-                # Move student's info into an appropriate list
-                graduates = entry.get('Graduates')
-                dropout = entry.get('Dropout')
-                if action == 'Graduate':
-                    graduates.append(student.fullname)
-                elif action == 'Drop':
-                    dropout.append(student.fullname)
-                new_row = {
-                           'Class name': classroom_name,
-                           'Start year': start_year,
-                           'End year': end_year,
-                           'Students': students,
-                           'Graduates': graduates,
-                           'Dropout': dropout
-                           }
-                # Swap the old row with the updated one
-                rows.remove(rows[row_index])
-                rows.insert(row_index, new_row)
-                # Reset the whole Classroom Register
-                file.seek(0)
-                file.truncate(0)
-                # Overwrite the Classroom Register with updated list of entries
-                writer.writeheader()
-                writer.writerows(rows)
+        # Find an appropriate classroom in the Classroom Register using the
+        # register index
+        row_index = self.find_row_index(student.classroom.name)
+        # Use found entry index to update the list of entries
+        if row_index is not None:
+            entry = self.get_row(row_index)
+            classroom_name = entry.get('Class name')
+            start_year = entry.get('Start year')
+            end_year = entry.get('End year')
+            # Remove the student from the list of attending students
+            students = entry.get('Students')
+            students.remove(student.fullname)
+            # Move student's info into an appropriate list
+            graduates = entry.get('Graduates')
+            dropout = entry.get('Dropout')
+            if action == 'Graduate':
+                graduates.append(student.fullname)
+            elif action == 'Drop':
+                dropout.append(student.fullname)
+            new_row = {
+                       'Class name': classroom_name,
+                       'Start year': start_year,
+                       'End year': end_year,
+                       'Students': students,
+                       'Graduates': graduates,
+                       'Dropout': dropout
+                       }
+            # Swap the old row with the updated one in the register
+            self.update_row_in_register(row_index, new_row)
 
 
 class StudentRegister(Register):
@@ -299,134 +2786,188 @@ class StudentRegister(Register):
 
     Methods:
     -------------
+    get_student_key(student)
     is_student_in_register(student)
     is_student_attending_course(student, course)
     extract_student_info(student, info)
+    build_aggregates(row)
+    add_grade_to_aggregates(key, course, grade)
+    get_course_aggregates(course, status=None)
+    get_failing_students(course, status='Active')
     new_student(*args)
     update_student_info(student, course=None, grade=None)
     """
 
-    def __init__(self):
-        super().__init__()
+    fieldnames = ['First name', 'Last name', 'Date of birth', 'Classroom',
+                  'Courses', 'Status']
+    key_fields = ['First name', 'Last name']
+    list_fields = ['Courses']
+    row_type = RegisterRow.create_type('StudentRow', fieldnames, list_fields)
+    filter_fields = {'status': 'Status', 'classroom': 'Classroom',
+                     'course': 'Courses'}
+
+    def __init__(self, backend='csv', snapshot=False, workers=None):
+        super().__init__(backend, snapshot, workers)
         self.file = 'students.csv'
+        self.storage = self.create_storage()
 
+    @staticmethod
+    def get_student_key(student):
+        """Get the key of a student in the Student Register index based on
+        student's full name."""
+        first_name, last_name = student.split(' ', 1)
+        return first_name, last_name
+
+    @profiled
     def is_student_in_register(self, student):
         """Check if a student is in the Student Register."""
-        first_name = student.split(' ')[0]
-        last_name = student.split(' ')[1]
-        rows = self.read_rows_in_register()
-        for row in rows:
-            if last_name in row.get('Last name'):
-                if first_name in row.get('First name'):
-                    return True
-                else:
-                    continue
+        if self.find_row_index(self.get_student_key(student)) is not None:
+            return True
 
     def is_student_attending_course(self, student, course):
         """Check if a student attends a specified course."""
-        first_name = student.split(' ')[0]
-        last_name = student.split(' ')[1]
-        rows = self.read_rows_in_register()
-        for row in rows:
-            if last_name in row.get('Last name'):
-                if first_name in row.get('First name'):
-                    courses = row.get('Courses')
-                    for course_item in courses:
-                        if course.course_name in course_item.keys():
-                            return True
-                        else:
-                            continue
+        row = self.find_row(self.get_student_key(student))
+        if row is not None:
+            courses = row.get('Courses')
+            for course_item in courses:
+                if course.course_name in course_item.keys():
+                    return True
+                else:
+                    continue
 
     def extract_student_info(self, student, info):
         """Extract a specified kind of information from the Student
         Register."""
-        fieldnames = ['First name', 'Last name', 'Date of birth',
-                      'Classroom', 'Courses', 'Status']
-        searched_index = fieldnames.index(info)
-        first_name = student.split(' ')[0]
-        last_name = student.split(' ')[1]
-        rows = self.read_rows_in_register()
-        for row in rows:
-            if last_name in row.get('Last name'):
-                if first_name in row.get('First name'):
-                    searched_info = row.get(fieldnames[searched_index])
-                    return searched_info
-                else:
-                    continue
+        row = self.find_row(self.get_student_key(student))
+        if row is not None and info in self.fieldnames:
+            searched_info = row.get(info)
+            return searched_info
 
+    def build_aggregates(self, row):
+        """Build the grade aggregates of an entry: a GradeAggregate for each
+        of the student's courses, keyed by the course's name."""
+        aggregates = {}
+        for course_item in row.get('Courses') or []:
+            for course_name, grades in course_item.items():
+                aggregates[course_name] = GradeAggregate.from_grades(grades)
+        return aggregates
+
+    def add_grade_to_aggregates(self, key, course, grade):
+        """Add a new grade in a course to the cached grade aggregates of a
+        student (key) and return the updated aggregates of the student, or
+        None if the aggregates have not been built. The cached aggregates
+        are shared with other registers, so they are copied, not changed."""
+        entry = self.cache.find_entry(self)
+        view = None if entry is None else \
+            entry.get('views', {}).get('build_aggregates')
+        if view is None or key not in view:
+            return None
+        aggregates = dict(view[key])
+        aggregate = aggregates.get(course, GradeAggregate())
+        aggregates[course] = GradeAggregate(aggregate.total, aggregate.count)
+        aggregates[course].add(grade)
+        return aggregates
+
+    @profiled
+    def get_course_aggregates(self, course, status=None):
+        """Get the grade aggregates of the students enrolled in a course,
+        keyed by students' full names. If a status is given, only students
+        of that status are included. The aggregates are kept in the register
+        cache (see Register.get_view), so the students' courses are not
+        decoded again."""
+        aggregates = {}
+        if self.storage.indexed:
+            for first_name, last_name, student_status, total, count in \
+                    self.storage.load_course_aggregates(course):
+                if status is None or student_status == status:
+                    aggregates[f'{first_name} {last_name}'] = \
+                        GradeAggregate(total, count)
+            return aggregates
+        view = self.get_view('build_aggregates')
+        entry = self.cache.get_entry(self)
+        rows = entry.get('rows')
+        index = entry.get('index')
+        for key, student_aggregates in view.items():
+            aggregate = student_aggregates.get(course)
+            if aggregate is None:
+                continue
+            if status is None or rows[index[key]].get('Status') == status:
+                aggregates[' '.join(key)] = aggregate
+        return aggregates
+
+    def get_failing_students(self, course, status='Active'):
+        """Get the names of the students who are currently failing a course:
+        their final grade calculated from the grades received so far is
+        below 3."""
+        return [student for student, aggregate in
+                self.get_course_aggregates(course, status).items()
+                if aggregate.count and not aggregate.passed]
+
+    @profiled
     def new_student(self, *args):
         """Add a new student into the Student Register."""
         #  Create a new Student instance
         new_student_item = Student(*args)
         # Write new student's data into the Student Register
-        with open(self.file, 'a', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file, delimiter=';')
-            first_name = new_student_item.first_name
-            last_name = new_student_item.last_name
-            date_of_birth = new_student_item.birth_date
-            classroom = new_student_item.classroom
-            courses = new_student_item.courses
-            status = new_student_item.status
-            writer.writerow([first_name, last_name, date_of_birth, classroom,
-                             courses, status])
+        new_row = {
+                   'First name': new_student_item.first_name,
+                   'Last name': new_student_item.last_name,
+                   'Date of birth': str(new_student_item.birth_date),
+                   'Classroom': new_student_item.classroom.name,
+                   'Courses': new_student_item.courses,
+                   'Status': new_student_item.status
+                   }
+        self.append_row_to_register(new_row)
         print(f'New student {new_student_item.fullname} has been added to the '
               f'Register')
 
+    @profiled
+    @with_register_lock
     def update_student_info(self, student, course=None, grade=None):
         """Update information about a student in the Student Register. This
         method updates information if the student gets a grade, starts a new
         course or changes their status to 'Graduate' or 'Inactive'."""
-        rows = self.read_rows_in_register()
-        with open(self.file, 'r+', newline='', encoding='utf-8') as file:
-            fieldnames = ['First name', 'Last name', 'Date of birth',
-                          'Classroom', 'Courses', 'Status']
-            writer = csv.DictWriter(file, delimiter=';', fieldnames=fieldnames)
-            # Find the student's name in the Student Register and update the
-            # entry index
-            row_index = None
-            for row in rows:
-                if student.last_name in row.get('Last name'):
-                    if student.first_name in row.get('First name'):
-                        row_index = rows.index(row)
-            # Use found entry index to update the list of entries
-            if row_index is not None:
-                entry = rows[row_index]
-                first_name = entry.get('First name')
-                last_name = entry.get('Last name')
-                birth_date = entry.get('Date of birth')
-                classroom = entry.get('Classroom')
-                courses = entry.get('Courses')
-                status = student.status
-                # Update student's grades for a specific course if provided
-                # with a new grade
-                if grade:
-                    for item in courses:
-                        grades = item.get(course.course_name)
-                        if course.course_name in item.keys():
-                            grades.append(grade)
-                # Update student's courses list if they started a new course
-                if not grade:
-                    if student and course:
-                        new_course = {course.course_name: []}
-                        courses.append(new_course)
-                # Create an updated row
-                new_row = {
-                           'First name': first_name,
-                           'Last name': last_name,
-                           'Date of birth': birth_date,
-                           'Classroom': classroom,
-                           'Courses': courses,
-                           'Status': status
-                           }
-                # Swap the old row with the updated one
-                rows.remove(rows[row_index])
-                rows.insert(row_index, new_row)
-                # Reset the whole Student Register
-                file.seek(0)
-                file.truncate(0)
-                # Overwrite the Student Register with updated list of entries
-                writer.writeheader()
-                writer.writerows(rows)
+        # Find the student's name in the Student Register using the register
+        # index
+        row_index = self.find_row_index((student.first_name,
+                                         student.last_name))
+        # Use found entry index to update the list of entries
+        if row_index is not None:
+            entry = self.get_row(row_index)
+            first_name = entry.get('First name')
+            last_name = entry.get('Last name')
+            birth_date = entry.get('Date of birth')
+            classroom = entry.get('Classroom')
+            courses = entry.get('Courses')
+            status = student.status
+            # Update student's grades for a specific course if provided
+            # with a new grade, and the student's aggregates with it
+            view_changes = None
+            if grade:
+                for item in courses:
+                    grades = item.get(course.course_name)
+                    if course.course_name in item.keys():
+                        grades.append(grade)
+                aggregates = self.add_grade_to_aggregates(
+                    (first_name, last_name), course.course_name, grade)
+                if aggregates is not None:
+                    view_changes = {'build_aggregates': aggregates}
+            # Update student's courses list if they started a new course
+            if not grade:
+                if student and course:
+                    new_course = {course.course_name: []}
+                    courses.append(new_course)
+            # Create an updated row
+            new_row = {
+                       'First name': first_name,
+                       'Last name': last_name,
+                       'Date of birth': birth_date,
+                       'Classroom': classroom,
+                       'Courses': courses,
+                       'Status': status
+                       }
+            # Swap the old row with the updated one in the register
+            self.update_row_in_register(row_index, new_row, view_changes)
 
 
 class CourseRegister(Register):
@@ -439,155 +2980,244 @@ class CourseRegister(Register):
         The name of the register
     file : str
         The name of the file containing the register, overrides parent class
+    status_changes : dict
+        The students moved out of 'Students' in batch mode but not yet in the
+        lists of their entries, keyed by the position of the entry. Each
+        holds the list ('Graduates' or 'Dropout') every student is moved to
 
     Methods:
     -------------
-    get course_from_register(course)
+    get_row(row_index)
+    begin_batch
+    prepare_batch
+    discard_batch
+    get_course_from_register(course, with_students=True)
     extract_course_info(course, info)
+    get_student_status(course, student)
+    count_passed_courses(student, courses)
     new_course(course)
     add_student_to_course(student, course)
     change_student_status(course, student, action)
+    stage_status_change(row_index, course, student, status)
+    apply_status_changes(row_index=None)
     """
 
-    def __init__(self):
-        super().__init__()
+    fieldnames = ['Course name', 'Grades to pass', 'Students', 'Graduates',
+                  'Dropout']
+    key_fields = ['Course name']
+    list_fields = ['Students', 'Graduates', 'Dropout']
+    row_type = RegisterRow.create_type('CourseRow', fieldnames, list_fields)
+    filter_fields = {'course': 'Course name', 'student': 'Students'}
+    roster_fields = ['Students', 'Graduates', 'Dropout']
+
+    def __init__(self, backend='csv', snapshot=False, workers=None):
+        super().__init__(backend, snapshot, workers)
         self.file = 'courses.csv'
+        self.storage = self.create_storage()
+        self.status_changes = {}
 
-    def get_course_from_register(self, course):
-        """Get a Course instance based on the Course Register."""
-        rows = self.read_rows_in_register()
-        for row in rows:
-            if course in row.get('Course name'):
-                course_name = row.get('Course name')
-                grade_number = row.get('Grades to pass')
-                students = row.get('Students')
-                graduates = row.get('Graduates')
-                dropout = row.get('Dropout')
-                course = Course(course_name, grade_number, students,
-                                graduates, dropout)
-                return course
-            else:
-                continue
+    def get_row(self, row_index):
+        """Get a copy of the entry at a given position in the register, with
+        the status changes staged for it in batch mode applied first."""
+        if row_index in self.status_changes:
+            self.apply_status_changes(row_index)
+        return super().get_row(row_index)
+
+    def begin_batch(self):
+        """Start batch mode with no status changes staged."""
+        self.status_changes = {}
+        super().begin_batch()
+
+    def prepare_batch(self):
+        """Apply the status changes staged in batch mode and prepare writing
+        all changes."""
+        self.apply_status_changes()
+        return super().prepare_batch()
+
+    def discard_batch(self):
+        """Drop the status changes staged in batch mode and all other
+        changes."""
+        self.status_changes = {}
+        super().discard_batch()
+
+    @profiled
+    def get_course_from_register(self, course, with_students=True):
+        """Get a Course instance based on the Course Register. Without
+        its students (with_students False) the lists of the entry are not
+        decoded, which is enough for giving grades: students are looked up
+        in the rosters and moved by change_student_status."""
+        row_index = self.find_row_index(course)
+        if row_index is None:
+            return None
+        if not with_students:
+            # Staged status changes only touch the lists of the entry, so
+            # they are not applied here
+            row = super().get_row(row_index)
+            return Course(row.get('Course name'), row.get('Grades to pass'))
+        row = self.get_row(row_index)
+        course_name = row.get('Course name')
+        grade_number = row.get('Grades to pass')
+        students = row.get('Students')
+        graduates = row.get('Graduates')
+        dropout = row.get('Dropout')
+        course = Course(course_name, grade_number, students, graduates,
+                        dropout)
+        return course
 
     def extract_course_info(self, course, info):
         """Extract a specified kind of information from the Course Register."""
-        fieldnames = ['Course name', 'Grades to pass', 'Students', 'Graduates',
-                      'Dropout']
-        searched_index = fieldnames.index(info)
-        rows = self.read_rows_in_register()
-        for row in rows:
-            if course in row.get('Course name'):
-                searched_info = row.get(fieldnames[searched_index])
-                if searched_index in [2, 3, 4]:
-                    searched_info = [] if searched_info is None else \
-                        searched_info
-                return searched_info
-            else:
-                continue
+        row = self.find_row(course)
+        if row is not None and info in self.fieldnames:
+            searched_info = row.get(info)
+            if info in ['Students', 'Graduates', 'Dropout']:
+                searched_info = [] if searched_info is None else \
+                    searched_info
+            return searched_info
+
+    def get_student_status(self, course, student):
+        """Get the status of a student in a course: 'Students' if the student
+        attends the course, 'Graduates' if they have passed it, 'Dropout' if
+        they have failed it, or None."""
+        roster = self.get_roster(course)
+        if roster is not None:
+            for status in self.roster_fields:
+                if student in roster[status]:
+                    return status
 
+    @profiled
+    def count_passed_courses(self, student, courses):
+        """Count the courses from a list which a student has passed."""
+        if self.storage.indexed or self.get_snapshot() is not None:
+            return sum(1 for course in courses
+                       if self.get_student_status(course, student) ==
+                       'Graduates')
+        rosters = self.get_rosters()
+        return sum(1 for course in courses if course in rosters and
+                   student in rosters[course]['Graduates'])
+
+    @profiled
     def new_course(self, course):
         """Add a new course into the Course Register."""
-        with open(self.file, 'a', encoding='utf-8', newline='') as file:
-            writer = csv.writer(file, delimiter=';')
-            course_name = course.course_name
-            grades_number = course.grades_number
-            students = course.attending_students
-            graduates = course.graduates
-            dropout = course.dropouts
-            writer.writerow([course_name, grades_number, students,
-                             graduates, dropout])
+        new_row = {
+                   'Course name': course.course_name,
+                   'Grades to pass': str(course.grades_number),
+                   'Students': course.attending_students,
+                   'Graduates': course.graduates,
+                   'Dropout': course.dropouts
+                   }
+        self.append_row_to_register(new_row)
 
+    @profiled
+    @with_register_lock
     def add_student_to_course(self, student, course):
         """Add a new student to a specified course in the Course Register."""
-        rows = self.read_rows_in_register()
-        with open(self.file, 'r+', newline='', encoding='utf-8') as file:
-            fieldnames = ['Course name', 'Grades to pass', 'Students',
-                          'Graduates', 'Dropout']
-            writer = csv.DictWriter(file, delimiter=';', fieldnames=fieldnames)
-            # Find an appropriate course in the Course Register and update its
-            # entry index
-            row_index = None
-            for row in rows:
-                course_name = row.get('Course name')
-                if course_name == course.course_name:
-                    row_index = rows.index(row)
-                else:
-                    continue
-            # Use found entry index to update the list of entries
-            if row_index is not None:
-                entry = rows[row_index]
-                course_name = entry.get('Course name')
-                grades_number = entry.get('Grades to pass')
-                students = entry.get('Students')
-                graduates = entry.get('Graduates')
-                dropout = entry.get('Dropout')
-                students.append(student.fullname)
-                # Create an updated row
-                new_row = {
-                           'Course name': course_name,
-                           'Grades to pass': grades_number,
-                           'Students': students,
-                           'Graduates': graduates,
-                           'Dropout': dropout
-                           }
-                # Swap the old row with the updated one
-                rows.remove(rows[row_index])
-                rows.insert(row_index, new_row)
-                # Reset the whole Course Register
-                file.seek(0)
-                file.truncate(0)
-                # Overwrite the Course Register with updated list of entries
-                writer.writeheader()
-                writer.writerows(rows)
+        # Find an appropriate course in the Course Register using the register
+        # index
+        row_index = self.find_row_index(course.course_name)
+        # Use found entry index to update the list of entries
+        if row_index is not None:
+            entry = self.get_row(row_index)
+            course_name = entry.get('Course name')
+            grades_number = entry.get('Grades to pass')
+            students = entry.get('Students')
+            graduates = entry.get('Graduates')
+            dropout = entry.get('Dropout')
+            students.append(student.fullname)
+            # Create an updated row
+            new_row = {
+                       'Course name': course_name,
+                       'Grades to pass': grades_number,
+                       'Students': students,
+                       'Graduates': graduates,
+                       'Dropout': dropout
+                       }
+            # Swap the old row with the updated one in the register
+            self.update_row_in_register(row_index, new_row)
 
+    @profiled
+    @with_register_lock
     def change_student_status(self, course, student, action):
         """Change student's status if student has passed or failed a course.
         In the Course Register student's name is moved from 'Students' to
-        either 'Graduates' or 'Dropout'."""
-        rows = self.read_rows_in_register()
-        with open(self.file, 'r+', newline='', encoding='utf-8') as file:
-            fieldnames = ['Course name', 'Grades to pass', 'Students',
-                          'Graduates', 'Dropout']
-            writer = csv.DictWriter(file, delimiter=';', fieldnames=fieldnames)
-            # Find appropriate course in Course Register and update its
-            # entry index
-            row_index = None
-            for row in rows:
-                course_name = row.get('Course name')
-                if course_name == course.course_name:
-                    row_index = rows.index(row)
+        either 'Graduates' or 'Dropout'. In batch mode the move is staged
+        (see stage_status_change)."""
+        # Find appropriate course in Course Register using the register index
+        row_index = self.find_row_index(course.course_name)
+        if row_index is not None and self.batch and \
+                not self.storage.indexed:
+            status = 'Graduates' if action == 'Graduate' else 'Dropout'
+            self.stage_status_change(row_index, course.course_name,
+                                     student.fullname, status)
+        # Use found entry index to update entry
+        elif row_index is not None:
+            entry = self.get_row(row_index)
+            course_name = entry.get('Course name')
+            grades_number = entry.get('Grades to pass')
+            students = entry.get('Students')
+            students.remove(student.fullname)
+            # Move student's info into appropriate list
+            graduates = entry.get('Graduates')
+            dropout = entry.get('Dropout')
+            if action == 'Graduate':
+                graduates.append(student.fullname)
+            elif action == 'Drop':
+                dropout.append(student.fullname)
+            new_row = {
+                       'Course name': course_name,
+                       'Grades to pass': grades_number,
+                       'Students': students,
+                       'Graduates': graduates,
+                       'Dropout': dropout
+                       }
+            # Swap the old row with the updated one in the register
+            self.update_row_in_register(row_index, new_row)
+
+    def stage_status_change(self, row_index, course, student, status):
+        """Stage moving a student from 'Students' to another list (status)
+        of the entry of a course at a given position in batch mode. The move
+        shows in the course's roster at once, while the lists of the entry
+        are rebuilt and packed only once, when the entry is read or the batch
+        is prepared (see apply_status_changes)."""
+        # A register looked up in its snapshot is loaded by the first change
+        # of the batch
+        self.cache.get_entry(self)
+        rosters = self.get_rosters()
+        moves = self.status_changes.get(row_index)
+        if moves is None:
+            moves = self.status_changes[row_index] = {}
+            # The batch's copy of the roster is changed in place until the
+            # moves are applied
+            rosters[course] = {field: set(names)
+                               for field, names in rosters[course].items()}
+        rosters[course]['Students'].discard(student)
+        rosters[course][status].add(student)
+        moves[student] = status
+
+    @with_register_lock
+    def apply_status_changes(self, row_index=None):
+        """Move the students staged by stage_status_change into the lists
+        of their entries, of all entries or only of the entry at a given
+        position."""
+        row_indexes = list(self.status_changes) if row_index is None \
+            else [row_index]
+        for row_index in row_indexes:
+            moves = self.status_changes.pop(row_index)
+            entry = super().get_row(row_index)
+            lists = {field: entry.get(field) for field in self.roster_fields}
+            # Each student is removed once, like list.remove does
+            moved = set(moves)
+            students = []
+            for name in lists['Students']:
+                if name in moved:
+                    moved.discard(name)
                 else:
-                    continue
-            # Use found entry index to update entry
-            if row_index is not None:
-                entry = rows[row_index]
-                course_name = entry.get('Course name')
-                grades_number = entry.get('Grades to pass')
-                students = entry.get('Students')
-                students.remove(student.fullname)
-                # Move student's info into appropriate list
-                graduates = entry.get('Graduates')
-                dropout = entry.get('Dropout')
-                if action == 'Graduate':
-                    graduates.append(student.fullname)
-                elif action == 'Drop':
-                    dropout.append(student.fullname)
-                new_row = {
-                           'Course name': course_name,
-                           'Grades to pass': grades_number,
-                           'Students': students,
-                           'Graduates': graduates,
-                           'Dropout': dropout
-                           }
-                # Swap old row with updated one
-                rows.remove(rows[row_index])
-                rows.insert(row_index, new_row)
-                # Reset whole Course Register
-                file.seek(0)
-                file.truncate(0)
-                # Overwrite Course Register with updated list of entries
-                writer.writeheader()
-                writer.writerows(rows)
+                    students.append(name)
+            lists['Students'] = students
+            for student, status in moves.items():
+                lists[status].append(student)
+            for field, names in lists.items():
+                entry[field] = names
+            self.update_row_in_register(row_index, entry)
 
 
 class Classroom:
@@ -618,6 +3248,9 @@ class Classroom:
     drop_out_student(student)
     """
 
+    __slots__ = ('start_year', 'end_year', 'name', 'years_num',
+                 'student_list', 'graduates', 'dropout_list')
+
     def __init__(self, start_year, end_year, students=None, graduates=None,
                  dropout=None):
         self.start_year = int(start_year)
@@ -691,12 +3324,17 @@ class Student:
     drop_out
     """
 
+    __slots__ = ('first_name', 'last_name', 'fullname', 'birth_date',
+                 'classroom', 'status', 'class_register', 'course_register',
+                 'student_register', 'courses')
+
     def __init__(self, first_name, last_name, birth_date, classroom, course,
                  class_register, course_register, student_register,
                  status='Active'):
         self.first_name = str(first_name)
         self.last_name = str(last_name)
         self.fullname = f'{first_name} {last_name}'
+        import datetime
         # Convert birth_date (yyyy-mm-dd) to datetime Date class
         date = birth_date.split('-')
         self.birth_date = datetime.date(int(date[0]), int(date[1]),
@@ -822,19 +3460,13 @@ class Student:
     def calc_final_grade(grades):
         """Calculate the final grade if the course's graduation conditions are
         met."""
-        grades = [int(grade) for grade in grades]
-        final_grade = round(sum(grades) / len(grades))
-        return final_grade
+        return GradeAggregate.from_grades(grades).final_grade
 
     def check_passed_courses(self, courses):
         """Check if the student has passed the required number of courses to
         graduate from their studies."""
-        counter = 0
-        for course in courses:
-            graduates = self.course_register.extract_course_info(course,
-                                                                 'Graduates')
-            if self.fullname in graduates:
-                counter += 1
+        counter = self.course_register.count_passed_courses(self.fullname,
+                                                            courses)
         if counter >= 3:
             return True
         else:
@@ -889,6 +3521,9 @@ class Course:
     drop_out_student(student)
     """
 
+    __slots__ = ('course_name', 'grades_number', 'attending_students',
+                 'graduates', 'dropouts')
+
     def __init__(self, course_name, grades_number, students=None,
                  graduates=None, dropout=None):
         self.course_name = course_name
@@ -908,20 +3543,401 @@ class Course:
     def pass_course(self, student, final_grade):
         """Remove a student from students' list and then append them to
         graduates' list of Course instance."""
-        for student_item in self.attending_students:
-            if student_item == student.fullname:
-                self.attending_students.remove(student_item)
+        self.attending_students[:] = [student_item for student_item
+                                      in self.attending_students
+                                      if student_item != student.fullname]
         self.graduates.append({student.fullname: final_grade})
 
     def drop_out_student(self, student):
         """Remove a student from students' list and then append them to
         dropouts' list of Course instance."""
-        for student_item in self.attending_students:
-            if student_item == student.fullname:
-                self.attending_students.remove(student_item)
+        self.attending_students[:] = [student_item for student_item
+                                      in self.attending_students
+                                      if student_item != student.fullname]
         self.dropouts.append(student.fullname)
 
 
+class GradeAggregate:
+    """
+    A class representing the aggregate of a student's grades in a course.
+
+    Attributes:
+    -------------
+    total : int
+        The sum of the grades
+    count : int
+        The number of the grades
+    final_grade : int
+        The final grade calculated from the grades, None if there are no
+        grades
+    passed : bool
+        Whether the final grade is a passing one (3 or higher)
+
+    Methods:
+    -------------
+    from_grades(grades)
+    add(grade)
+    """
+
+    __slots__ = ('total', 'count')
+
+    def __init__(self, total=0, count=0):
+        self.total = total
+        self.count = count
+
+    def __repr__(self):
+        return f'GradeAggregate(total={self.total}, count={self.count})'
+
+    @classmethod
+    def from_grades(cls, grades):
+        """Create an aggregate of a list of grades."""
+        return cls(sum(int(grade) for grade in grades), len(grades))
+
+    def add(self, grade):
+        """Add a new grade to the aggregate."""
+        self.total += int(grade)
+        self.count += 1
+
+    @property
+    def final_grade(self):
+        """The final grade: the mean of the grades, rounded."""
+        if not self.count:
+            return None
+        return round(self.total / self.count)
+
+    @property
+    def passed(self):
+        """Whether the final grade is 3 or higher."""
+        return self.count > 0 and self.final_grade >= 3
+
+
+class BulkValidator:
+    """
+    A class representing a read-only snapshot of the registers taken to check
+    the entries of a bulk operation before any of them is applied: new
+    students of a roster ('roster'), students appended to courses
+    ('courses') or grades ('grades'). The snapshot holds the courses, the
+    classrooms and the students named in the entries, which is all the checks
+    of 'new_student', 'append_to_course' and 'give_grade' need.
+
+    The entries of a student are checked in order, each against the
+    student's state changed by the accepted entries before it, as the bulk
+    operations apply them: a grade completing a course may make the student
+    pass or fail it, graduate or drop out. The entries of different students
+    do not depend on each other, so groups of students can be checked in
+    separate processes, each with a snapshot of its own students only (see
+    select). The courses of the students are kept encoded in the snapshot
+    and decoded when the students' entries are checked.
+
+    Attributes:
+    -------------
+    kind : str
+        The kind of the entries: 'roster', 'courses' or 'grades'
+    courses : dict
+        The number of grades needed to pass each course, keyed by the
+        course's name
+    classrooms : frozenset
+        The names of the registered classrooms
+    students : dict
+        The students named in the entries keyed by their full names: None
+        for students not registered, otherwise a tuple of the student's
+        status, classroom and encoded courses, the pairs of a classroom and
+        a classroom's list (Students, Graduates or Dropout) naming the
+        student and the courses the student has passed
+    fieldnames : dict
+        The columns of the entries of each kind (class attribute)
+
+    Methods:
+    -------------
+    create(kind, entries, class_reg, course_reg, student_reg)
+    get_fullname(values)
+    select(fullnames)
+    get_state(fullname)
+    check(entries)
+    check_roster_entry(state, values)
+    check_course_entry(state, values)
+    check_grade_entry(state, values)
+    """
+
+    fieldnames = {
+                  'roster': ['First name', 'Last name', 'Date of birth',
+                             'Classroom', 'Course name'],
+                  'courses': ['First name', 'Last name', 'Course name'],
+                  'grades': ['First name', 'Last name', 'Course name',
+                             'Grade']
+                  }
+
+    def __init__(self, kind, courses, classrooms, students):
+        self.kind = kind
+        self.courses = courses
+        self.classrooms = classrooms
+        self.students = students
+
+    @classmethod
+    @profiled
+    def create(cls, kind, entries, class_reg, course_reg, student_reg):
+        """Take a snapshot of the registers for checking a list of entries
+        (see read_bulk_file). The registers are locked while the snapshot is
+        taken, so it is consistent across the registers."""
+        registers = sorted([class_reg, course_reg, student_reg],
+                           key=lambda register: register.storage.location)
+        with contextlib.ExitStack() as stack:
+            for register in registers:
+                stack.enter_context(register.get_lock())
+            courses = {}
+            for name in {values[4] if kind == 'roster' else values[2]
+                         for _, values in entries}:
+                row = course_reg.find_row(name)
+                if row is not None:
+                    courses[name] = int(row.get('Grades to pass'))
+            # The classrooms whose lists are looked into for each student:
+            # the classrooms of the roster or the student's own classroom
+            looked_up = {}
+            rows = {}
+            for _, values in entries:
+                fullname = cls.get_fullname(values)
+                if fullname not in rows:
+                    rows[fullname] = student_reg.find_row(
+                        student_reg.get_student_key(fullname))
+                    looked_up[fullname] = set()
+                    if kind == 'grades' and rows[fullname] is not None:
+                        looked_up[fullname].add(
+                            rows[fullname].get('Classroom'))
+                if kind == 'roster':
+                    looked_up[fullname].add(values[3])
+            classroom_lists = {}
+            for classroom in set().union(*looked_up.values()):
+                row = class_reg.find_row(classroom)
+                if row is not None:
+                    classroom_lists[classroom] = \
+                        {field: frozenset(row.get(field) or [])
+                         for field in ['Students', 'Graduates', 'Dropout']}
+            passed = {}
+            if kind == 'grades':
+                for row in course_reg.iter_rows():
+                    for name in row.get('Graduates') or []:
+                        if name in rows:
+                            passed.setdefault(name, []).append(
+                                row.get('Course name'))
+        students = {}
+        for fullname, row in rows.items():
+            if row is None:
+                students[fullname] = None
+                continue
+            listed = tuple((classroom, field)
+                           for classroom in looked_up[fullname]
+                           if classroom in classroom_lists
+                           for field, names
+                           in classroom_lists[classroom].items()
+                           if fullname in names)
+            students[fullname] = (row.get('Status'), row.get('Classroom'),
+                                  student_reg.serialize_row(row)['Courses'],
+                                  listed, tuple(passed.get(fullname, ())))
+        classrooms = frozenset(classroom for classroom in classroom_lists
+                               if kind == 'roster')
+        return cls(kind, courses, classrooms, students)
+
+    @staticmethod
+    def get_fullname(values):
+        """Get the full name of the student named in an entry."""
+        return f'{values[0]} {values[1]}'
+
+    def select(self, fullnames):
+        """Return a snapshot holding given students only."""
+        return self.__class__(self.kind, self.courses, self.classrooms,
+                              {fullname: self.students[fullname]
+                               for fullname in fullnames})
+
+    def get_state(self, fullname):
+        """Get the state of a student in the snapshot, which the accepted
+        entries of the student change: whether the student is registered,
+        their status, classroom, courses with grades, the classrooms' lists
+        naming them and the courses they have passed."""
+        student = self.students[fullname]
+        if student is None:
+            return {'registered': False, 'status': None, 'classroom': None,
+                    'courses': {}, 'listed': set(), 'passed': set()}
+        status, classroom, courses, listed, passed = student
+        return {
+                'registered': True,
+                'status': status,
+                'classroom': classroom,
+                'courses': {course_name: grades
+                            for course_item in decode_list(courses)
+                            for course_name, grades in course_item.items()}
+                if courses else {},
+                'listed': set(listed),
+                'passed': set(passed)
+                }
+
+    def check(self, entries):
+        """Check a list of entries in order. Return a list of tuples of the
+        line number of each entry and a message explaining why it is
+        rejected, or None if it is accepted."""
+        check_entry = {
+                       'roster': self.check_roster_entry,
+                       'courses': self.check_course_entry,
+                       'grades': self.check_grade_entry
+                       }[self.kind]
+        states = {}
+        results = []
+        for line_number, values in entries:
+            fullname = self.get_fullname(values)
+            state = states.get(fullname)
+            if state is None:
+                state = states[fullname] = self.get_state(fullname)
+            results.append((line_number, check_entry(state, values)))
+        return results
+
+    def check_roster_entry(self, state, values):
+        """Check a new student of a roster, following the rules of
+        'new_students_bulk'."""
+        import datetime
+        firstname, lastname, birthdate, classroom, course = values
+        if classroom not in self.classrooms:
+            return f'Classroom {classroom} does not exist. Create a new ' \
+                   f'classroom first!'
+        if course not in self.courses:
+            return f'Course {course} does not exist. Create new course ' \
+                   f'first!'
+        try:
+            datetime.date.fromisoformat(birthdate)
+        except ValueError:
+            return f'Invalid date of birth {birthdate}, expected yyyy-mm-dd'
+        if state['registered'] and (classroom, 'Students') in state['listed']:
+            return f'Student {firstname} {lastname} is already registered ' \
+                   f'in this classroom!'
+        # The new entry of the student is found instead of the earlier ones
+        state.update({
+                      'registered': True,
+                      'status': 'Active',
+                      'classroom': classroom,
+                      'courses': {course: []}
+                      })
+        state['listed'].add((classroom, 'Students'))
+        return None
+
+    def check_course_entry(self, state, values):
+        """Check a student appended to a course, following the rules of
+        'append_to_course'."""
+        firstname, lastname, course = values
+        student_name = f'{firstname} {lastname}'
+        if not state['registered']:
+            return f'Student {student_name} has not been registered.'
+        if state['status'] in ['Inactive', 'Graduate']:
+            return f'{student_name} is not an Active student'
+        if course not in self.courses:
+            return f'Course {course} does not exist. Create a new course ' \
+                   f'first!'
+        if course in state['courses']:
+            return f'Student {student_name} is already attending {course}'
+        if len(state['courses']) >= 3:
+            return f'Student {student_name} has reached a maximum number ' \
+                   f'of courses in this classroom'
+        state['courses'][course] = []
+        return None
+
+    def check_grade_entry(self, state, values):
+        """Check a grade, following the rules of 'give_grades_bulk', and
+        pass, fail, graduate or drop out the student as the grade does."""
+        firstname, lastname, course, grade = values
+        student_name = f'{firstname} {lastname}'
+        if grade not in ['2', '3', '4', '5']:
+            return f'Invalid grade {grade}, available grades: 2, 3, 4, 5'
+        if course not in self.courses:
+            return f'Course {course} does not exist. Create a new course ' \
+                   f'first!'
+        if not state['registered']:
+            return f'Student {student_name} has not been registered.'
+        if course not in state['courses']:
+            return f'{student_name} does not attend {course}'
+        if state['status'] in ['Inactive', 'Graduate']:
+            return f'{student_name} is not on active students list for ' \
+                   f'{course}'
+        grades = state['courses'][course]
+        if len(grades) >= self.courses[course]:
+            return f'Cannot assign grade for student {student_name} for ' \
+                   f'course {course}'
+        state['courses'][course] = grades = grades + [grade]
+        classroom = state['classroom']
+        listed = state['listed']
+        if len(grades) == self.courses[course]:
+            if GradeAggregate.from_grades(grades).final_grade >= 3:
+                state['passed'].add(course)
+            else:
+                # The student is moved to the classroom's dropouts only if
+                # they are on its list of active students
+                if (classroom, 'Students') in listed:
+                    listed.discard((classroom, 'Students'))
+                    listed.add((classroom, 'Dropout'))
+                if (classroom, 'Dropout') in listed:
+                    state['status'] = 'Inactive'
+        if state['status'] != 'Inactive' and len(state['courses']) == 3 and \
+                len(state['passed'].intersection(state['courses'])) >= 3:
+            if (classroom, 'Students') in listed:
+                listed.discard((classroom, 'Students'))
+                listed.add((classroom, 'Graduates'))
+            if (classroom, 'Graduates') in listed:
+                state['status'] = 'Graduate'
+        return None
+
+
+def read_bulk_file(file_name, fieldnames):
+    """Read entries of a bulk operation from a .csv file (delimited with ';'
+    and with a header row) or from a .jsonl file (one JSON object per line).
+    Return a list of tuples of the line number and the entry's values of
+    given fieldnames."""
+    entries = []
+    with open_file(file_name, 'r', newline='', encoding='utf-8') as file:
+        if file_name.endswith('.jsonl'):
+            for line_number, line in enumerate(file, start=1):
+                if line.strip():
+                    item = json.loads(line)
+                    entries.append((line_number, [str(item.get(field, ''))
+                                                  for field in fieldnames]))
+        else:
+            reader = csv.DictReader(file, delimiter=';')
+            for item in reader:
+                entries.append((reader.line_num, [item.get(field) or ''
+                                                  for field in fieldnames]))
+    return entries
+
+
+@profiled
+def print_register_func(register, columns, filters, limit, offset,
+                        output_format):
+    """A function handling 'print_register' option from the argument parser
+    in main(). Allows to print the entries of a register matching the
+    filters, page by page (limit, offset), with the chosen columns only
+    (comma-separated) and in the chosen output format."""
+    if columns is not None:
+        columns = [column.strip() for column in columns.split(',')]
+        for column in columns:
+            if column not in register.fieldnames:
+                print(f'Invalid column {column}, available columns: '
+                      f'{", ".join(register.fieldnames)}')
+                exit()
+    for name in filters:
+        if name not in register.filter_fields:
+            available = ', '.join('--' + name
+                                  for name in register.filter_fields)
+            print(f'--{name} cannot be used with {register.name}, available '
+                  f'filters: {available}')
+            exit()
+    if (limit is not None and limit < 0) or offset < 0:
+        print('--limit and --offset cannot be negative')
+        exit()
+    try:
+        register.print_register(columns, filters, limit, offset,
+                                output_format)
+    except BrokenPipeError:
+        # The output is read by a command which has stopped reading (for
+        # example head), so drop the rest of the output quietly
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+
+
+@profiled
 def new_classroom_func(class_reg, start_year, end_year):
     """A function handling 'new_classroom' option from the argument parser in
     main(). Allows to add a new classroom into the Classroom Register."""
@@ -938,34 +3954,46 @@ def new_classroom_func(class_reg, start_year, end_year):
         print(f'{new_classroom} has been added to register')
 
 
-def new_student_func(class_reg, course_reg, student_reg, firstname, lastname,
-                     birthdate, classroom, course):
-    """A function handling 'new_student' option from the argument parser in
-    main(). Allows to add a new student into the Student Register, assign them
-    to a classroom in the Classroom Register and their first course in the
-    Course Register."""
+def prepare_new_student(class_reg, course_reg, student_reg, firstname,
+                        lastname, classroom, course):
+    """Check if a new student can be registered in a classroom with their
+    first course and get Classroom and Course instances based on the
+    registers. Return the instances and None, or None, None and a message
+    explaining why the student cannot be registered."""
     fullname = f'{firstname} {lastname}'
     # Test if the prompted classroom exists in the register
     assigned_classroom = class_reg.get_classroom_from_register(classroom)
-    # Exit creating student if the assigned classroom does not exist
     if not assigned_classroom:
-        print(f'Classroom {classroom} does not exist. Create a new '
-              f'classroom first!')
-        exit()
+        return None, None, f'Classroom {classroom} does not exist. Create a ' \
+                           f'new classroom first!'
     # Test if the prompted course exists in the register
     first_course = course_reg.get_course_from_register(course)
-    # Exit creating student if the assigned course does not exist
     if not first_course:
-        print(f'Course {course} does not exist. Create new course '
-              f'first!')
-        exit()
+        return None, None, f'Course {course} does not exist. Create new ' \
+                           f'course first!'
 
     # Check if the student is already in the Student Register
     check_student = student_reg.is_student_in_register(fullname)
-    # If the student is registered exit program, else begin creation of a
-    # new student in the Student Register
     if check_student and fullname in assigned_classroom.student_list:
-        print(f'Student {fullname} is already registered in this classroom!')
+        return None, None, f'Student {fullname} is already registered in ' \
+                           f'this classroom!'
+    return assigned_classroom, first_course, None
+
+
+@profiled
+def new_student_func(class_reg, course_reg, student_reg, firstname, lastname,
+                     birthdate, classroom, course):
+    """A function handling 'new_student' option from the argument parser in
+    main(). Allows to add a new student into the Student Register, assign them
+    to a classroom in the Classroom Register and their first course in the
+    Course Register."""
+    assigned_classroom, first_course, message = \
+        prepare_new_student(class_reg, course_reg, student_reg, firstname,
+                            lastname, classroom, course)
+    # If the student cannot be registered exit program, else begin creation
+    # of a new student in the Student Register
+    if message:
+        print(message)
         exit()
     else:
         student_reg.new_student(firstname, lastname, birthdate,
@@ -973,6 +4001,61 @@ def new_student_func(class_reg, course_reg, student_reg, firstname, lastname,
                                 course_reg, student_reg)
 
 
+@profiled
+def new_students_bulk_func(class_reg, course_reg, student_reg, file_name):
+    """A function handling 'new_students_bulk' option from the argument parser
+    in main(). Allows to register many new students read from a roster file,
+    following the same rules as 'new_student'. Classrooms and courses are
+    validated once per name, students already registered (also earlier in
+    the roster) are skipped and each register is written once at the end."""
+    import datetime
+    fieldnames = ['First name', 'Last name', 'Date of birth', 'Classroom',
+                  'Course name']
+    entries = read_bulk_file(file_name, fieldnames)
+    with RegisterTransaction(class_reg, course_reg, student_reg):
+        # Validate each classroom and course of the roster only once
+        classrooms = {}
+        courses = {}
+        for _, (_, _, _, classroom, course) in entries:
+            if classroom not in classrooms:
+                classrooms[classroom] = \
+                    class_reg.find_row_index(classroom) is not None
+            if course not in courses:
+                courses[course] = \
+                    course_reg.find_row_index(course) is not None
+        added = 0
+        skipped = 0
+        for line_number, (firstname, lastname, birthdate, classroom,
+                          course) in entries:
+            message = None
+            if not classrooms.get(classroom):
+                message = f'Classroom {classroom} does not exist. Create a ' \
+                          f'new classroom first!'
+            elif not courses.get(course):
+                message = f'Course {course} does not exist. Create new ' \
+                          f'course first!'
+            else:
+                try:
+                    datetime.date.fromisoformat(birthdate)
+                except ValueError:
+                    message = f'Invalid date of birth {birthdate}, expected ' \
+                              f'yyyy-mm-dd'
+            if not message:
+                assigned_classroom, first_course, message = \
+                    prepare_new_student(class_reg, course_reg, student_reg,
+                                        firstname, lastname, classroom, course)
+            if message:
+                print(f'Line {line_number}: {message}')
+                skipped += 1
+                continue
+            student_reg.new_student(firstname, lastname, birthdate,
+                                    assigned_classroom, first_course,
+                                    class_reg, course_reg, student_reg)
+            added += 1
+    print(f'{added} students added, {skipped} entries skipped')
+
+
+@profiled
 def new_course_func(course_reg, course_name, grades_number):
     """A function handling 'new_course' option from the argument parser in
     main(). Allows to add a new course into the Course Register."""
@@ -987,6 +4070,7 @@ def new_course_func(course_reg, course_name, grades_number):
         print(f'{new_course} has been added to register')
 
 
+@profiled
 def append_to_course_func(class_reg, course_reg, student_reg, firstname,
                           lastname, course_name):
     """A function handling 'append_to_course' option from the argument parser
@@ -1050,64 +4134,552 @@ def append_to_course_func(class_reg, course_reg, student_reg, firstname,
             student_object.add_to_course(course_object)
 
 
+def prepare_grade(class_reg, course_reg, student_reg, firstname, lastname,
+                  course_name):
+    """Check if a registered student can be given a grade for a registered
+    course and create Student and Course instances based on the registers.
+    Return the instances and None, or None, None and a message explaining why
+    the grade cannot be given."""
+    student_name = f'{firstname} {lastname}'
+    # Check if the course exists
+    course_object = course_reg.get_course_from_register(course_name,
+                                                        with_students=False)
+    if not course_object:
+        return None, None, f'Course {course_name} does not exist. Create a ' \
+                           f'new course first!'
+
+    # Check if the student is registered
+    check_student = student_reg.is_student_in_register(student_name)
+    if not check_student:
+        return None, None, f'Student {student_name} has not been registered.'
+
+    # Check if the student attends the course
+    check_student_in_course = \
+        student_reg.is_student_attending_course(student_name, course_object)
+    if not check_student_in_course:
+        return None, None, f'{student_name} does not attend {course_name}'
+
+    # Create a Student instance based on the data from the Student Register
+    date_of_birth = student_reg.extract_student_info(student_name,
+                                                     'Date of birth')
+    classroom_name = student_reg.extract_student_info(student_name,
+                                                      'Classroom')
+    classroom = class_reg.get_classroom_from_register(classroom_name)
+    courses = student_reg.extract_student_info(student_name, 'Courses')
+    status = student_reg.extract_student_info(student_name, 'Status')
+    # Prevent students with status 'Inactive' or 'Graduate' from getting a
+    # grade
+    if status == 'Inactive' or status == 'Graduate':
+        return None, None, f'{student_name} is not on active students list ' \
+                           f'for {course_name}'
+    # Prevent from exceeding the number of grades assigned to the course
+    for course_item in courses:
+        grades = course_item.get(course_name)
+        if grades is not None and len(grades) >= course_object.grades_number:
+            return None, None, f'Cannot assign grade for student ' \
+                               f'{student_name} for course {course_name}'
+    student_object = Student(firstname, lastname, date_of_birth, classroom,
+                             courses, class_reg, course_reg, student_reg,
+                             status)
+    return student_object, course_object, None
+
+
+@profiled
 def give_grade_func(class_reg, course_reg, student_reg, firstname, lastname,
                     course_name, grade):
     """A function handling 'give_grade' option from the argument parser in
     main(). Allows to assign a grade to a registered student for a registered
     course that this student attends unless the student is of status other than
     'Active'."""
-    student_name = f'{firstname} {lastname}'
-    # Check if the course exists and exit program if it does not
-    course_object = course_reg.get_course_from_register(course_name)
-    if not course_object:
-        print(f'Course {course_name} does not exist. Create a new '
-              f'course first!')
+    student_object, course_object, message = \
+        prepare_grade(class_reg, course_reg, student_reg, firstname, lastname,
+                      course_name)
+    # Exit program if the grade cannot be given
+    if message:
+        print(message)
         exit()
+    # Execute Student instance's get_grade method
+    student_object.get_grade(course_object, grade)
 
-    # Check if the student is registered and exit program if they do not
-    check_student = student_reg.is_student_in_register(student_name)
-    if not check_student:
-        print(f'Student {student_name} has not been registered.')
-        exit()
 
-    # Check if the student attends the course and exit program if they do
-    # not
-    check_student_in_course = \
-        student_reg.is_student_attending_course(student_name, course_object)
-    if check_student_in_course:
-        # Create a Student instance based on the data from the Student
-        # Register
-        date_of_birth = student_reg.extract_student_info(student_name,
-                                                         'Date of birth')
-        classroom_name = student_reg.extract_student_info(student_name,
-                                                          'Classroom')
-        classroom = class_reg.get_classroom_from_register(classroom_name)
-        courses = student_reg.extract_student_info(student_name, 'Courses')
-        status = student_reg.extract_student_info(student_name, 'Status')
-        # Prevent students with status 'Inactive' or 'Graduate' from
-        # getting a grade by exiting thr program
-        if status == 'Inactive' or status == 'Graduate':
-            print(f'{student_name} is not on active students list for '
-                  f'{course_name}')
-            exit()
-        student_object = Student(firstname, lastname, date_of_birth, classroom,
-                                 courses, class_reg, course_reg, student_reg,
-                                 status)
-        # Execute Student instance's get_grade method
-        student_object.get_grade(course_object, grade)
+@profiled
+def give_grades_bulk_func(class_reg, course_reg, student_reg, file_name):
+    """A function handling 'give_grades_bulk' option from the argument parser
+    in main(). Allows to assign many grades read from a file, following the
+    same rules as 'give_grade'. All grades are applied in memory and each
+    register is written once at the end. Entries which cannot be applied are
+    reported and skipped."""
+    fieldnames = ['First name', 'Last name', 'Course name', 'Grade']
+    entries = read_bulk_file(file_name, fieldnames)
+    with RegisterTransaction(class_reg, course_reg, student_reg):
+        given = 0
+        skipped = 0
+        for line_number, (firstname, lastname, course_name, grade) in entries:
+            if grade not in ['2', '3', '4', '5']:
+                message = f'Invalid grade {grade}, available grades: ' \
+                          f'2, 3, 4, 5'
+            else:
+                student_object, course_object, message = \
+                    prepare_grade(class_reg, course_reg, student_reg,
+                                  firstname, lastname, course_name)
+            if message:
+                print(f'Line {line_number}: {message}')
+                skipped += 1
+                continue
+            student_object.get_grade(course_object, grade)
+            given += 1
+    print(f'{given} grades given, {skipped} entries skipped')
+
+
+@profiled
+def validate_bulk_func(class_reg, course_reg, student_reg, kind, file_name,
+                       accepted_file, workers):
+    """A function handling 'validate_bulk' option from the argument parser in
+    main(). Allows to check all entries of a roster, course or grade file
+    against a snapshot of the registers (see BulkValidator) without changing
+    the registers. The rejected entries are reported with their line
+    numbers, and the accepted ones can be written into a file to be applied
+    with a bulk operation. With workers, groups of students are checked in a
+    pool of worker processes."""
+    fieldnames = BulkValidator.fieldnames[kind]
+    entries = read_bulk_file(file_name, fieldnames)
+    validator = BulkValidator.create(kind, entries, class_reg, course_reg,
+                                     student_reg)
+    groups = {}
+    for entry in entries:
+        groups.setdefault(BulkValidator.get_fullname(entry[1]),
+                          []).append(entry)
+    if workers is None or len(groups) < 2:
+        results = validator.check(entries)
     else:
-        print(f'{student_name} does not attend {course_name}')
+        from concurrent.futures import ProcessPoolExecutor
+
+        workers = workers or os.cpu_count() or 1
+        # A few chunks of students for each worker even out the chunks of
+        # students with more entries
+        chunks = [[] for _ in range(min(len(groups), workers * 4))]
+        for position, fullname in enumerate(groups):
+            chunks[position % len(chunks)].append(fullname)
+        with ProcessPoolExecutor(min(workers, len(chunks))) as executor:
+            results = list(itertools.chain.from_iterable(executor.map(
+                BulkValidator.check,
+                [validator.select(chunk) for chunk in chunks],
+                [[entry for fullname in chunk for entry in groups[fullname]]
+                 for chunk in chunks])))
+        results.sort(key=lambda result: result[0])
+    messages = dict(results)
+    rejected = 0
+    for line_number, message in results:
+        if message is not None:
+            print(f'Line {line_number}: {message}')
+            rejected += 1
+    if accepted_file is not None:
+        accepted = [values for line_number, values in entries
+                    if messages[line_number] is None]
+        with open_file(accepted_file, 'w', newline='', encoding='utf-8') \
+                as file:
+            if accepted_file.endswith('.jsonl'):
+                for values in accepted:
+                    file.write(json.dumps(dict(zip(fieldnames, values)),
+                                          ensure_ascii=False) + '\n')
+            else:
+                writer = csv.writer(file, delimiter=';')
+                writer.writerow(fieldnames)
+                writer.writerows(accepted)
+    print(f'{len(entries) - rejected} entries accepted, {rejected} entries '
+          f'rejected')
+
+
+@profiled
+def course_grades_func(course_reg, student_reg, course_name, status,
+                       failing):
+    """A function handling 'course_grades' option from the argument parser
+    in main(). Allows to print the number of grades, the average and the
+    final grade of every student enrolled in a course, or only of the
+    students currently failing it."""
+    if course_reg.find_row_index(course_name) is None:
+        print(f'Course {course_name} does not exist')
         exit()
+    aggregates = student_reg.get_course_aggregates(course_name, status)
+    for student, aggregate in aggregates.items():
+        if failing and (not aggregate.count or aggregate.passed):
+            continue
+        if not aggregate.count:
+            print(f'{student}: no grades')
+            continue
+        result = 'passing' if aggregate.passed else 'failing'
+        print(f'{student}: {aggregate.count} grade(s), average '
+              f'{aggregate.total / aggregate.count:.2f}, final grade '
+              f'{aggregate.final_grade} ({result})')
 
 
-def main():
-    """The main function based on the argument parser."""
+def build_report(course_reg, student_reg):
+    """Load the grades of all students into NumPy arrays once and compute
+    the report in vectorized form: grade distributions, pass and fail rates
+    per course, average grades per classroom and students at risk. Final
+    grades follow Student.calc_final_grade (the rounded mean) and a course
+    is completed when it has the number of grades set in the Course
+    Register. Return a dictionary of NumPy arrays and of the names they
+    refer to."""
+    import array
+    import numpy as np
+
+    courses = {}
+    grades_numbers = []
+    for row in course_reg.iter_rows():
+        course_name = row.get('Course name')
+        if course_name not in courses:
+            courses[course_name] = len(courses)
+            grades_numbers.append(0)
+        grades_numbers[courses[course_name]] = int(row.get('Grades to pass'))
+
+    # Flatten the students' courses into enrollments and their grades
+    classrooms = {}
+    students = []
+    student_classroom = array.array('i')
+    student_active = array.array('b')
+    enrollment_student = array.array('i')
+    enrollment_course = array.array('i')
+    grade_enrollment = array.array('i')
+    grade_values = array.array('b')
+    for row in student_reg.iter_rows():
+        student = len(students)
+        students.append(f"{row.get('First name')} {row.get('Last name')}")
+        classroom = classrooms.setdefault(row.get('Classroom'),
+                                          len(classrooms))
+        student_classroom.append(classroom)
+        student_active.append(row.get('Status') == 'Active')
+        for course_item in row.get('Courses') or []:
+            for course_name, grades in course_item.items():
+                if course_name not in courses:
+                    # A course missing in the Course Register is never
+                    # completed
+                    courses[course_name] = len(courses)
+                    grades_numbers.append(0)
+                enrollment = len(enrollment_student)
+                enrollment_student.append(student)
+                enrollment_course.append(courses[course_name])
+                grade_values.extend(int(grade) for grade in grades)
+                grade_enrollment.extend([enrollment] * len(grades))
+
+    courses_number = len(courses)
+    enrollments_number = len(enrollment_student)
+    grades = np.frombuffer(grade_values, dtype=np.int8).astype(np.int64)
+    grade_enrollment = np.frombuffer(grade_enrollment, dtype=np.int32)
+    enrollment_student = np.frombuffer(enrollment_student, dtype=np.int32)
+    enrollment_course = np.frombuffer(enrollment_course, dtype=np.int32)
+    student_classroom = np.frombuffer(student_classroom, dtype=np.int32)
+    student_active = np.frombuffer(student_active, dtype=np.int8) \
+        .astype(bool)
+    grades_numbers = np.array(grades_numbers, dtype=np.int64)
+
+    # Sum, number and final grade of each enrollment's grades
+    enrollment_sum = np.bincount(grade_enrollment, weights=grades,
+                                 minlength=enrollments_number)
+    enrollment_count = np.bincount(grade_enrollment,
+                                   minlength=enrollments_number)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        enrollment_mean = enrollment_sum / enrollment_count
+    enrollment_final = np.round(enrollment_mean)
+    enrollment_required = grades_numbers[enrollment_course]
+    completed = (enrollment_required > 0) & \
+        (enrollment_count >= enrollment_required)
+    passed = completed & (enrollment_final >= 3)
+    at_risk = (enrollment_count > 0) & \
+        (enrollment_count < enrollment_required) & \
+        (enrollment_final < 3) & student_active[enrollment_student]
+
+    # Distribution of the grades 2-5 of each course
+    grade_course = enrollment_course[grade_enrollment]
+    distribution = np.bincount(grade_course * 6 + np.clip(grades, 0, 5),
+                               minlength=courses_number * 6) \
+        .reshape(courses_number, 6)[:, 2:]
+
+    grade_classroom = student_classroom[enrollment_student[grade_enrollment]]
+    classroom_sum = np.bincount(grade_classroom, weights=grades,
+                                minlength=len(classrooms))
+    classroom_count = np.bincount(grade_classroom, minlength=len(classrooms))
+
+    at_risk = np.flatnonzero(at_risk)
+    return {
+            'courses': list(courses),
+            'distribution': distribution,
+            'enrolled': np.bincount(enrollment_course,
+                                    minlength=courses_number),
+            'completed': np.bincount(enrollment_course[completed],
+                                     minlength=courses_number),
+            'passed': np.bincount(enrollment_course[passed],
+                                  minlength=courses_number),
+            'classrooms': list(classrooms),
+            'classroom_sum': classroom_sum,
+            'classroom_count': classroom_count,
+            'at_risk': [(students[enrollment_student[enrollment]],
+                         list(courses)[enrollment_course[enrollment]],
+                         enrollment_mean[enrollment],
+                         enrollment_count[enrollment],
+                         enrollment_required[enrollment])
+                        for enrollment in at_risk]
+            }
+
+
+@profiled
+def report_func(course_reg, student_reg):
+    """A function handling 'report' option from the argument parser in
+    main(). Allows to print grade distributions and pass rates of the
+    courses, average grades of the classrooms and active students at risk
+    of failing a course: their mean grade is below 3 and they still have
+    grades to receive."""
+    import importlib.util
+    # NumPy itself is only imported by build_report
+    if importlib.util.find_spec('numpy') is None:
+        print('The report command requires NumPy, install it with: '
+              'pip install numpy')
+        exit()
+    report = build_report(course_reg, student_reg)
+
+    print('Courses')
+    print(f'{"Course":<20} {"2":>6} {"3":>6} {"4":>6} {"5":>6} '
+          f'{"Enrolled":>9} {"Completed":>9} {"Passed":>7} {"Failed":>7}')
+    for course_index, course_name in enumerate(report['courses']):
+        completed = report['completed'][course_index]
+        passed = report['passed'][course_index]
+        rates = f'{passed / completed:>7.0%} {1 - passed / completed:>7.0%}' \
+            if completed else f'{"-":>7} {"-":>7}'
+        counts = ' '.join(f'{count:>6}' for count in
+                          report['distribution'][course_index])
+        print(f'{course_name:<20} {counts} '
+              f'{report["enrolled"][course_index]:>9} {completed:>9} '
+              f'{rates}')
+
+    print()
+    print('Classrooms')
+    for classroom_index, classroom in enumerate(report['classrooms']):
+        count = report['classroom_count'][classroom_index]
+        average = report['classroom_sum'][classroom_index] / count \
+            if count else 0
+        print(f'{classroom:<20} average {average:.2f} from {count} grade(s)')
+
+    print()
+    print(f'Students at risk: {len(report["at_risk"])}')
+    for student, course_name, mean, count, required in report['at_risk']:
+        print(f'{student} - {course_name}: average {mean:.2f} from '
+              f'{count} of {required} grades')
+
+
+@profiled
+def compact_func(class_reg, course_reg, student_reg):
+    """A function handling 'compact' option from the argument parser in
+    main(). Folds the change logs of the registers into fresh .csv files."""
+    for register in [class_reg, course_reg, student_reg]:
+        storage = CsvStorage(register, snapshot=register.snapshot,
+                             inplace=register.backend == 'inplace')
+        with register.get_lock(storage):
+            records = storage.compact()
+        register.cache.invalidate(register)
+        print(f'{register}: {records} change log records folded into '
+              f'{register.file}')
 
-    class_reg = ClassroomRegister()
-    student_reg = StudentRegister()
-    course_reg = CourseRegister()
+
+@profiled
+def migrate_func(class_reg, course_reg, student_reg):
+    """A function handling 'migrate' option from the argument parser in
+    main(). Rewrites the .csv files of the registers, including the ones
+    written in the legacy format, in the current encoding."""
+    for register in [class_reg, course_reg, student_reg]:
+        storage = CsvStorage(register, snapshot=register.snapshot,
+                             inplace=register.backend == 'inplace')
+        with register.get_lock(storage):
+            rows = storage.load_rows()
+            storage.write_rows(rows)
+        register.cache.invalidate(register)
+        print(f'{register}: {len(rows)} entries migrated in {register.file}')
+
+
+@profiled
+def snapshot_func(class_reg, course_reg, student_reg):
+    """A function handling 'snapshot' option from the argument parser in
+    main(). Compiles the .csv files of the registers into binary snapshots,
+    in which entries are looked up with the --snapshot option."""
+    for register in [class_reg, course_reg, student_reg]:
+        if register.storage.indexed:
+            print(f'{register}: kept in the database, no snapshot needed')
+            continue
+        with register.get_lock():
+            rows_number = register.storage.save_snapshot()
+        print(f'{register}: {rows_number} entries compiled into '
+              f'{register.storage.snapshot.file}')
+
+
+@profiled
+def import_csv_func(class_reg, course_reg, student_reg):
+    """A function handling 'import_csv' option from the argument parser in
+    main(). Imports the .csv files of the registers into the SQLite database
+    used by the sqlite backend, replacing its previous content."""
+    for register in [class_reg, course_reg, student_reg]:
+        rows = CsvStorage(register).load_rows()
+        SqliteStorage(register).write_rows(rows)
+        print(f'{register}: {len(rows)} entries imported from '
+              f'{register.file}')
+
+
+class RegisterRequestHandler:
+    """
+    A class handling a single request sent to the register server. The
+    request is a JSON line with the command line arguments ('argv') of a
+    command; the response is a JSON line with the command's output ('output')
+    and exit status ('status'). The request {"ping": true} is answered with
+    an empty output, so that clients can check that the server is running.
+    Malformed requests are answered with status 1. The handler is combined
+    with socketserver.StreamRequestHandler by serve_func.
+
+    Methods:
+    -------------
+    handle
+    read_request
+    """
+
+    def read_request(self):
+        """Read the request line and return the command line arguments of
+        the command, or a response if there is no command to run."""
+        line = self.rfile.readline()
+        if not line.strip():
+            return {'output': 'Invalid request: empty line\n', 'status': 1}
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return {'output': f'Invalid request: {error}\n', 'status': 1}
+        if not isinstance(request, dict):
+            return {'output': 'Invalid request: not a JSON object\n',
+                    'status': 1}
+        if request.get('ping'):
+            return {'output': '', 'status': 0}
+        argv = request.get('argv')
+        if not isinstance(argv, list) or not all(isinstance(argument, str)
+                                                 for argument in argv):
+            return {'output': 'Invalid request: "argv" must be a list of '
+                              'strings\n', 'status': 1}
+        return argv
+
+    def handle(self):
+        """Run a forwarded command in the server process and send back its
+        output."""
+        argv = self.read_request()
+        if isinstance(argv, dict):
+            self.wfile.write(json.dumps(argv).encode('utf-8') + b'\n')
+            return
+        output = io.StringIO()
+        status = 0
+        with contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(output):
+            try:
+                args = create_parser().parse_args(argv)
+                if args.command == 'serve':
+                    print('The register server is already running')
+                else:
+                    run_command(args)
+            except SystemExit as error:
+                status = error.code if isinstance(error.code, int) else 0
+            except Exception as error:
+                print(f'{error.__class__.__name__}: {error}')
+                status = 1
+        response = {'output': output.getvalue(), 'status': status}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def serve_func(socket_file):
+    """A function handling 'serve' option from the argument parser in main().
+    Keeps the registers loaded in memory and runs commands forwarded by the
+    command line client over a local Unix socket, one at a time."""
+    import signal
+    import socketserver
+
+    class StreamRequestHandler(RegisterRequestHandler,
+                               socketserver.StreamRequestHandler):
+        pass
+
+    if forward_to_server(socket_file, None) is not None:
+        print(f'The register server is already running on {socket_file}')
+        return
+    if os.path.exists(socket_file):
+        # Remove a socket left behind by a server which has stopped
+        os.remove(socket_file)
+    # Stop the server in the same way on Ctrl+C and on termination
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with socketserver.UnixStreamServer(socket_file,
+                                       StreamRequestHandler) as server:
+        print(f'Serving the registers on {socket_file}, press Ctrl+C to '
+              f'stop')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_file)
+
+
+def forward_to_server(socket_file, argv):
+    """Forward a command (its command line arguments, argv) to the register
+    server listening on a Unix socket. Return the response of the server or
+    None if no server is running. If argv is None, only check if the server
+    is running with a ping request."""
+    if not os.path.exists(socket_file):
+        return None
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_file)
+            request = json.dumps({'ping': True} if argv is None
+                                 else {'argv': argv}).encode('utf-8')
+            client.sendall(request + b'\n')
+            with client.makefile('rb') as response:
+                return json.loads(response.readline())
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+
+
+def create_parser():
+    """Create the argument parser of the program."""
 
     parser = argparse.ArgumentParser()
+    parser.add_argument('--local', action='store_true',
+                        help='Run the command in this process even if the '
+                             'register server is running')
+    parser.add_argument('--backend',
+                        choices=['csv', 'journal', 'inplace', 'sqlite'],
+                        default='csv',
+                        help='Storage of the registers: csv rewrites the .csv '
+                             'files on every change, journal appends changes '
+                             'to a change log next to each .csv file, '
+                             'inplace writes changed entries over their '
+                             'slots in the .csv files, which are written '
+                             'with slack space, sqlite keeps the registers in '
+                             'class_register.db')
+    parser.add_argument('--batch', action='store_true',
+                        help='Read commands from the standard input, one per '
+                             'line, and run all of them in this process')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Look up entries of the csv, journal and '
+                             'inplace backends in binary snapshots of the '
+                             '.csv files and compile the snapshots again on '
+                             'every rewrite of the .csv files')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='Load large .csv files of the registers in N '
+                             'worker processes, which parse ranges of their '
+                             'lines and decode the lists of the entries, '
+                             'and check the entries of validate_bulk in N '
+                             'worker processes; 0 starts a process for every '
+                             'core')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print file opens, rows parsed, bytes written '
+                             'and the wall time of register reads and '
+                             'writes and of the command handler to the '
+                             'standard error after the command')
+    parser.add_argument('--profile-dump', metavar='FILE',
+                        help='Also profile the command with cProfile and '
+                             'write the statistics into a file readable with '
+                             'pstats, implies --profile')
     subparser = parser.add_subparsers(dest='command')
 
     print_register = subparser.add_parser('print_register',
@@ -1117,6 +4689,29 @@ def main():
                                 help='Print a specified register: Classroom '
                                      'Register, Student Register, Course '
                                      'Register')
+    print_register.add_argument('--columns',
+                                help='Comma-separated columns to print, for '
+                                     'example "First name,Last name"')
+    print_register.add_argument('--status',
+                                help='Print students of a status only')
+    print_register.add_argument('--classroom',
+                                help='Print entries of a classroom only: '
+                                     'yyyy-yyyy')
+    print_register.add_argument('--course',
+                                help='Print entries of a course only')
+    print_register.add_argument('--student',
+                                help='Print classrooms or courses of a '
+                                     'student only: "{first name} {last '
+                                     'name}"')
+    print_register.add_argument('--limit', type=int,
+                                help='The maximum number of entries to print')
+    print_register.add_argument('--offset', type=int, default=0,
+                                help='The number of matching entries to skip')
+    print_register.add_argument('--format', dest='output_format',
+                                choices=['raw', 'table', 'csv', 'jsonl'],
+                                default='raw',
+                                help='Output format: raw (default), table, '
+                                     'csv or jsonl')
 
     new_classroom = subparser.add_parser('new_classroom',
                                          help='Register a new classroom')
@@ -1161,15 +4756,180 @@ def main():
     give_grade.add_argument('grade', choices=['2', '3', '4', '5'],
                             help='Available grades: 2, 3, 4, 5')
 
-    args = parser.parse_args()
+    new_students_bulk = subparser.add_parser('new_students_bulk',
+                                             help='Register new students '
+                                                  'from a roster file')
+    new_students_bulk.add_argument('file',
+                                   help="A .csv file (delimited with ';') or "
+                                        "a .jsonl file with the columns: "
+                                        "First name, Last name, Date of "
+                                        "birth, Classroom, Course name")
+
+    give_grades_bulk = subparser.add_parser('give_grades_bulk',
+                                            help='Give grades to registered '
+                                                 'students from a file')
+    give_grades_bulk.add_argument('file',
+                                  help="A .csv file (delimited with ';') or "
+                                       "a .jsonl file with the columns: "
+                                       "First name, Last name, Course name, "
+                                       "Grade")
+
+    validate_bulk = subparser.add_parser('validate_bulk',
+                                         help='Check the entries of a bulk '
+                                              'file against the registers '
+                                              'without changing them')
+    validate_bulk.add_argument('kind', choices=['roster', 'courses', 'grades'],
+                               help='The kind of the entries: new students '
+                                    '(as in new_students_bulk), students '
+                                    'appended to courses or grades (as in '
+                                    'give_grades_bulk)')
+    validate_bulk.add_argument('file',
+                               help="A .csv file (delimited with ';') or a "
+                                    ".jsonl file with the columns of the "
+                                    "kind; students appended to courses have "
+                                    "the columns: First name, Last name, "
+                                    "Course name")
+    validate_bulk.add_argument('--accepted', metavar='FILE',
+                               help='Write the accepted entries into a .csv '
+                                    'or .jsonl file')
+
+    course_grades = subparser.add_parser('course_grades',
+                                         help='Print the grades summary of '
+                                              'the students of a course')
+    course_grades.add_argument('course_name',
+                               help='The name of a registered course')
+    course_grades.add_argument('--status',
+                               choices=['Active', 'Inactive', 'Graduate'],
+                               help='Print students of a status only')
+    course_grades.add_argument('--failing', action='store_true',
+                               help='Print only the students whose final '
+                                    'grade so far is below 3')
+
+    subparser.add_parser('report',
+                         help='Print grade statistics of the courses and '
+                              'classrooms and the students at risk (requires '
+                              'NumPy)')
+
+    subparser.add_parser('compact',
+                         help='Fold the change logs of the journal backend '
+                              'into fresh .csv files')
+
+    subparser.add_parser('migrate',
+                         help='Rewrite the .csv files of the registers in the '
+                              'current encoding')
+
+    subparser.add_parser('snapshot',
+                         help='Compile the .csv files of the registers into '
+                              'binary snapshots used with --snapshot')
+
+    subparser.add_parser('import_csv',
+                         help='Import the .csv files of the registers into '
+                              'the database of the sqlite backend')
+
+    subparser.add_parser('serve',
+                         help='Keep the registers loaded in memory and run '
+                              'the commands of other invocations of the '
+                              'program')
+
+    return parser
+
+
+def run_command(args):
+    """Run a command parsed by the argument parser. Only the registers used
+    by the command are created, the other ones are passed as None. With
+    --profile the command is profiled (see RegisterProfile) and its profile
+    is printed to the standard error."""
+
+    if args.command == 'print_register':
+        used = [args.register]
+    elif args.command == 'new_classroom':
+        used = ['classrooms']
+    elif args.command == 'new_course':
+        used = ['courses']
+    elif args.command in ['course_grades', 'report']:
+        used = ['courses', 'students']
+    else:
+        used = ['classrooms', 'courses', 'students']
+    snapshot = args.snapshot or args.command == 'snapshot'
+    profile = args.profile or args.profile_dump
+    if profile:
+        register_profile.start(args.profile_dump)
+    class_reg = ClassroomRegister(args.backend, snapshot, args.workers) \
+        if 'classrooms' in used else None
+    course_reg = CourseRegister(args.backend, snapshot, args.workers) \
+        if 'courses' in used else None
+    student_reg = StudentRegister(args.backend, snapshot, args.workers) \
+        if 'students' in used else None
+    try:
+        dispatch_command(args, class_reg, course_reg, student_reg)
+    finally:
+        # Drop changes of a batch interrupted by an error
+        for register in [class_reg, course_reg, student_reg]:
+            if register is not None and register.batch:
+                register.discard_batch()
+        if profile:
+            register_profile.stop(args.profile_dump)
+            print(register_profile.report(args.command), file=sys.stderr)
+
+
+def run_batch(parser, args, lines):
+    """Run commands read from lines of text (the standard input in --batch
+    mode) one by one in this process, so the program starts once and each
+    register is parsed once for all of them. Empty lines and lines starting
+    with '#' are skipped. The global options given together with --batch
+    apply to every command. Return the exit status: 1 if any command
+    failed, otherwise 0."""
+    import shlex
+    options = ['--local', '--backend', args.backend]
+    if args.snapshot:
+        options.append('--snapshot')
+    if args.workers is not None:
+        options += ['--workers', str(args.workers)]
+    if args.profile:
+        options.append('--profile')
+    if args.profile_dump:
+        options += ['--profile-dump', args.profile_dump]
+    status = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            command_args = parser.parse_args(options + shlex.split(line))
+            if command_args.batch or \
+                    command_args.command in [None, 'serve']:
+                print(f'Line {line_number}: {line} cannot be run in batch '
+                      f'mode')
+                status = 1
+                continue
+            run_command(command_args)
+        except SystemExit as error:
+            # Commands rejected by their checks exit without a status
+            if isinstance(error.code, int) and error.code:
+                status = 1
+        except Exception as error:
+            print(f'Line {line_number}: {error.__class__.__name__}: {error}')
+            status = 1
+    return status
+
+
+@profiled
+def dispatch_command(args, class_reg, course_reg, student_reg):
+    """Call the function handling a command parsed by the argument parser."""
 
     if args.command == 'print_register':
-        if args.register == 'classrooms':
-            class_reg.print_register()
-        elif args.register == 'students':
-            student_reg.print_register()
-        elif args.register == 'courses':
-            course_reg.print_register()
+        registers = {
+                     'classrooms': class_reg,
+                     'students': student_reg,
+                     'courses': course_reg
+                     }
+        if args.register in registers:
+            filters = {name: getattr(args, name) for name in
+                       ['status', 'classroom', 'course', 'student']
+                       if getattr(args, name) is not None}
+            print_register_func(registers[args.register], args.columns,
+                                filters, args.limit, args.offset,
+                                args.output_format)
         else:
             print('Invalid register, please choose from "classrooms", '
                   '"students", "courses"')
@@ -1178,20 +4938,85 @@ def main():
         new_classroom_func(class_reg, args.start_year, args.end_year)
 
     elif args.command == 'new_student':
-        new_student_func(class_reg, course_reg, student_reg, args.firstname,
-                         args.lastname, args.birthdate, args.classroom,
-                         args.course)
+        with RegisterTransaction(class_reg, course_reg, student_reg):
+            new_student_func(class_reg, course_reg, student_reg,
+                             args.firstname, args.lastname, args.birthdate,
+                             args.classroom, args.course)
 
     elif args.command == 'new_course':
         new_course_func(course_reg, args.course_name, args.grades_number)
 
     elif args.command == 'append_to_course':
-        append_to_course_func(class_reg, course_reg, student_reg,
-                              args.firstname, args.lastname, args.course_name)
+        with RegisterTransaction(class_reg, course_reg, student_reg):
+            append_to_course_func(class_reg, course_reg, student_reg,
+                                  args.firstname, args.lastname,
+                                  args.course_name)
 
     elif args.command == 'give_grade':
-        give_grade_func(class_reg, course_reg, student_reg, args.firstname,
-                        args.lastname, args.course_name, args.grade)
+        # Graduating or dropping out a student changes all three registers,
+        # which are written together when the transaction is committed
+        with RegisterTransaction(class_reg, course_reg, student_reg):
+            give_grade_func(class_reg, course_reg, student_reg,
+                            args.firstname, args.lastname, args.course_name,
+                            args.grade)
+
+    elif args.command == 'new_students_bulk':
+        new_students_bulk_func(class_reg, course_reg, student_reg, args.file)
+
+    elif args.command == 'give_grades_bulk':
+        give_grades_bulk_func(class_reg, course_reg, student_reg, args.file)
+
+    elif args.command == 'validate_bulk':
+        validate_bulk_func(class_reg, course_reg, student_reg, args.kind,
+                           args.file, args.accepted, args.workers)
+
+    elif args.command == 'course_grades':
+        course_grades_func(course_reg, student_reg, args.course_name,
+                           args.status, args.failing)
+
+    elif args.command == 'report':
+        report_func(course_reg, student_reg)
+
+    elif args.command == 'compact':
+        compact_func(class_reg, course_reg, student_reg)
+
+    elif args.command == 'migrate':
+        migrate_func(class_reg, course_reg, student_reg)
+
+    elif args.command == 'snapshot':
+        snapshot_func(class_reg, course_reg, student_reg)
+
+    elif args.command == 'import_csv':
+        import_csv_func(class_reg, course_reg, student_reg)
+
+
+def main():
+    """The main function based on the argument parser."""
+
+    socket_file = 'class_register.sock'
+    parser = create_parser()
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve_func(socket_file)
+        return
+    if args.batch:
+        if args.command is not None:
+            parser.error('--batch reads the commands from the standard '
+                         'input, one per line')
+        # Commands stop with exit(), which closes sys.stdin, so the commands
+        # are read from a copy of it
+        with open(os.dup(sys.stdin.fileno()), 'r',
+                  encoding=sys.stdin.encoding) as lines:
+            status = run_batch(parser, args, lines)
+        sys.exit(status)
+    # Forward the command to the register server if it is running. Profiled
+    # commands are always run in this process.
+    if not args.local and not (args.profile or args.profile_dump):
+        response = forward_to_server(socket_file, sys.argv[1:])
+        if response is not None:
+            print(response.get('output'), end='')
+            sys.exit(response.get('status'))
+    run_command(args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,291 @@
+#!/usr/bin/python3
+
+"""
+An asyncio gateway running the commands of many grading terminals
+concurrently on the registers kept in memory.
+
+The gateway listens on a localhost TCP port. Each request is a JSON line with
+the command line arguments of a command, for example:
+
+    {"argv": ["give_grade", "John", "Paine", "Mathematics", "4"]}
+
+and each response is a JSON line with the command's output, exit status,
+the number of requests of the same command waiting at arrival (queue_depth)
+and the time the request spent in the gateway in milliseconds (latency_ms).
+The request {"stats": true} returns the queue depth and the latency of every
+command handled so far. A request which is not valid JSON or has no list of
+arguments gets a response with status 1 and the reason as its output.
+
+Commands changing the registers ('give_grade', 'append_to_course',
+'new_student') lock all three registers for the whole command, so they run
+one at a time. They wait for the gateway's write lock in the event loop, in
+the order of their arrival, instead of occupying worker threads blocked on
+the register locks. Reading commands ('print_register') do not wait for the
+write lock: they only read committed entries, so they run concurrently with
+each other and with the command being written.
+
+Locks per student or per register would not let any of these commands
+overlap: every one of them changes the student's entry, and the student
+register is a single file (or database table) rewritten under its register
+lock, so writes for different students wait for each other at that lock
+anyway. The single write lock keeps them waiting in the event loop instead.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from class_register import create_parser, run_command
+
+
+class ThreadOutput:
+    """
+    A class representing an output stream which redirects the output of each
+    thread to its own buffer while the thread captures its output.
+
+    Attributes:
+    -------------
+    stream : io.TextIOBase
+        The stream used by threads not capturing their output
+    local : threading.local
+        The buffers of the threads capturing their output
+
+    Methods:
+    -------------
+    write(text)
+    flush
+    capture
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        """Write a text to the buffer of the current thread or to the
+        stream."""
+        buffer = getattr(self.local, 'buffer', None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        """Flush the stream."""
+        self.stream.flush()
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Capture the output of the current thread into a buffer."""
+        self.local.buffer = io.StringIO()
+        try:
+            yield self.local.buffer
+        finally:
+            self.local.buffer = None
+
+
+class CommandStats:
+    """
+    A class representing the statistics of a single command handled by the
+    gateway.
+
+    Attributes:
+    -------------
+    count : int
+        The number of handled requests
+    waiting : int
+        The number of requests waiting for a lock
+    running : int
+        The number of requests being run
+    latencies : deque
+        The latencies of the most recent requests in milliseconds
+
+    Methods:
+    -------------
+    record(latency)
+    summary
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.waiting = 0
+        self.running = 0
+        self.latencies = deque(maxlen=10000)
+
+    def record(self, latency):
+        """Record the latency of a handled request."""
+        self.count += 1
+        self.latencies.append(latency)
+
+    def summary(self):
+        """Summarize the statistics as a dictionary."""
+        latencies = sorted(self.latencies)
+        summary = {
+                   'count': self.count,
+                   'queue_depth': self.waiting,
+                   'running': self.running
+                   }
+        if latencies:
+            summary['latency_ms'] = {
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'p50': round(latencies[len(latencies) // 2], 3),
+                'p99': round(latencies[int(len(latencies) * 0.99)], 3),
+                'max': round(latencies[-1], 3)
+                }
+        return summary
+
+
+class GradingGateway:
+    """
+    A class representing the gateway running the commands of grading
+    terminals.
+
+    Attributes:
+    -------------
+    executor : ThreadPoolExecutor
+        The worker threads running the commands
+    output : ThreadOutput
+        The output stream capturing the output of each worker thread
+    write_lock : asyncio.Lock
+        The lock serializing the commands changing the registers
+    stats : dict
+        The statistics of each command
+
+    Methods:
+    -------------
+    run(args)
+    handle_command(argv)
+    handle_request(line)
+    handle_connection(reader, writer)
+    serve(host, port)
+    """
+
+    write_commands = ['give_grade', 'append_to_course', 'new_student']
+    read_commands = ['print_register']
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.output = ThreadOutput(sys.stdout)
+        self.write_lock = asyncio.Lock()
+        self.stats = {}
+
+    def run(self, args):
+        """Run a command in a worker thread and return its output and exit
+        status."""
+        status = 0
+        with self.output.capture() as buffer:
+            try:
+                run_command(args)
+            except SystemExit as error:
+                status = error.code if isinstance(error.code, int) else 0
+            except Exception as error:
+                print(f'{error.__class__.__name__}: {error}')
+                status = 1
+        return buffer.getvalue(), status
+
+    async def handle_command(self, argv):
+        """Handle a single command and return the response."""
+        start = time.perf_counter()
+        with self.output.capture() as buffer:
+            try:
+                args = create_parser().parse_args(argv)
+            except SystemExit as error:
+                return {'output': buffer.getvalue(), 'status': error.code}
+        if args.command not in self.write_commands + self.read_commands:
+            return {'output': f'{args.command} is not handled by the '
+                              f'gateway\n', 'status': 1}
+        stats = self.stats.setdefault(args.command, CommandStats())
+        queue_depth = stats.waiting
+        loop = asyncio.get_running_loop()
+        if args.command in self.write_commands:
+            stats.waiting += 1
+            async with self.write_lock:
+                stats.waiting -= 1
+                stats.running += 1
+                try:
+                    output, status = \
+                        await loop.run_in_executor(self.executor, self.run,
+                                                   args)
+                finally:
+                    stats.running -= 1
+        else:
+            stats.running += 1
+            try:
+                output, status = await loop.run_in_executor(self.executor,
+                                                            self.run, args)
+            finally:
+                stats.running -= 1
+        latency = (time.perf_counter() - start) * 1000
+        stats.record(latency)
+        return {
+                'output': output,
+                'status': status,
+                'queue_depth': queue_depth,
+                'latency_ms': round(latency, 3)
+                }
+
+    async def handle_request(self, line):
+        """Handle a single request line and return the response. Malformed
+        requests are rejected with status 1."""
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return {'output': f'Invalid request: {error}\n', 'status': 1}
+        if not isinstance(request, dict):
+            return {'output': 'Invalid request: not a JSON object\n',
+                    'status': 1}
+        if request.get('stats'):
+            return {command: stats.summary() for command, stats
+                    in self.stats.items()}
+        argv = request.get('argv')
+        if not isinstance(argv, list) or not all(isinstance(argument, str)
+                                                 for argument in argv):
+            return {'output': 'Invalid request: "argv" must be a list of '
+                              'strings\n', 'status': 1}
+        return await self.handle_command(argv)
+
+    async def handle_connection(self, reader, writer):
+        """Handle the requests sent over a single connection."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """Serve the gateway until it is stopped."""
+        server = await asyncio.start_server(self.handle_connection, host,
+                                            port)
+        print(f'Grading gateway listening on {host}:{port}')
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    """The main function based on the argument parser."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765,
+                        help='The localhost port of the gateway')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='The number of worker threads running commands')
+    args = parser.parse_args()
+
+    gateway = GradingGateway(args.workers)
+    sys.stdout = sys.stderr = gateway.output
+    try:
+        asyncio.run(gateway.serve('127.0.0.1', args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Fixtures shared by the tests of the class register: every test runs in a
+directory of its own holding copies of the sample registers."""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from class_register import Register, create_parser, run_command  # noqa: E402
+
+REGISTER_FILES = ['classrooms.csv', 'courses.csv', 'students.csv']
+
+
+@pytest.fixture
+def registers_dir(tmp_path, monkeypatch):
+    """Copy the sample registers into a temporary directory and make it the
+    current directory. The register cache is emptied before and after the
+    test."""
+    for name in REGISTER_FILES:
+        shutil.copy(os.path.join(ROOT, name), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    Register.cache.invalidate()
+    yield tmp_path
+    Register.cache.invalidate()
+
+
+@pytest.fixture
+def run():
+    """Run a command of the program in this process and return its output.
+    Commands stopped by their checks return the output printed so far."""
+
+    def run_argv(*argv):
+        args = create_parser().parse_args(['--local', *argv])
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            try:
+                run_command(args)
+            except SystemExit:
+                pass
+        return output.getvalue()
+
+    return run_argv
@@ -0,0 +1,53 @@
+"""The grade aggregates kept in the register cache follow the grades given
+to students without being built again from their courses."""
+
+import pytest
+
+from class_register import (ClassroomRegister, CourseRegister, Register,
+                            RegisterTransaction, StudentRegister,
+                            give_grade_func)
+
+
+def summarize(aggregates):
+    """The totals and the counts of aggregates keyed by students' names."""
+    return {student: (aggregate.total, aggregate.count)
+            for student, aggregate in aggregates.items()}
+
+
+@pytest.mark.parametrize('backend', ['csv', 'journal', 'inplace'])
+def test_grades_are_added_to_cached_aggregates(registers_dir, run,
+                                               monkeypatch, backend):
+    register = StudentRegister(backend)
+    before = summarize(register.get_course_aggregates('Mathematics'))
+    assert before['Kate Calina'] == (4, 1)
+
+    def build_aggregates(self, row):
+        raise AssertionError('aggregates built again')
+
+    with monkeypatch.context() as context:
+        context.setattr(StudentRegister, 'build_aggregates',
+                        build_aggregates)
+        run('--backend', backend, 'give_grade', 'Kate', 'Calina',
+            'Mathematics', '3')
+        run('--backend', backend, 'give_grade', 'Kate', 'Calina',
+            'Computer science', '5')
+        updated = summarize(register.get_course_aggregates('Mathematics'))
+    assert updated['Kate Calina'] == (7, 2)
+    Register.cache.invalidate()
+    assert summarize(register.get_course_aggregates('Mathematics')) == \
+        updated
+    assert summarize(register.get_course_aggregates('Computer science'))[
+        'Kate Calina'] == (5, 1)
+
+
+def test_rolled_back_grades_leave_cached_aggregates(registers_dir):
+    registers = (ClassroomRegister(), CourseRegister(), StudentRegister())
+    before = summarize(registers[2].get_course_aggregates('Mathematics'))
+    with pytest.raises(RuntimeError):
+        with RegisterTransaction(*registers):
+            give_grade_func(*registers, 'Kate', 'Calina', 'Mathematics', '3')
+            aggregates = registers[2].get_course_aggregates('Mathematics')
+            assert summarize(aggregates)['Kate Calina'] == (7, 2)
+            raise RuntimeError('rolled back')
+    aggregates = StudentRegister().get_course_aggregates('Mathematics')
+    assert summarize(aggregates) == before
@@ -0,0 +1,125 @@
+"""The same commands run on every backend give the same output and leave the
+same entries in the registers."""
+
+import pytest
+
+from class_register import (ClassroomRegister, CourseRegister, Register,
+                            StudentRegister)
+
+BACKENDS = ['csv', 'journal', 'inplace', 'sqlite']
+
+COMMANDS = [
+    ['new_classroom', '2025', '2028'],
+    ['new_classroom', '2025', '2028'],
+    ['new_course', 'Chemistry', '2'],
+    ['new_student', 'Ann', 'Lee', '2001-01-01', '2025-2028', 'Chemistry'],
+    ['new_student', 'Ann', 'Lee', '2001-01-01', '2025-2028', 'Chemistry'],
+    ['append_to_course', 'Ann', 'Lee', 'Physics'],
+    ['append_to_course', 'Ann', 'Lee', 'Spanish'],
+    ['give_grade', 'Ann', 'Lee', 'Chemistry', '4'],
+    ['give_grade', 'Ann', 'Lee', 'Chemistry', '5'],
+    ['give_grade', 'Ann', 'Lee', 'Chemistry', '5'],
+    ['give_grade', 'Ann', 'Lee', 'Spanish', '3'],
+    ['give_grade', 'Kate', 'Calina', 'Mathematics', '2'],
+    ['give_grade', 'Kate', 'Calina', 'Mathematics', '2'],
+    ['give_grade', 'Kate', 'Calina', 'Mathematics', '2'],
+    ['give_grade', 'Kate', 'Calina', 'Mathematics', '2'],
+    ['give_grade', 'John', 'Paine', 'Mathematics', '5'],
+    ['give_grade', 'Nobody', 'Here', 'Physics', '5'],
+    ]
+
+
+def read_registers(run, backend):
+    """Print all registers with a cold register cache, so that the entries
+    are read back from the backend."""
+    Register.cache.invalidate()
+    return {name: run('--backend', backend, 'print_register', name,
+                      '--format', 'jsonl')
+            for name in ['classrooms', 'courses', 'students']}
+
+
+def run_commands(run, backend, snapshot=False):
+    """Run the commands on a backend and return their output and the
+    registers read back afterwards. The sqlite backend starts from the
+    imported .csv files. With snapshot, the .csv files are compiled into
+    snapshots first and the commands look up entries in them."""
+    if backend == 'sqlite':
+        run('import_csv')
+    options = ['--backend', backend]
+    if snapshot:
+        run(*options, 'snapshot')
+        options.append('--snapshot')
+    outputs = [run(*options, *command) for command in COMMANDS]
+    return outputs, read_registers(run, backend)
+
+
+@pytest.fixture
+def expected(registers_dir, run, tmp_path_factory, monkeypatch):
+    """The output and the registers of the commands run on the csv
+    backend, in a directory of their own."""
+    directory = tmp_path_factory.mktemp('expected')
+    for path in registers_dir.iterdir():
+        (directory / path.name).write_bytes(path.read_bytes())
+    with monkeypatch.context() as context:
+        context.chdir(directory)
+        Register.cache.invalidate()
+        result = run_commands(run, 'csv')
+    Register.cache.invalidate()
+    return result
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_round_trip(expected, run, backend):
+    outputs, registers = run_commands(run, backend)
+    assert outputs == expected[0]
+    assert registers == expected[1]
+    assert '"Ann"' in registers['students']
+
+
+@pytest.mark.parametrize('backend', ['csv', 'journal', 'inplace'])
+def test_snapshot_round_trip(expected, registers_dir, run, backend):
+    outputs, registers = run_commands(run, backend, snapshot=True)
+    assert outputs == expected[0]
+    assert registers == expected[1]
+    # The snapshots are kept up to date by the commands, so the entries
+    # were looked up in them
+    for register_type in [ClassroomRegister, CourseRegister,
+                          StudentRegister]:
+        storage = register_type(backend, snapshot=True).storage
+        assert storage.open_snapshot() is not None
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_unchanged_registers_read_back(registers_dir, run, backend):
+    if backend == 'sqlite':
+        run('import_csv')
+    assert read_registers(run, backend) == read_registers(run, 'csv')
+
+
+def test_compact_folds_change_logs(expected, registers_dir, run):
+    run_commands(run, 'journal')
+    assert list(registers_dir.glob('*.csv.log'))
+    run('compact')
+    assert not any(path.stat().st_size for path
+                   in registers_dir.glob('*.csv.log'))
+    assert read_registers(run, 'csv') == expected[1]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_bulk_grades_match_single_grades(expected, registers_dir, run,
+                                         backend):
+    """Students passing or failing a course in a bulk are moved between the
+    course's lists once the batch is written, as if graded one by one."""
+    if backend == 'sqlite':
+        run('import_csv')
+    grades = [command[1:] for command in COMMANDS
+              if command[0] == 'give_grade']
+    for command in COMMANDS:
+        if command[0] != 'give_grade':
+            run('--backend', backend, *command)
+    (registers_dir / 'grades.csv').write_text(
+        'First name;Last name;Course name;Grade\n' +
+        ''.join(';'.join(grade) + '\n' for grade in grades))
+    output = run('--backend', backend, 'give_grades_bulk', 'grades.csv')
+    assert '8 grades given, 2 entries skipped' in output
+    assert read_registers(run, backend) == expected[1]
@@ -0,0 +1,70 @@
+"""validate_bulk accepts and rejects the entries of a bulk file exactly as
+the bulk command would, without changing the registers."""
+
+import pytest
+
+from class_register import Register
+
+BACKENDS = ['csv', 'journal', 'inplace', 'sqlite']
+
+BULK_FILES = {
+    'grades': ('give_grades_bulk', [
+        'First name;Last name;Course name;Grade',
+        'Kate;Calina;Mathematics;4',
+        'Kate;Calina;Mathematics;7',
+        'John;Paine;Mathematics;5',
+        'Kate;Calina;Physics;3',
+        'Nobody;Here;Physics;5',
+        'Kate;Calina;Mathematics;2',
+        'Kate;Calina;Mathematics;2',
+        'Kate;Calina;Mathematics;2',
+        'Kate;Calina;Mathematics;2',
+        'Kate;Calina;Mathematics;3',
+        ]),
+    'roster': ('new_students_bulk', [
+        'First name;Last name;Date of birth;Classroom;Course name',
+        'Ann;Lee;2001-01-01;2023-2026;Physics',
+        'Ann;Lee;2001-01-01;2023-2026;Physics',
+        'Kate;Calina;2002-09-03;2023-2026;Physics',
+        'Tom;Green;2001-13-01;2023-2026;Physics',
+        'Tom;Brown;2001-02-01;1999-2002;Physics',
+        'Tom;White;2001-02-01;2023-2026;Astronomy',
+        'Eve;Black;2001-02-01;2024-2027;Spanish',
+        ]),
+    }
+
+
+def read_registers(run, backend):
+    """Print all registers with a cold register cache."""
+    Register.cache.invalidate()
+    return [run('--backend', backend, 'print_register', name, '--format',
+                'jsonl')
+            for name in ['classrooms', 'courses', 'students']]
+
+
+def reported_lines(output):
+    """Get the messages about the rejected entries of a bulk file."""
+    return [line for line in output.splitlines() if line.startswith('Line ')]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('kind', sorted(BULK_FILES))
+def test_validate_bulk_matches_bulk_command(registers_dir, run, backend,
+                                            kind):
+    command, lines = BULK_FILES[kind]
+    (registers_dir / 'bulk.csv').write_text('\n'.join(lines) + '\n')
+    if backend == 'sqlite':
+        run('import_csv')
+    before = read_registers(run, backend)
+    validated = run('--backend', backend, 'validate_bulk', kind, 'bulk.csv',
+                    '--accepted', 'accepted.csv')
+    assert read_registers(run, backend) == before
+    applied = run('--backend', backend, command, 'bulk.csv')
+    assert reported_lines(validated) == reported_lines(applied)
+    assert reported_lines(applied)
+    accepted = (registers_dir / 'accepted.csv').read_text().splitlines()
+    rejected = {int(line.split(':')[0].split()[1])
+                for line in reported_lines(applied)}
+    assert accepted == [lines[0]] + [line for number, line
+                                     in enumerate(lines[1:], start=2)
+                                     if number not in rejected]
@@ -0,0 +1,58 @@
+"""Registers written in the legacy format (Python literals) are read as they
+are and rewritten with their list columns encoded as JSON."""
+
+import csv
+import json
+
+import pytest
+
+from class_register import (ClassroomRegister, CourseRegister, Register,
+                            StudentRegister, is_legacy_list)
+
+REGISTER_TYPES = [ClassroomRegister, CourseRegister, StudentRegister]
+
+
+def read_list_cells(register):
+    """Read the list columns of a register's .csv file as they are
+    written."""
+    with open(register.file, newline='', encoding='utf-8') as file:
+        return [row[field] for row in csv.DictReader(file, delimiter=';')
+                for field in register.list_fields]
+
+
+def read_registers(run):
+    """Print all registers with a cold register cache and parse the
+    entries."""
+    Register.cache.invalidate()
+    return [[json.loads(line) for line
+             in run('print_register', name, '--format', 'jsonl').splitlines()]
+            for name in ['classrooms', 'courses', 'students']]
+
+
+@pytest.mark.parametrize('register_type', REGISTER_TYPES)
+def test_sample_registers_are_legacy(registers_dir, register_type):
+    assert any(map(is_legacy_list, read_list_cells(register_type())))
+
+
+def test_migrate_rewrites_legacy_rows_as_json(registers_dir, run):
+    before = read_registers(run)
+    run('migrate')
+    for register_type in REGISTER_TYPES:
+        for cell in read_list_cells(register_type()):
+            assert not is_legacy_list(cell)
+            assert isinstance(json.loads(cell), list)
+    assert read_registers(run) == before
+
+
+def test_rewritten_register_is_migrated(registers_dir, run):
+    before = read_registers(run)[2]
+    run('give_grade', 'Kate', 'Calina', 'Mathematics', '4')
+    assert not any(map(is_legacy_list, read_list_cells(StudentRegister())))
+    after = read_registers(run)[2]
+    changed = [(old, new) for old, new in zip(before, after) if old != new]
+    assert len(after) == len(before)
+    assert len(changed) == 1
+    old, new = changed[0]
+    assert new['First name'] == 'Kate'
+    assert new['Courses'] == [{'Mathematics': old['Courses'][0]
+                               ['Mathematics'] + ['4']}] + old['Courses'][1:]
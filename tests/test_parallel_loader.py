@@ -0,0 +1,72 @@
+"""The .csv files loaded in a pool of worker processes give the same rows
+as the files loaded in this process."""
+
+import pytest
+
+from class_register import (ClassroomRegister, CourseRegister, CsvStorage,
+                            Register, StudentRegister)
+
+REGISTER_TYPES = [ClassroomRegister, CourseRegister, StudentRegister]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Split even the small sample registers into many ranges of lines."""
+    monkeypatch.setattr(CsvStorage, 'chunk_size', 64)
+
+
+@pytest.fixture(params=['csv', 'journal'])
+def changed_registers(request, registers_dir, run):
+    """The sample registers changed by a few commands, so that they hold
+    rows in the legacy format and in JSON, and change logs with the journal
+    backend."""
+    backend = request.param
+    run('--backend', backend, 'new_student', 'Ann', 'Lee', '2001-01-01',
+        '2023-2026', 'Physics')
+    run('--backend', backend, 'give_grade', 'Ann', 'Lee', 'Physics', '4')
+    run('--backend', backend, 'give_grade', 'Kate', 'Calina', 'Mathematics',
+        '5')
+    Register.cache.invalidate()
+    return backend
+
+
+@pytest.mark.parametrize('register_type', REGISTER_TYPES)
+def test_parallel_loader_matches_serial(changed_registers, small_chunks,
+                                        register_type):
+    serial = register_type(changed_registers).storage.load_rows()
+    storage = register_type(changed_registers, workers=2).storage
+    parallel = storage.load_rows_parallel()
+    assert parallel is not None
+    assert [dict(row) for row in parallel] == [dict(row) for row in serial]
+    assert [row.line for row in parallel] == [row.line for row in serial]
+
+
+def test_small_file_is_loaded_in_this_process(registers_dir):
+    assert StudentRegister(workers=2).storage.load_rows_parallel() is None
+
+
+@pytest.mark.parametrize('register_type', REGISTER_TYPES)
+def test_register_cache_loaded_with_workers(changed_registers, small_chunks,
+                                            register_type):
+    serial = register_type(changed_registers).read_rows_in_register()
+    Register.cache.invalidate()
+    parallel = register_type(changed_registers,
+                             workers=2).read_rows_in_register()
+    assert [dict(row) for row in parallel] == [dict(row) for row in serial]
+
+
+def test_malformed_legacy_row_matches_serial(registers_dir, small_chunks):
+    """A legacy list which cannot be decoded is kept encoded by the workers
+    and fails when it is accessed, as in rows read by a single process."""
+    with open('students.csv', 'a', newline='', encoding='utf-8') as file:
+        file.write("Bad;Row;2001-01-01;2023-2026;[{'Mathematics'}];Active\n")
+    serial = StudentRegister().storage.load_rows()
+    parallel = StudentRegister(workers=2).storage.load_rows_parallel()
+    assert parallel is not None
+    assert [row.line for row in parallel] == [row.line for row in serial]
+    assert [dict(row) for row in parallel[:-1]] == \
+        [dict(row) for row in serial[:-1]]
+    for rows in [serial, parallel]:
+        assert rows[-1]['First name'] == 'Bad'
+        with pytest.raises(IndexError):
+            rows[-1]['Courses']
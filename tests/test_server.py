@@ -0,0 +1,38 @@
+"""The register server answers every request line, also malformed ones and
+the ping of a client checking that the server is running."""
+
+import io
+import json
+
+import pytest
+
+from class_register import RegisterRequestHandler
+
+
+def handle(line):
+    """Handle a request line and return the response."""
+    handler = RegisterRequestHandler()
+    handler.rfile = io.BytesIO(line)
+    handler.wfile = io.BytesIO()
+    handler.handle()
+    return json.loads(handler.wfile.getvalue())
+
+
+def test_ping():
+    assert handle(b'{"ping": true}\n') == {'output': '', 'status': 0}
+
+
+@pytest.mark.parametrize('line', [b'', b'\n', b'not json\n', b'[1]\n',
+                                  b'{}\n', b'{"argv": "give_grade"}\n',
+                                  b'{"argv": ["print_register", 1]}\n'])
+def test_malformed_request(line):
+    response = handle(line)
+    assert response['status'] == 1
+    assert response['output'].startswith('Invalid request')
+
+
+def test_command(registers_dir):
+    response = handle(b'{"argv": ["print_register", "classrooms", '
+                      b'"--format", "jsonl"]}\n')
+    assert response['status'] == 0
+    assert '"2022-2025"' in response['output']
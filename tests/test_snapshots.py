@@ -0,0 +1,75 @@
+"""Entries looked up in the binary snapshots of the .csv files are the
+entries of the .csv files."""
+
+import pytest
+
+from class_register import (ClassroomRegister, CourseRegister, Register,
+                            StudentRegister)
+
+REGISTER_TYPES = [ClassroomRegister, CourseRegister, StudentRegister]
+
+
+def snapshot_rows(backend):
+    """Read all entries of the student register from its snapshot, or
+    return None if the snapshot is out of date."""
+    storage = StudentRegister(backend, snapshot=True).storage
+    snapshot = storage.open_snapshot()
+    if snapshot is None:
+        return None
+    return [dict(snapshot.load_row(row_index))
+            for row_index in range(len(snapshot))]
+
+
+def test_snapshot_follows_writes_in_place(registers_dir, run):
+    options = ['--backend', 'inplace', '--snapshot']
+    # The first write gives the .csv file slack space, the next ones are
+    # written in place
+    for grade in ['4', '5', '3']:
+        run(*options, 'give_grade', 'Kate', 'Calina', 'Mathematics', grade)
+    assert (registers_dir / 'students.csv.idx').exists()
+    rows = [dict(row) for row in StudentRegister('inplace').storage
+            .load_rows()]
+    assert snapshot_rows('inplace') == rows
+    assert {'Mathematics': ['4', '4', '5', '3']} in next(
+        row['Courses'] for row in rows if row['First name'] == 'Kate')
+
+
+@pytest.mark.parametrize('register_type', REGISTER_TYPES)
+@pytest.mark.parametrize('backend', ['csv', 'journal', 'inplace'])
+def test_lookups_match_loaded_rows(registers_dir, run, backend,
+                                   register_type):
+    run('--backend', backend, 'snapshot')
+    options = ['--backend', backend, '--snapshot']
+    run(*options, 'new_student', 'Ann', 'Lee', '2001-01-01', '2023-2026',
+        'Physics')
+    run(*options, 'give_grade', 'Kate', 'Calina', 'Mathematics', '5')
+    if backend == 'journal':
+        # The changes are replayed from the change logs over the snapshots
+        assert (registers_dir / 'students.csv.log').stat().st_size
+    register = register_type(backend)
+    rows = register.storage.load_rows()
+    index = register.build_index(rows)
+    storage = register_type(backend, snapshot=True).storage
+    snapshot = storage.open_snapshot()
+    assert snapshot is not None
+    for row_index, row in enumerate(rows):
+        key = register.get_row_key(row)
+        assert storage.find_row_index(key, snapshot) == index[key]
+        assert dict(storage.load_row(row_index, snapshot)) == dict(row)
+    missing = register.get_row_key({field: 'Nobody'
+                                    for field in register.key_fields})
+    assert storage.find_row_index(missing, snapshot) is None
+
+
+def test_stale_snapshot_is_not_used(registers_dir, run):
+    run('snapshot')
+    # A command run without --snapshot changes the .csv file and leaves
+    # the snapshot compiled from the old one
+    run('give_grade', 'Kate', 'Calina', 'Mathematics', '5')
+    assert (registers_dir / 'students.csv.snap').exists()
+    Register.cache.invalidate()
+    register = StudentRegister(snapshot=True)
+    assert register.storage.open_snapshot() is None
+    assert register.get_snapshot() is None
+    row = register.find_row(('Kate', 'Calina'))
+    assert {'Mathematics': ['4', '5']} in row['Courses']
@@ -0,0 +1,129 @@
+"""A transaction changing several registers leaves all of them unchanged
+when it is rolled back or cannot be committed, and registers outside the
+transaction never read its uncommitted changes."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from class_register import (ClassroomRegister, CourseRegister, Register,
+                            RegisterTransaction, StudentRegister,
+                            give_grade_func, new_student_func)
+
+BACKENDS = ['csv', 'journal', 'inplace', 'sqlite']
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, registers_dir, run):
+    """The backend of the registers, the sqlite one imports the sample
+    registers."""
+    if request.param == 'sqlite':
+        run('import_csv')
+    return request.param
+
+
+def create_registers(backend):
+    """Create the three registers on a backend."""
+    return (ClassroomRegister(backend), CourseRegister(backend),
+            StudentRegister(backend))
+
+
+def read_state(run, backend, directory):
+    """Read the entries of all registers with a cold register cache and the
+    content of their files."""
+    Register.cache.invalidate()
+    entries = [run('--backend', backend, 'print_register', name, '--format',
+                   'jsonl')
+               for name in ['classrooms', 'courses', 'students']]
+    files = {path.name: path.read_bytes()
+             for path in sorted(directory.glob('*.csv*'))
+             if not path.name.endswith('.lock')}
+    return entries, files
+
+
+def make_changes(registers):
+    """Change all three registers: register a new student and grade two
+    students."""
+    new_student_func(*registers, 'Ann', 'Lee', '2001-01-01', '2023-2026',
+                     'Physics')
+    give_grade_func(*registers, 'Ann', 'Lee', 'Physics', '4')
+    give_grade_func(*registers, 'Kate', 'Calina', 'Mathematics', '5')
+
+
+def test_commit(backend, registers_dir, run):
+    before = read_state(run, backend, registers_dir)
+    with RegisterTransaction(*create_registers(backend)) as transaction:
+        make_changes(transaction.registers)
+    entries = read_state(run, backend, registers_dir)[0]
+    assert entries != before[0]
+    assert '"Ann"' in entries[2]
+    assert 'Ann Lee' in entries[0] and 'Ann Lee' in entries[1]
+
+
+def test_rollback(backend, registers_dir, run):
+    before = read_state(run, backend, registers_dir)
+    registers = create_registers(backend)
+    transaction = RegisterTransaction(*registers)
+    transaction.begin()
+    make_changes(registers)
+    transaction.rollback()
+    assert not any(register.batch for register in registers)
+    assert not transaction.locks
+    assert read_state(run, backend, registers_dir) == before
+
+
+def test_exception_rolls_back(backend, registers_dir, run):
+    before = read_state(run, backend, registers_dir)
+    with pytest.raises(RuntimeError):
+        with RegisterTransaction(*create_registers(backend)) as transaction:
+            make_changes(transaction.registers)
+            raise RuntimeError('interrupted')
+    assert read_state(run, backend, registers_dir) == before
+
+
+@pytest.mark.parametrize('stage', ['prepare_changes', 'apply_changes'])
+def test_failed_commit_leaves_registers_unchanged(backend, registers_dir,
+                                                  run, monkeypatch, stage):
+    if backend == 'sqlite':
+        pytest.skip('a database transaction is committed at once')
+    before = read_state(run, backend, registers_dir)
+    registers = create_registers(backend)
+    transaction = RegisterTransaction(*registers)
+    transaction.begin()
+    make_changes(registers)
+    # The student register is prepared and written last, after the other
+    # registers prepared or wrote their changes
+
+    def fail(*args):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(registers[2].storage, stage, fail)
+    with pytest.raises(OSError):
+        transaction.commit()
+    monkeypatch.undo()
+    assert not transaction.locks
+    assert read_state(run, backend, registers_dir) == before
+
+
+def read_in_thread(backend):
+    """Read the entries of the student register in another thread, like a
+    command run by another worker thread of the grading gateway."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(
+            lambda: list(StudentRegister(backend).iter_rows())).result()
+
+
+def test_uncommitted_changes_are_not_read(backend, registers_dir, run):
+    before = read_in_thread(backend)
+    registers = create_registers(backend)
+    transaction = RegisterTransaction(*registers)
+    transaction.begin()
+    make_changes(registers)
+    assert list(registers[2].iter_rows()) != before
+    assert read_in_thread(backend) == before
+    transaction.rollback()
+    assert read_in_thread(backend) == before
+    with RegisterTransaction(*registers):
+        make_changes(registers)
+    assert read_in_thread(backend) == list(registers[2].iter_rows())
+    assert read_in_thread(backend) != before